@@ -59,6 +59,19 @@ class ChatClient(Screen):
         # current content
         self.content = []
         
+        # only the last messages are received when entering the chat
+        # older messages are requested (FETCH_BEFORE) when the user scrolls to the top
+        # history_cursor is given by the server to request the previous messages, 0 if there is no older message
+        self.history_cursor = 0
+        self.is_fetching = False
+        self.item_add_last = 0
+        
+        # date label displayed above the oldest message, removed when older messages are added
+        self.top_date_label = None
+        
+        self.ids["msg_view"].unbind(scroll_y=self.on_scroll)
+        self.ids["msg_view"].bind(scroll_y=self.on_scroll)
+        
         self.network_interface = NetworkInterface(client = self)
         self.network_interface.send(self.chat_address, "ENTER", "")
     
@@ -76,8 +89,20 @@ class ChatClient(Screen):
             return
         
         if message.command == "INIT_CONTENT":
-            self.content = message.content
-            self.item_add_last = len(self.content)
+            # chat messages received before the last messages (APPEND) are kept after them
+            self.history_cursor, last_messages = message.content
+            self.content = last_messages + self.content
+            self.item_add_last = len(last_messages)
+            self.init_displayed_content()
+        elif message.command == "FETCH_BEFORE":
+            # older messages, added at the top
+            self.history_cursor, previous_content = message.content
+            self.is_fetching = False
+            if self.top_date_label is not None and len(previous_content) > 0:
+                self.ids["msg_view"].remove(self.top_date_label)
+                self.top_date_label = None
+            self.content = previous_content + self.content
+            self.item_add_last = len(previous_content)
             self.init_displayed_content()
         elif message.command == "APPEND":
             item = message.content
@@ -128,7 +153,7 @@ class ChatClient(Screen):
             # after all message have been added, insert the first date manually 
             if self.item_add_last == 0:
                 if self.top_date is not None:
-                    self.insert_date_label(date = self.top_date[5:10], insert_pos = 'top')
+                    self.top_date_label = self.insert_date_label(date = self.top_date[5:10], insert_pos = 'top')
                 break
         
         # schedule initialization of the next batch of messages
@@ -139,6 +164,14 @@ class ChatClient(Screen):
         day_label.set_text(date, text_color="000000")
         day_label.bcolor = [0.8,1,0.8,1]
         self.ids["msg_view"].add(day_label, insert_pos, halign = 'center')
+        return day_label
+    
+    # called by Kivy when the messages are scrolled
+    # request the previous messages when the top is reached and all received messages are displayed
+    def on_scroll(self, instance, scroll_y):
+        if scroll_y >= 1.0 and self.history_cursor > 0 and not self.is_fetching and self.item_add_last == 0:
+            self.is_fetching = True
+            self.network_interface.send(self.chat_address, "FETCH_BEFORE", self.history_cursor)
     
     def print_message(self, msg, text_color_str, msg_time=None, username=None, isTyping = False, insert_pos='bottom'):
         self.remove_typing_message()
@@ -1,5 +1,6 @@
 from twisted.internet import task
 from network_message import NetworkMessage
+from message_passing_protocol import MessagePassingProtocol
 from file_manager import FileManager
 
 from date_utils import DateUtil
@@ -7,17 +8,27 @@ from date_utils import DateUtil
 class ChatServer():
     '''
         Chat server implementation
+        The chat history is saved as a record log, with one record per chat message
     '''
     
+    # maximum number of messages kept in the saved history (older messages are removed by the compaction of the log,
+    # so the log grows to at most FileManager.COMPACTION_FACTOR times this length), None to keep the whole history
+    MAX_HISTORY_LENGTH = 10000
+    
+    # number of messages sent to a new client, and number of older messages sent for each FETCH_BEFORE request
+    # INIT_CONTENT and FETCH_BEFORE messages contain [cursor, messages], the cursor is sent back by the client
+    # with FETCH_BEFORE to get the messages before the ones it already has (cursor 0: no older message)
+    INIT_CONTENT_LENGTH = 50
+    FETCH_PAGE_LENGTH = 50
+    
     def __init__(self, network_path):
         # list of connected clients
         self.clients = []
         
-        # initialize the content with the saved file (if existing) corresponding to the network address
-        if FileManager.file_exists(network_path):
-            self.content = FileManager.file_read(network_path)
-        else:
-            self.content = []
+        # history saved by previous versions as one list, converted to a record log
+        # the history is not kept in memory, pages of messages are read from the record log when needed
+        if not FileManager.records_exist(network_path) and FileManager.file_exists(network_path):
+            FileManager.convert_to_records(network_path)
         
         self.network_path = network_path
         
@@ -31,13 +42,16 @@ class ChatServer():
         # send a message to existing clients
         greetings = [DateUtil.utcnow(), new_client.username]
         message = NetworkMessage(self.network_path, "NOTIFICATION_NEW_CLIENT", greetings)
-        for client in self.clients:
-            client.send_message(message)
+        MessagePassingProtocol.broadcast_message(self.clients, message)
         
-        # send the current content to the new client
-        new_client_greetings = self.content
-        message = NetworkMessage(self.network_path, "INIT_CONTENT", new_client_greetings)
-        new_client.send_message(message)
+        # send the last messages to the new client, once they are read from disk
+        # chat messages received before the page is read are sent directly to the new client, and are not in the page
+        def send_last_messages(result):
+            last_messages, cursor = result
+            message = NetworkMessage(self.network_path, "INIT_CONTENT", [cursor, last_messages])
+            new_client.send_message(message)
+        FileManager.read_records_before_async(self.network_path, None, ChatServer.INIT_CONTENT_LENGTH) \
+            .addCallback(send_last_messages)
         
         # send a notification to the new client with the list of currently connected users
         new_client_greetings = [DateUtil.utcnow()]
@@ -57,23 +71,31 @@ class ChatServer():
             self.add_client(sender_client)
             return
         
+        if message.command == "FETCH_BEFORE":
+            # a client asked the messages before the ones it already has
+            cursor = message.content
+            if type(cursor) is not int or cursor <= 0:
+                return
+            def send_messages(result):
+                messages, cursor = result
+                message.content = [cursor, messages]
+                sender_client.send_message(message)
+            FileManager.read_records_before_async(self.network_path, cursor, ChatServer.FETCH_PAGE_LENGTH) \
+                .addCallback(send_messages)
+            return
+        
         if message.command == "IS_TYPING":
             message.content = sender_client.username
-            for client in self.clients:
-                client.send_message(message)
+            MessagePassingProtocol.broadcast_message(self.clients, message)
             return
         
         # forward the time, username and message to all connected clients
         message.content = [DateUtil.utcnow(), sender_client.username, message.content]
         
-        for client in self.clients:
-            client.send_message(message)
+        MessagePassingProtocol.broadcast_message(self.clients, message)
         
-        # add the new message to the chat history
-        self.content.append(message.content)
-        
-        # save the content to disk
-        FileManager.file_write(self.network_path, self.content)
+        # save the new message to the history on disk
+        FileManager.append_record(self.network_path, message.content, ChatServer.MAX_HISTORY_LENGTH)
     
     # called when a client connection is lost
     def connection_lost(self, lost_client):
@@ -96,5 +118,4 @@ class ChatServer():
         notification_to_send = [DateUtil.utcnow(), lost_client.username]
         message = NetworkMessage(self.network_path, "NOTIFICATION_CLIENT_LEFT", notification_to_send)
         
-        for client in self.clients:
-            client.send_message(message)
+        MessagePassingProtocol.broadcast_message(self.clients, message)
@@ -31,22 +31,28 @@ class LoginServer():
             username, user_public_key, user_private_key = message.content
             creation_time = DateUtil.utcnow()
             
-            FileManager.file_write(message.network_path, [username, creation_time, user_public_key, user_private_key])
-            
-            message.command = "USER_CREATED"
-            message.content = username
-            sender_client.send_message(message)
+            # the answer is sent once the user is saved on disk
+            def user_saved(result):
+                message.command = "USER_CREATED"
+                message.content = username
+                sender_client.send_message(message)
+            user_data = [username, creation_time, user_public_key, user_private_key]
+            FileManager.file_write_async(message.network_path, user_data).addCallback(user_saved)
         
         elif message.command == "READ_USER_LOGIN_DATA":
             # check that the user exists
             if not FileManager.file_exists(message.network_path):
                 message.command = "USER_NOT_EXISTING"
                 message.content = ""
-            else:
-                # read all the information of a user
+                sender_client.send_message(message)
+                return
+            
+            # read all the information of a user
+            def send_login_data(user_data):
                 message.command = "USER_LOGIN_DATA"
-                message.content = FileManager.file_read(message.network_path)
-            sender_client.send_message(message)
+                message.content = user_data
+                sender_client.send_message(message)
+            FileManager.file_read_async(message.network_path).addCallback(send_login_data)
     
     # called when a client connection is lost
     def connection_lost(self, lost_client):
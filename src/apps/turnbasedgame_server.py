@@ -1,5 +1,6 @@
 from twisted.internet import task
 from network_message import NetworkMessage
+from message_passing_protocol import MessagePassingProtocol
 from file_manager import FileManager
 import datetime
 import random
@@ -59,18 +60,17 @@ class TurnBasedGameServer():
                     command = "PLAYER2_MOVE"
                 
                 message = NetworkMessage(self.network_path, command, move)
-                for client in self.clients:
-                    client.send_message(message)
+                MessagePassingProtocol.broadcast_message(self.clients, message)
                 
                 # check if the game is finished
                 winner = self.target_game.winner()
                 if winner != -1:
                     command = "GAME_FINISHED"
                     message = NetworkMessage(self.network_path, command, winner)
+                    MessagePassingProtocol.broadcast_message(self.clients, message)
+                    
+                    # end the connections
                     for client in self.clients:
-                        client.send_message(message)
-                        
-                        # end the connection
                         client.lose_connection()
                     
                     self.game_ended = True
@@ -94,8 +94,8 @@ class TurnBasedGameServer():
             command = "GAME_FINISHED"
             winner = self.opp_player_id + 1
             message = NetworkMessage(self.network_path, command, winner)
+            MessagePassingProtocol.broadcast_message(self.clients, message)
             for client in self.clients:
-                client.send_message(message)
                 client.lose_connection()
             self.game_ended = True
     
@@ -110,8 +110,7 @@ class TurnBasedGameServer():
         elif len(self.clients) == 2:
             # second player is here, we can start the game
             message = NetworkMessage(self.network_path, "START", "")
-            self.clients[0].send_message(message)
-            new_client.send_message(message)
+            MessagePassingProtocol.broadcast_message(self.clients, message)
             self.game_started = True
 
             self.current_player_id = 0
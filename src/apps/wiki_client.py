@@ -9,7 +9,10 @@ from kivy.lang import Builder
 
 from widgets.custom_labels import ScrollableLabel
 
+from collections import OrderedDict
+
 from date_utils import DateUtil
+from file_manager import FileManager
 
 Builder.load_string('''
 <WikiClient>:
@@ -76,6 +79,18 @@ Builder.load_string('''
 
 class WikiClient(Screen):
     
+    # pages already read are kept on disk as [revision, content] at this address prefix
+    # when a cached page is read again, the server only answers NOT_MODIFIED if the revision did not change
+    PAGE_CACHE_PATH = "/wiki_cache"
+    
+    # at most MAX_CACHED_PAGES pages are cached, the least recently used page is removed when a new page is cached
+    # the addresses of the cached pages are saved at PAGE_CACHE_INDEX_PATH, from the least to the most recently used
+    MAX_CACHED_PAGES = 200
+    PAGE_CACHE_INDEX_PATH = "/wiki_cache_index"
+    
+    # addresses of the cached pages (OrderedDict used as an ordered set), loaded when the cache is first used
+    cached_pages = None
+    
     # kivy string property indicating the target network address
     target_address = StringProperty()
     
@@ -89,31 +104,115 @@ class WikiClient(Screen):
         
         self.current_content = ""
         
+        # content sent with the last WRITE, cached when the write is done
+        self.written_content = ""
+        
+        # changes history currently displayed, and cursor to request the previous changes (0 if there is none)
+        self.is_history_displayed = False
+        self.history_text = ""
+        self.history_cursor = 0
+        
         self.network_interface = NetworkInterface(client = self)
         self.read_address(self.target_address)
         
     def receive_message(self, message):
         if message.command == "READ_RESULT":
-            self.current_content = message.content
-            self.update_text(self.current_content)
+            revision, page_content = message.content
+            self.write_cached_page(message.network_path, revision, page_content)
+            self.display_page(page_content)
+        elif message.command == "NOT_MODIFIED":
+            # the cached page is the current revision
+            cached_page = self.read_cached_page(message.network_path)
+            if cached_page is not None:
+                self.display_page(cached_page[1])
         elif message.command == "READ_LOG_RESULT":
-            result_str = ""
-            for item in message.content[::-1]:
+            # most recent changes first, added after the changes already displayed
+            self.history_cursor, changes = message.content
+            for item in changes:
                 idx, timestamp, username, comment = item
-                result_str += DateUtil.convert_utc_to_local(timestamp) + " " + username + " " + comment + "\n"
+                self.history_text += DateUtil.convert_utc_to_local(timestamp) + " " + username + " " + comment + "\n"
+            result_str = self.history_text
+            if self.history_cursor > 0:
+                result_str += "(press History again for older changes)\n"
+            self.is_history_displayed = True
             self.update_text(result_str)
         elif message.command == "WRITE_DONE":
-            # read the address again after writing
+            # the written content is the new revision, read the address again after writing
+            # (only NOT_MODIFIED is received if nobody else changed the page in between)
+            self.write_cached_page(message.network_path, message.content, self.written_content)
             self.read_address(self.target_address)
+        elif message.command == "WRITE_ERROR":
+            # the page was not written
+            self.update_text("Page not saved: " + str(message.content))
         elif message.command == "NOT_EXISTING":
+            self.delete_cached_page(message.network_path)
+            self.is_history_displayed = False
             self.current_content = ""
             self.update_text(self.target_address + " not existing yet.")
     
     def read_address(self, read_target_address):
-        self.network_interface.send(read_target_address, "READ", "")
+        # send the revision of the cached page if any
+        cached_page = self.read_cached_page(read_target_address)
+        if cached_page is None:
+            self.network_interface.send(read_target_address, "READ", "")
+        else:
+            self.network_interface.send(read_target_address, "READ", cached_page[0])
+    
+    def display_page(self, page_content):
+        self.is_history_displayed = False
+        self.current_content = page_content
+        self.update_text(self.current_content)
+    
+    #============= page cache ===========================
+    # the cache is not used if FileManager could not be initialized
+    def get_cached_pages(self):
+        if WikiClient.cached_pages is None:
+            cache_index = None
+            if FileManager.file_exists(WikiClient.PAGE_CACHE_INDEX_PATH):
+                cache_index = FileManager.file_read(WikiClient.PAGE_CACHE_INDEX_PATH)
+            WikiClient.cached_pages = OrderedDict.fromkeys(cache_index if type(cache_index) is list else [])
+        return WikiClient.cached_pages
+    
+    def read_cached_page(self, page_address):
+        cache_address = WikiClient.PAGE_CACHE_PATH + page_address
+        if FileManager.root_dir is None or not FileManager.file_exists(cache_address):
+            return None
+        
+        # the order of use is saved with the next cache write
+        cached_pages = self.get_cached_pages()
+        cached_pages[page_address] = None
+        cached_pages.move_to_end(page_address)
+        return FileManager.file_read(cache_address)
+    
+    # pages without revision (revision below 0, page without change log) are not cached
+    def write_cached_page(self, page_address, revision, page_content):
+        if FileManager.root_dir is None or type(revision) is not int or revision < 0:
+            return
+        
+        cached_pages = self.get_cached_pages()
+        cached_pages[page_address] = None
+        cached_pages.move_to_end(page_address)
+        while len(cached_pages) > WikiClient.MAX_CACHED_PAGES:
+            removed_address, _ = cached_pages.popitem(last=False)
+            FileManager.file_delete(WikiClient.PAGE_CACHE_PATH + removed_address)
+        
+        FileManager.file_write(WikiClient.PAGE_CACHE_PATH + page_address, [revision, page_content])
+        FileManager.file_write(WikiClient.PAGE_CACHE_INDEX_PATH, list(cached_pages))
+    
+    def delete_cached_page(self, page_address):
+        if FileManager.root_dir is not None:
+            FileManager.file_delete(WikiClient.PAGE_CACHE_PATH + page_address)
+            cached_pages = self.get_cached_pages()
+            if page_address in cached_pages:
+                del cached_pages[page_address]
+                FileManager.file_write(WikiClient.PAGE_CACHE_INDEX_PATH, list(cached_pages))
     
-    def read_address_changelog(self, read_target_address):
-        self.network_interface.send(read_target_address, "READ_LOG", "")
+    def read_address_changelog(self, read_target_address, cursor = None):
+        if cursor is None:
+            # last changes
+            self.network_interface.send(read_target_address, "READ_LOG", "")
+        else:
+            self.network_interface.send(read_target_address, "READ_LOG", [cursor, 50])
     
     def update_text(self, msg):
         self.ids["label"].set_wiki_text(msg, text_color= "000000")
@@ -124,6 +223,7 @@ class WikiClient(Screen):
     
     def save_edit(self):
         page_content = self.ids["textbox"].text
+        self.written_content = page_content
         
         # TODO : real comment from the user in the interface
         change_comment = ""
@@ -136,5 +236,11 @@ class WikiClient(Screen):
         #TODO : confirmation popup
         pass
     
+    # display the last changes, or the previous changes if the history is already displayed
     def show_history(self):
-        self.read_address_changelog(self.target_address)
+        if self.is_history_displayed:
+            if self.history_cursor > 0:
+                self.read_address_changelog(self.target_address, self.history_cursor)
+        else:
+            self.history_text = ""
+            self.read_address_changelog(self.target_address)
@@ -1,36 +1,54 @@
 from twisted.internet import task
 from network_message import NetworkMessage
 from file_manager import FileManager
+from revision_store import RevisionStore
+from search_index import SearchIndex
+from link_index import LinkIndex
 
 from date_utils import DateUtil
+import re
 
 class FileChangeLog():
     '''
         Change Log of a file, with change timestamps and usernames
+        The log is a record log, with one [idx, timestamp, username, comment] record per change
     '''
     
+    # default number of changes sent for each READ_LOG request
+    READ_PAGE_LENGTH = 50
+    
     def __init__(self, filename):
         self.filename = filename
-        self.changelog = []
-        self.read()
+        self.log_path = filename + ".log"
+        
+        # log saved by previous versions as one list, converted to a record log
+        if not FileManager.records_exist(self.log_path) and FileManager.file_exists(self.log_path):
+            FileManager.convert_to_records(self.log_path)
     
+    # add a change at the end of the log, the cost does not depend on the size of the log
     def add_log(self, username, comment):
-        idx = len(self.changelog)
+        idx = FileManager.records_count(self.log_path)
         timestamp = DateUtil.utcnow()
         new_log = [idx, timestamp, username, comment]
-        self.changelog.append(new_log)
+        FileManager.append_record(self.log_path, new_log)
     
-    def read(self):
-        log_path = self.filename + ".log"
-        if FileManager.file_exists(log_path):
-            self.changelog = FileManager.file_read(log_path)
+    # read at most max_changes changes before the cursor (None for the last changes), from the most recent one
+    # return the changes and the cursor to read the previous ones (0 if there is no previous change)
+    def read_changes(self, cursor=None, max_changes=READ_PAGE_LENGTH):
+        changes, cursor = FileManager.read_records_before(self.log_path, cursor, max_changes)
+        changes.reverse()
+        return changes, cursor
     
-    def save(self):
-        log_path = self.filename + ".log"
-        FileManager.file_write(log_path, self.changelog)
+    # same as read_changes, with a Deferred fired with the changes and the cursor
+    def read_changes_async(self, cursor=None, max_changes=READ_PAGE_LENGTH):
+        def reverse_changes(result):
+            changes, cursor = result
+            changes.reverse()
+            return changes, cursor
+        return FileManager.read_records_before_async(self.log_path, cursor, max_changes).addCallback(reverse_changes)
     
     def lastlog_index(self):
-        return len(self.changelog) - 1
+        return FileManager.records_count(self.log_path) - 1
 
 
 class WikiServer():
@@ -38,17 +56,36 @@ class WikiServer():
         Wiki server implementation
     '''
     
+    # indexes of the wiki pages, stored at addresses not reachable by clients (not starting with /wiki/)
+    SEARCH_INDEX_PATH = "/wiki_index/search/"
+    LINK_INDEX_PATH = "/wiki_index/links/"
+    
+    # maximum number of results of a SEARCH request
+    MAX_SEARCH_RESULTS = 100
+    
     def __init__(self, network_path):
         self.network_path = network_path
+        self.search_index = SearchIndex(WikiServer.SEARCH_INDEX_PATH)
+        self.link_index = LinkIndex(WikiServer.LINK_INDEX_PATH, "/wiki/")
         
     # called when a message is received from a client
     def receive_message(self, sender_client, message):
         if message.command == "READ":
-            # return the content of the requested address
+            # content is the revision of the page already known by the client ("" if none)
+            # return the revision and content of the requested address, or only NOT_MODIFIED if the client has
+            # the current revision
             if FileManager.file_exists(message.network_path):
-                page_content = FileManager.file_read(message.network_path)
-                message.command = "READ_RESULT"
-                message.content = page_content
+                revision = FileChangeLog(message.network_path).lastlog_index()
+                if type(message.content) is int and message.content == revision:
+                    message.command = "NOT_MODIFIED"
+                    message.content = revision
+                else:
+                    def send_page(page_content):
+                        message.command = "READ_RESULT"
+                        message.content = [revision, page_content]
+                        sender_client.send_message(message)
+                    FileManager.file_read_async(message.network_path).addCallback(send_page)
+                    return
             else:
                 # specific message when the page does not exist yet
                 message.command = "NOT_EXISTING"
@@ -57,39 +94,108 @@ class WikiServer():
         elif message.command == "WRITE":
             # TODO: handle writing errors
             
+            # content is [page content, change comment], checked before anything is written
+            if type(message.content) is not list or len(message.content) != 2 \
+               or type(message.content[0]) is not str or type(message.content[1]) is not str:
+                message.command = "WRITE_ERROR"
+                message.content = "invalid page content"
+                sender_client.send_message(message)
+                return
             page_content, change_comment = message.content
             
             # add a new entry to the log file 
             filelog = FileChangeLog(message.network_path)
             filelog.add_log(message.username, change_comment)
-            filelog.save()
             
-            # add a new version of the file in the history files
+            # add a new version of the file in the history (saved as differences with the previous version)
+            # history files of older versions (one complete file per version) are converted first
+            # the previous content is read synchronously (usually from the read cache, the page was read before being edited)
+            # so that two writes of the same page cannot both use the same previous content
             new_idx = filelog.lastlog_index()
-            oldfilename = message.network_path + ".old" + str(new_idx)
-            FileManager.file_write(oldfilename, page_content)
+            revisions = RevisionStore(message.network_path)
+            revisions.migrate_old_files()
+            if FileManager.file_exists(message.network_path):
+                previous_content = FileManager.file_read(message.network_path)
+            else:
+                previous_content = None
+            revisions.add_revision(new_idx, page_content, previous_content)
             
             # write the new content at the address
-            FileManager.file_write(message.network_path, page_content)
+            write_done = FileManager.file_write_async(message.network_path, page_content)
+            
+            self.search_index.update_page(message.network_path, page_content)
+            self.link_index.update_page(message.network_path, page_content)
             
-            # send a message indicating that writing is done
-            message = NetworkMessage(message.network_path, "WRITE_DONE", "")
+            # send a message indicating that writing is done, with the new revision of the page
+            def send_write_done(result):
+                sender_client.send_message(NetworkMessage(message.network_path, "WRITE_DONE", new_idx))
+            write_done.addCallback(send_write_done)
+        
+        elif message.command == "SEARCH":
+            # content is [query, max_results], the result is a list of [page address, score] from the best score
+            if type(message.content) is not list or len(message.content) != 2 \
+               or type(message.content[0]) is not str or type(message.content[1]) is not int:
+                return
+            query, max_results = message.content
+            max_results = max(1, min(max_results, WikiServer.MAX_SEARCH_RESULTS))
+            message.command = "SEARCH_RESULT"
+            message.content = self.search_index.search(query, max_results)
+            sender_client.send_message(message)
+        
+        elif message.command == "READ_BACKLINKS":
+            # addresses of the pages linking to the page, from the link index
+            message.command = "READ_BACKLINKS_RESULT"
+            message.content = self.link_index.read_backlinks(message.network_path)
+            sender_client.send_message(message)
+        
+        elif message.command == "LIST_ORPHANS":
+            # addresses of the pages without any link from another page, from the link index
+            message.command = "LIST_ORPHANS_RESULT"
+            message.content = self.link_index.list_orphans()
             sender_client.send_message(message)
         
         elif message.command == "READ_LOG":
+            # content is [cursor, max_changes] to read the changes before a cursor received in a previous READ_LOG_RESULT,
+            # anything else to read the last changes
+            # the result is [cursor, changes], with the most recent changes first (cursor 0: no previous change)
             if FileManager.file_exists(message.network_path):
                 filelog = FileChangeLog(message.network_path)
-                if filelog != []:
+                cursor = None
+                max_changes = FileChangeLog.READ_PAGE_LENGTH
+                if type(message.content) is list and len(message.content) == 2 \
+                   and type(message.content[0]) is int and type(message.content[1]) is int:
+                    cursor = message.content[0]
+                    max_changes = max(1, min(message.content[1], FileChangeLog.READ_PAGE_LENGTH))
+                
+                def send_changes(result):
+                    changes, cursor = result
                     message.command = "READ_LOG_RESULT"
-                    message.content = filelog.changelog
+                    message.content = [cursor, changes]
                     sender_client.send_message(message)
+                
+                if cursor is not None and cursor <= 0:
+                    send_changes(([], 0))
                 else:
-                    # TODO : error case not supposed to happen (log should exist when the page exists)
-                    pass
+                    filelog.read_changes_async(cursor, max_changes).addCallback(send_changes)
             else:
                 # specific message when the page does not exist yet
                 pass
     
+    # addresses of all the wiki pages (without history files and change logs)
+    def list_pages():
+        derived_file_pattern = re.compile(r".*\.(log|old[0-9]+|revisions[0-9]+)$")
+        return [network_path for network_path in FileManager.list_files("/wiki/")
+                if not derived_file_pattern.match(network_path) and FileManager.file_exists(network_path)]
+    
+    # rebuild the indexes of the wiki pages from the pages content
+    def rebuild_indexes():
+        page_paths = WikiServer.list_pages()
+        def read_pages():
+            return ((page_path, FileManager.file_read(page_path)) for page_path in page_paths)
+        
+        SearchIndex(WikiServer.SEARCH_INDEX_PATH).rebuild(read_pages())
+        return LinkIndex(WikiServer.LINK_INDEX_PATH, "/wiki/").rebuild(read_pages())
+    
     # called when a client connection is lost
     def connection_lost(self, lost_client):
         # currently, nothing special to do
@@ -0,0 +1,114 @@
+'''
+    Benchmark of the message latency of the server when the disk is slow, with the synchronous FileManager API
+    (disk accessed in the reactor thread) and with the asynchronous API (disk accessed by a thread pool)
+    Run from the src directory:
+      python -m benchmarks.async_io_benchmark
+
+    Messages arrive at a constant rate: most of them do not access the disk (like IS_TYPING),
+    the others read a user file (like READ_USER_LOGIN_DATA) or write a page (like a wiki WRITE)
+    Disk contention is simulated by a delay added to each disk access, with a few much longer accesses
+    The latency of a message is the time from its arrival to its answer
+'''
+
+import random
+import tempfile
+import time
+
+from twisted.internet import defer
+from twisted.internet import reactor
+
+from file_manager import FileManager
+from latency_stats import LatencyStats
+
+MESSAGES_PER_SECOND = 1000
+DURATION = 3.0
+NB_FILES = 1000
+
+# delay of the disk accesses: usually DISK_DELAY, SLOW_DISK_DELAY for SLOW_DISK_RATIO of the accesses
+DISK_DELAY = 0.0005
+SLOW_DISK_DELAY = 0.05
+SLOW_DISK_RATIO = 0.02
+
+def slow_disk(function):
+    def slow_function(*args):
+        time.sleep(SLOW_DISK_DELAY if random.random() < SLOW_DISK_RATIO else DISK_DELAY)
+        return function(*args)
+    return slow_function
+
+# send the messages, return a Deferred fired with the latencies of all messages and of the messages without disk access
+def run_messages(use_async):
+    all_latencies = LatencyStats()
+    no_disk_latencies = LatencyStats()
+    nb_messages = int(MESSAGES_PER_SECOND * DURATION)
+    answers = []
+    
+    def answered(arrival_time, is_disk_access):
+        latency = time.perf_counter() - arrival_time
+        all_latencies.add(latency)
+        if not is_disk_access:
+            no_disk_latencies.add(latency)
+    
+    def receive_message(arrival_time):
+        kind = random.random()
+        path = "/user/user" + str(random.randrange(NB_FILES))
+        if kind < 0.8:
+            # no disk access
+            answered(arrival_time, False)
+        elif kind < 0.9:
+            if use_async:
+                answers.append(FileManager.file_read_async(path).addCallback(lambda _: answered(arrival_time, True)))
+            else:
+                FileManager.file_read(path)
+                answered(arrival_time, True)
+        else:
+            content = ["page content " + str(arrival_time)] * 100
+            if use_async:
+                answers.append(FileManager.file_write_async(path, content).addCallback(lambda _: answered(arrival_time, True)))
+            else:
+                FileManager.file_write(path, content)
+                answered(arrival_time, True)
+    
+    # messages scheduled at their arrival time, the time of a late message is its planned arrival time
+    start_time = time.perf_counter() + 0.1
+    for i in range(nb_messages):
+        arrival_time = start_time + i / MESSAGES_PER_SECOND
+        reactor.callLater(arrival_time - time.perf_counter(), receive_message, arrival_time)
+    
+    finished = defer.Deferred()
+    def wait_answers():
+        defer.gatherResults(answers).addCallback(lambda _: finished.callback((all_latencies, no_disk_latencies)))
+    reactor.callLater(DURATION + 0.5, wait_answers)
+    return finished
+
+@defer.inlineCallbacks
+def run_benchmark():
+    print("Message latency with a slow disk (%.1f ms per access, %.0f ms for %.0f%% of accesses), %d messages/s"
+          % (DISK_DELAY * 1e3, SLOW_DISK_DELAY * 1e3, SLOW_DISK_RATIO * 100, MESSAGES_PER_SECOND))
+    
+    for mode_name, use_async in [("synchronous", False), ("asynchronous", True)]:
+        if use_async:
+            FileManager.enable_async_io(reactor)
+        
+        # read cache disabled, so that reads access the disk
+        FileManager.READ_CACHE_MAX_BYTES = 0
+        random.seed(0)
+        all_latencies, no_disk_latencies = yield run_messages(use_async)
+        
+        for name, latencies in [("all messages", all_latencies), ("messages without disk access", no_disk_latencies)]:
+            summary = latencies.summary()
+            print("  %-13s %-29s p50: %8.2f ms   p99: %8.2f ms   max: %8.2f ms"
+                  % (mode_name, name, summary["p50"] * 1e3, summary["p99"] * 1e3, summary["max"] * 1e3))
+    
+    reactor.stop()
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.init_save_path(temp_dir + "/")
+        for i in range(NB_FILES):
+            FileManager.file_write("/user/user" + str(i), ["user" + str(i), "2018-05-12 10:00:00", "x" * 500, "y" * 2000])
+        
+        FileManager._raw_file_read_view = slow_disk(FileManager._raw_file_read_view)
+        FileManager._raw_file_write = slow_disk(FileManager._raw_file_write)
+        
+        reactor.callWhenRunning(run_benchmark)
+        reactor.run()
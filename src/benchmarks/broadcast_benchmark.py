@@ -0,0 +1,49 @@
+'''
+    Benchmark of the broadcast of one chat line to all the clients of a room
+    Run from the src directory:
+      python -m benchmarks.broadcast_benchmark
+
+    Compares the legacy loop (one send_message, so one serialization, per client)
+    with MessagePassingProtocol.broadcast_message (one serialization per serialization version)
+'''
+
+import time
+
+from message_passing_protocol import MessagePassingProtocol
+from network_message import NetworkMessage
+from serialization_utils import Serialize
+
+# connection without transport, sent bytes are only counted
+class BenchmarkClient(MessagePassingProtocol):
+    def __init__(self, serial_version):
+        self.serial_version = serial_version
+        self.sent_bytes = 0
+    
+    def send_bytes(self, message_bytes):
+        self.sent_bytes += len(message_bytes)
+
+def legacy_broadcast(clients, message):
+    for client in clients:
+        client.send_message(message)
+
+def run(broadcast, clients, message, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        broadcast(clients, message)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    message = NetworkMessage("/chat/room1", "APPEND",
+                             ["2018-05-12 10:00:00", "user1", "a chat line sent to everybody in the room"])
+    
+    print("Broadcast of one chat line: legacy loop vs. broadcast_message")
+    for room_size in [2, 10, 50, 100, 500, 1000]:
+        # all clients use the current version, except a few older clients
+        clients = [BenchmarkClient(Serialize.SERIAL_VERSION if i % 10 else 0) for i in range(room_size)]
+        number = max(10, 20000 // room_size)
+        
+        legacy_time = run(legacy_broadcast, clients, message, number) / number
+        new_time = run(MessagePassingProtocol.broadcast_message, clients, message, number) / number
+        print("  %5d clients   legacy: %9.2f us   broadcast: %9.2f us   per client: %6.2f us / %6.2f us   speedup: x%.1f"
+              % (room_size, legacy_time * 1e6, new_time * 1e6,
+                 legacy_time / room_size * 1e6, new_time / room_size * 1e6, legacy_time / new_time))
@@ -0,0 +1,53 @@
+'''
+    Benchmark of FileManager.file_exists, answered from the in-memory index of existing files,
+    compared with the previous implementation (sha224 of the path and stat of the file for each call)
+    Run from the src directory:
+      python -m benchmarks.exists_benchmark [number of stored files]
+
+    A request for a missing user or page (USER_NOT_EXISTING, NOT_EXISTING) only calls file_exists
+'''
+
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+from file_manager import FileManager
+
+def legacy_file_exists(network_path):
+    file_hash = hashlib.sha224(network_path.encode('utf-8')).hexdigest()
+    return os.path.isfile(FileManager._sharded_file_name(file_hash))
+
+def call_time(function, network_paths):
+    start = time.perf_counter()
+    for network_path in network_paths:
+        function(network_path)
+    return (time.perf_counter() - start) / len(network_paths)
+
+if __name__ == '__main__':
+    nb_files = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nb_calls = 100000
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.init_save_path(temp_dir + "/")
+        for i in range(nb_files):
+            FileManager.file_write("/login/user" + str(i), ["user" + str(i)])
+        
+        FileManager.init_save_path(temp_dir + "/")
+        start = time.perf_counter()
+        nb_scanned = FileManager.scan_existing_files()
+        print("Scan of %d existing files at startup: %.2f ms" % (nb_scanned, (time.perf_counter() - start) * 1e3))
+        
+        # requests for the most active users
+        existing_paths = ["/login/user" + str(i % min(nb_files, 10000)) for i in range(nb_calls)]
+        missing_paths = ["/login/missing" + str(i % 1000) for i in range(nb_calls)]
+        new_paths = ["/login/new" + str(i) for i in range(nb_calls)]
+        
+        print("file_exists, %d calls:" % nb_calls)
+        for name, network_paths in [("existing file", existing_paths), ("missing file", missing_paths),
+                                    ("path never used before", new_paths)]:
+            legacy_time = call_time(legacy_file_exists, network_paths)
+            new_time = call_time(FileManager.file_exists, network_paths)
+            print("  %-24s legacy: %6.2f us   in-memory index: %6.2f us   speedup: x%.1f"
+                  % (name, legacy_time * 1e6, new_time * 1e6, legacy_time / new_time))
@@ -0,0 +1,78 @@
+'''
+    Benchmark of the receive buffer framing (what MessagePassingProtocol.dataReceived does with received data)
+    Run from the src directory:
+      python -m benchmarks.framing_benchmark
+
+    The legacy framing (copy of each frame, and rebuild of the buffer after each frame) is kept here as a reference
+'''
+
+import time
+
+from frame_buffer import FrameBuffer
+from serialization_utils import Serialize
+
+# legacy framing of MessagePassingProtocol.dataReceived
+class LegacyReceiveBuffer():
+    def __init__(self):
+        self.receive_buffer = bytearray(b'')
+    
+    def data_received(self, data, on_frame):
+        self.receive_buffer += data
+        while True:
+            if len(self.receive_buffer) < FrameBuffer.FRAME_PREFIX_SIZE:
+                return
+            message_length = int.from_bytes(self.receive_buffer[:FrameBuffer.FRAME_PREFIX_SIZE], byteorder='big')
+            if len(self.receive_buffer) < message_length:
+                return
+            next_message_data = self.receive_buffer[:message_length]
+            self.receive_buffer = self.receive_buffer[message_length:]
+            on_frame(next_message_data)
+
+# framing with FrameBuffer, as in MessagePassingProtocol.dataReceived
+class NewReceiveBuffer():
+    def __init__(self):
+        self.receive_buffer = FrameBuffer()
+    
+    def data_received(self, data, on_frame):
+        self.receive_buffer.append(data)
+        while True:
+            next_message_data = self.receive_buffer.next_frame()
+            if next_message_data is None:
+                return
+            with next_message_data:
+                on_frame(next_message_data)
+
+def run(receive_buffer_class, chunks, on_frame):
+    receive_buffer = receive_buffer_class()
+    start = time.perf_counter()
+    for chunk in chunks:
+        receive_buffer.data_received(chunk, on_frame)
+    return time.perf_counter() - start
+
+def compare(name, chunks, nb_frames):
+    print(name)
+    for on_frame_name, on_frame in [("framing only", lambda frame: None),
+                                    ("framing + decoding", Serialize.from_bytes)]:
+        legacy_time = run(LegacyReceiveBuffer, chunks, on_frame)
+        new_time = run(NewReceiveBuffer, chunks, on_frame)
+        print("  %-20s legacy: %9.2f ms   new: %9.2f ms   per message: %7.2f us / %7.2f us   speedup: x%.1f"
+              % (on_frame_name, legacy_time * 1e3, new_time * 1e3,
+                 legacy_time / nb_frames * 1e6, new_time / nb_frames * 1e6, legacy_time / new_time))
+
+def chat_message(i):
+    return Serialize.to_bytes([0, "user1", "/chat/room1", "APPEND", "pipelined message number " + str(i)])
+
+if __name__ == '__main__':
+    # 10k pipelined messages received in one dataReceived call
+    nb_messages = 10000
+    stream = b''.join(chat_message(i) for i in range(nb_messages))
+    compare("10000 pipelined messages in one chunk (%d bytes)" % len(stream), [stream], nb_messages)
+    
+    # one 4MB message received in 64KB pieces
+    large_message = Serialize.to_bytes([0, "user1", "/wiki/page", "WRITE", ["x" * 4000000, ""]])
+    chunks = [large_message[i:i+65536] for i in range(0, len(large_message), 65536)]
+    compare("one 4MB message in %d chunks of 64KB" % len(chunks), chunks, 1)
+    
+    # the same pipelined stream, received in 64KB pieces
+    chunks = [stream[i:i+65536] for i in range(0, len(stream), 65536)]
+    compare("10000 pipelined messages in %d chunks of 64KB" % len(chunks), chunks, nb_messages)
@@ -0,0 +1,67 @@
+'''
+    Benchmark of the FileManager index maintenance with a large number of stored files
+    Run from the src directory:
+      python -m benchmarks.index_benchmark [number of stored paths]
+
+    The legacy index maintenance rewrote the complete index file for each written file
+'''
+
+import sys
+import tempfile
+import time
+
+from file_manager import FileManager
+from serialization_utils import Serialize
+
+def legacy_update_index_file_write(network_path):
+    FileManager.local_index["file_list"][network_path] = FileManager.get_file_name(network_path)
+    FileManager._raw_file_write(FileManager.index_file, Serialize.to_bytes(FileManager.local_index))
+
+if __name__ == '__main__':
+    nb_paths = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    nb_new_paths = 10000
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.init_save_path(temp_dir + "/")
+        
+        # index with nb_paths files, saved by a checkpoint
+        start = time.perf_counter()
+        file_list = FileManager._get_index()["file_list"]
+        for i in range(nb_paths):
+            network_path = "/wiki/page" + str(i)
+            file_list[network_path] = FileManager.get_file_name(network_path)
+        FileManager._write_index()
+        checkpoint_time = time.perf_counter() - start
+        print("Index of %d paths created and saved in %.2f s" % (nb_paths, checkpoint_time))
+        
+        # startup: nothing is read before the index is used
+        start = time.perf_counter()
+        FileManager.init_save_path(temp_dir + "/")
+        print("  startup:                          %10.2f ms" % ((time.perf_counter() - start) * 1e3))
+        
+        start = time.perf_counter()
+        FileManager._get_index()
+        print("  first use of the index (load):    %10.2f ms" % ((time.perf_counter() - start) * 1e3))
+        
+        # new files added with the journal
+        start = time.perf_counter()
+        for i in range(nb_new_paths):
+            FileManager._update_index_file_write("/chat/room" + str(i))
+        journal_time = (time.perf_counter() - start) / nb_new_paths
+        print("  new file, journal:                %10.2f us per file" % (journal_time * 1e6))
+        
+        # checkpoint cost, spread over the len(index) new files written before each checkpoint
+        start = time.perf_counter()
+        FileManager._write_index()
+        checkpoint_time = time.perf_counter() - start
+        nb_indexed = len(FileManager._get_index()["file_list"])
+        print("  checkpoint:                       %10.2f ms, amortized %.2f us per file"
+              % (checkpoint_time * 1e3, checkpoint_time / nb_indexed * 1e6))
+        
+        # legacy: complete index rewritten for each new file
+        nb_legacy_paths = 10
+        start = time.perf_counter()
+        for i in range(nb_legacy_paths):
+            legacy_update_index_file_write("/chat/legacy_room" + str(i))
+        legacy_time = (time.perf_counter() - start) / nb_legacy_paths
+        print("  new file, legacy index rewrite:   %10.2f us per file" % (legacy_time * 1e6))
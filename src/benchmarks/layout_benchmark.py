@@ -0,0 +1,84 @@
+'''
+    Benchmark of file accesses in the flat layout and in the sharded layout of FileManager, depending on the number of files
+    Run from the src directory:
+      python -m benchmarks.layout_benchmark
+
+    Results depend a lot on the filesystem and on its caches, the benchmark should be run on the server filesystem
+'''
+
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+from file_manager import FileManager
+
+def flat_file_name(root_dir, file_hash):
+    return root_dir + file_hash
+
+def sharded_file_name(root_dir, file_hash):
+    return root_dir + file_hash[0:2] + "/" + file_hash[2:4] + "/" + file_hash
+
+def create_files(file_hashes, get_name, root_dir):
+    for file_hash in file_hashes:
+        filename = get_name(root_dir, file_hash)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "wb") as file:
+            file.write(b'x' * 100)
+
+def access_times(file_hashes, get_name, root_dir, nb_accesses=2000):
+    sample = random.sample(file_hashes, min(nb_accesses, len(file_hashes)))
+    
+    start = time.perf_counter()
+    for file_hash in sample:
+        os.stat(get_name(root_dir, file_hash))
+    stat_time = (time.perf_counter() - start) / len(sample)
+    
+    start = time.perf_counter()
+    for file_hash in sample:
+        with open(get_name(root_dir, file_hash), "rb") as file:
+            file.read()
+    open_time = (time.perf_counter() - start) / len(sample)
+    
+    # files not existing, as checked by FileManager.file_exists
+    start = time.perf_counter()
+    for i in range(len(sample)):
+        os.path.isfile(get_name(root_dir, hashlib.sha224(str(i).encode('utf-8')).hexdigest()))
+    missing_time = (time.perf_counter() - start) / len(sample)
+    
+    start = time.perf_counter()
+    nb_listed = sum(1 for _ in os.scandir(root_dir))
+    list_time = time.perf_counter() - start
+    
+    return stat_time, open_time, missing_time, list_time, nb_listed
+
+if __name__ == '__main__':
+    print("File accesses: flat layout vs. sharded layout")
+    for nb_files in [1000, 10000, 100000]:
+        file_hashes = [hashlib.sha224(("/wiki/page" + str(i)).encode('utf-8')).hexdigest() for i in range(nb_files)]
+        for layout_name, get_name in [("flat", flat_file_name), ("sharded", sharded_file_name)]:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                root_dir = temp_dir + "/"
+                create_files(file_hashes, get_name, root_dir)
+                stat_time, open_time, missing_time, list_time, nb_listed = access_times(file_hashes, get_name, root_dir)
+                print("  %7d files %-8s stat: %6.2f us  open+read: %6.2f us  missing file: %6.2f us"
+                      "  root directory listing: %8.2f ms (%d entries)"
+                      % (nb_files, layout_name, stat_time * 1e6, open_time * 1e6, missing_time * 1e6,
+                         list_time * 1e3, nb_listed))
+    
+    # migration of files from the flat layout
+    nb_files = 10000
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.init_save_path(temp_dir + "/")
+        file_hashes = [hashlib.sha224(("/wiki/page" + str(i)).encode('utf-8')).hexdigest() for i in range(nb_files)]
+        create_files(file_hashes, flat_file_name, FileManager.root_dir)
+        FileManager.flat_layout_files = True
+        
+        start = time.perf_counter()
+        nb_steps = 1
+        while not FileManager.migrate_to_sharded_layout(max_files=1000):
+            nb_steps += 1
+        migration_time = time.perf_counter() - start
+        print("Migration of %d files: %.2f s in %d steps (%.2f ms per step)"
+              % (nb_files, migration_time, nb_steps, migration_time / nb_steps * 1e3))
@@ -0,0 +1,110 @@
+'''
+    Benchmark of the decoding of received messages (NetworkMessage.from_bytes, as in MessagePassingProtocol.dataReceived),
+    with short messages decoded at once and the content of long messages decoded when it is used,
+    compared with the previous implementation (complete message decoded, no __slots__)
+    Run from the src directory:
+      python -m benchmarks.message_decoding_benchmark
+
+    Each message is decoded from a memoryview on the receive buffer, then used as by the server
+    (the content not decoded is copied before the receive buffer is released, see MessagePassingProtocol):
+      KEEP_ALIVE: dropped after reading the command, its content is not decoded
+      IS_TYPING: content replaced by the username (ChatServer), its content is not decoded
+      APPEND: content used (ChatServer)
+      WRITE: content used (WikiServer), a page of about 4KB
+      WRITE_LARGE: content used (WikiServer), a page of about 100KB, longer than NetworkMessage.EAGER_DECODING_MAX_LENGTH
+    Traffic mixes: keep-alive-heavy, typing-heavy, only messages whose content is used, and large pages
+'''
+
+import random
+import time
+
+from network_message import NetworkMessage
+from serialization_utils import Serialize
+from user_utils import MainUser
+
+NB_MESSAGES = 200000
+
+# previous implementation of NetworkMessage.from_bytes
+class LegacyNetworkMessage():
+    def __init__(self):
+        self.version = NetworkMessage.MESSAGE_VERSION
+        self.username = MainUser.username
+        self.network_path = None
+        self.command = None
+        self.content = None
+        self.serial_version = None
+    
+    def from_bytes(self, complete_message):
+        result = Serialize.from_bytes(complete_message)
+        if result is not None:
+            self.serial_version = Serialize.read_version(complete_message)
+            try:
+                self.version, self.username, self.network_path, self.command, self.content = result
+                if self.version != NetworkMessage.MESSAGE_VERSION or type(self.username) is not str \
+                  or type(self.network_path) is not str or type(self.command) is not str:
+                    self.username = None
+                    self.network_path = None
+                    self.command = None
+                    self.content = None
+            except:
+                pass
+    
+    # the content was decoded with the header
+    def detach_content(self):
+        pass
+
+def encoded_message(command, content):
+    network_path = "/wiki/page" if command.startswith("WRITE") else "/chat/room1"
+    return bytes(Serialize.to_bytes([NetworkMessage.MESSAGE_VERSION, "user1", network_path, command, content]))
+
+MESSAGES = {
+    "KEEP_ALIVE": encoded_message("KEEP_ALIVE", ""),
+    "IS_TYPING": encoded_message("IS_TYPING", ""),
+    "APPEND": encoded_message("APPEND", "a chat message of a few words"),
+    "WRITE": encoded_message("WRITE", "a line of the page, with a few words [[link]]\n" * 90),
+    "WRITE_LARGE": encoded_message("WRITE_LARGE", "a line of the page, with a few words [[link]]\n" * 2200),
+}
+
+TRAFFIC_MIXES = [
+    ("keep-alive-heavy", {"KEEP_ALIVE": 0.9, "IS_TYPING": 0.05, "APPEND": 0.05}),
+    ("typing-heavy", {"IS_TYPING": 0.7, "KEEP_ALIVE": 0.2, "APPEND": 0.1}),
+    ("content always used", {"APPEND": 0.9, "WRITE": 0.1}),
+    ("large pages", {"WRITE_LARGE": 0.5, "KEEP_ALIVE": 0.5}),
+]
+
+# decode the messages and use them as the server does, return the time per message
+def receive_messages(message_class, frames):
+    start = time.perf_counter()
+    for frame in frames:
+        message = message_class()
+        with memoryview(frame) as view:
+            message.from_bytes(view)
+            if message.command == "IS_TYPING":
+                message.content = message.username
+                message.detach_content()
+            elif message.command is not None and message.command != "KEEP_ALIVE":
+                message.content
+                message.detach_content()
+    return (time.perf_counter() - start) / len(frames)
+
+def use_python_backend():
+    Serialize.from_bytes_unguarded = Serialize.from_bytes_python
+    Serialize.from_bytes_head_unguarded = Serialize.from_bytes_head_python
+    Serialize.from_bytes_tail_unguarded = Serialize.from_bytes_tail_python
+    Serialize.BACKEND = "python"
+
+if __name__ == '__main__':
+    random.seed(0)
+    backends = [Serialize.BACKEND] + (["python"] if Serialize.BACKEND != "python" else [])
+    for backend in backends:
+        if backend == "python":
+            use_python_backend()
+        print("Decoding of received messages, serialization backend: %s" % backend)
+        for mix_name, mix in TRAFFIC_MIXES:
+            commands = random.choices(list(mix.keys()), list(mix.values()), k=NB_MESSAGES)
+            frames = [MESSAGES[command] for command in commands]
+            legacy_time = receive_messages(LegacyNetworkMessage, frames)
+            new_time = receive_messages(NetworkMessage, frames)
+            print("  %-20s legacy: %6.3f us   current: %6.3f us   saved per message: %6.3f us (%.0f%%)"
+                  % (mix_name, legacy_time * 1e6, new_time * 1e6, (legacy_time - new_time) * 1e6,
+                     (legacy_time - new_time) / legacy_time * 100))
@@ -0,0 +1,63 @@
+'''
+    Benchmark of the reads of large stored objects: file read into a bytes object then decoded (previous implementation),
+    compared with the decoding from a memory mapping of the file (FileManager.MMAP_MIN_SIZE)
+    Run from the src directory:
+      python -m benchmarks.mmap_benchmark
+
+    The peak memory is the maximum memory allocated during the read (tracemalloc), the decoded object included
+    The pages of the memory mapping are pages of the file system cache, they are not allocated by the read
+'''
+
+import tempfile
+import time
+import tracemalloc
+
+from file_manager import FileManager
+from serialization_utils import Serialize
+
+NB_READS = 20
+
+def legacy_read(filename):
+    return Serialize.from_bytes(FileManager.backend.read(filename))
+
+def mmap_read(filename):
+    return Serialize.from_bytes(FileManager.backend.read_view(filename, 0))
+
+# peak memory of one read, and the memory used by the decoded object
+def read_memory(read_function, filename):
+    tracemalloc.start()
+    content = read_function(filename)
+    content_memory, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del content
+    return peak_memory, content_memory
+
+def read_time(read_function, filename):
+    start = time.perf_counter()
+    for _ in range(NB_READS):
+        read_function(filename)
+    return (time.perf_counter() - start) / NB_READS
+
+if __name__ == '__main__':
+    objects = [
+        ("wiki page (one string)", "".join("line " + str(i) + " of the page, with a few words [[link]]\n" for i in range(200000))),
+        ("chat history (list)", [["2018-05-12 10:00:00", "user" + str(i % 100), "chat message number " + str(i)]
+                                 for i in range(100000)]),
+        ("file (bytes)", bytes(range(256)) * 64 * 1024),
+    ]
+    
+    print("Read of large stored objects, serialization backend: %s" % Serialize.BACKEND)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.init_save_path(temp_dir + "/")
+        for name, content in objects:
+            FileManager.file_write("/large/" + name, content)
+            filename = FileManager.get_file_name("/large/" + name)
+            if mmap_read(filename) != content or legacy_read(filename) != content:
+                print("FAIL. Content not read correctly:", name)
+            file_size = FileManager.backend.size(filename)
+            
+            for read_name, read_function in [("bytes read", legacy_read), ("memory mapping", mmap_read)]:
+                peak_memory, content_memory = read_memory(read_function, filename)
+                print("  %-23s %5.1f MB   %-14s peak memory: %6.1f MB (decoded object: %5.1f MB)   time: %6.2f ms"
+                      % (name, file_size / 1e6, read_name, peak_memory / 1e6, content_memory / 1e6,
+                         read_time(read_function, filename) * 1e3))
@@ -0,0 +1,57 @@
+'''
+    Benchmark of the storage of wiki revisions: one complete file per revision vs. RevisionStore
+    Run from the src directory:
+      python -m benchmarks.revision_benchmark
+
+    The edit history is synthetic (small edits of pages of different sizes)
+    The disk space saved on real data is reported by migrate_wiki_revisions.py
+'''
+
+import random
+import tempfile
+import time
+
+from file_manager import FileManager
+from revision_store import RevisionStore
+from serialization_utils import Serialize
+
+# history of a page with nb_lines lines, each revision edits a few lines
+def edit_history(nb_lines, nb_revisions):
+    lines = ["line " + str(i) + " of the page, with a [[link" + str(i) + "]]\n" for i in range(nb_lines)]
+    history = []
+    for revision_idx in range(nb_revisions):
+        for _ in range(random.randint(1, 3)):
+            lines[random.randrange(len(lines))] = "line edited in revision " + str(revision_idx) + "\n"
+        if random.random() < 0.3:
+            lines.insert(random.randrange(len(lines)), "new line\n")
+        history.append("".join(lines))
+    return history
+
+if __name__ == '__main__':
+    random.seed(0)
+    print("Revision storage: one file per revision vs. RevisionStore (snapshot every %d revisions)"
+          % RevisionStore.SNAPSHOT_INTERVAL)
+    for nb_lines, nb_revisions in [(20, 100), (200, 100), (2000, 100), (2000, 1000)]:
+        history = edit_history(nb_lines, nb_revisions)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            FileManager.init_save_path(temp_dir + "/")
+            
+            old_size = sum(len(Serialize.to_bytes(content)) for content in history)
+            
+            store = RevisionStore("/wiki/page")
+            start = time.perf_counter()
+            for revision_idx, content in enumerate(history):
+                store.add_revision(revision_idx, content, history[revision_idx - 1] if revision_idx > 0 else None)
+            write_time = (time.perf_counter() - start) / nb_revisions
+            new_size = sum(FileManager.file_size(store.chunk_path(revision_idx))
+                           for revision_idx in range(0, nb_revisions, RevisionStore.SNAPSHOT_INTERVAL))
+            
+            # slowest rebuild: last revision of a chunk
+            start = time.perf_counter()
+            store.read_revision(RevisionStore.SNAPSHOT_INTERVAL - 1)
+            read_time = time.perf_counter() - start
+            
+            print("  %4d lines, %4d revisions   full files: %9d bytes  store: %8d bytes  saved: %5.1f%%"
+                  "   add: %7.2f ms   worst rebuild: %6.2f ms"
+                  % (nb_lines, nb_revisions, old_size, new_size, 100 * (old_size - new_size) / old_size,
+                     write_time * 1e3, read_time * 1e3))
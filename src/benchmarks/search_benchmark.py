@@ -0,0 +1,60 @@
+'''
+    Benchmark of the wiki search index (SearchIndex) with a large number of pages
+    Run from the src directory:
+      python -m benchmarks.search_benchmark [number of pages]
+
+    Pages are synthetic, with words chosen with a Zipf-like distribution
+'''
+
+import random
+import sys
+import tempfile
+import time
+
+from file_manager import FileManager
+from latency_stats import LatencyStats
+from search_index import SearchIndex
+
+def random_page(vocabulary, weights, nb_words):
+    return " ".join(random.choices(vocabulary, weights, k=nb_words))
+
+if __name__ == '__main__':
+    nb_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    random.seed(0)
+    vocabulary = ["word" + str(i) for i in range(50000)]
+    weights = [1 / (i + 1) for i in range(len(vocabulary))]
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.init_save_path(temp_dir + "/")
+        search_index = SearchIndex("/wiki_index/search/")
+        
+        pages = [("/wiki/page" + str(i), random_page(vocabulary, weights, 300)) for i in range(nb_pages)]
+        start = time.perf_counter()
+        search_index.rebuild(pages)
+        print("Index of %d pages rebuilt in %.2f s" % (nb_pages, time.perf_counter() - start))
+        
+        # incremental update of one page
+        update_latency = LatencyStats()
+        for i in range(200):
+            page_path, content = pages[i]
+            start = time.perf_counter()
+            search_index.update_page(page_path, content + " " + random_page(vocabulary, weights, 5))
+            update_latency.add(time.perf_counter() - start)
+        summary = update_latency.summary()
+        print("  page update:  p50 %7.2f ms  p99 %7.2f ms" % (summary["p50"] * 1e3, summary["p99"] * 1e3))
+        
+        # queries of 1 to 3 words, the first query of a term reads its postings from disk
+        for cache_name in ["cold cache", "warm cache"]:
+            if cache_name == "cold cache":
+                FileManager.read_cache.clear()
+                FileManager.read_cache_bytes = 0
+            random.seed(1)
+            query_latency = LatencyStats()
+            for _ in range(500):
+                query = random_page(vocabulary, weights, random.randint(1, 3))
+                start = time.perf_counter()
+                search_index.search(query, max_results=20)
+                query_latency.add(time.perf_counter() - start)
+            summary = query_latency.summary()
+            print("  query (%s):  p50 %7.2f ms  p99 %7.2f ms  max %7.2f ms"
+                  % (cache_name, summary["p50"] * 1e3, summary["p99"] * 1e3, summary["max"] * 1e3))
@@ -0,0 +1,227 @@
+'''
+    Benchmarks of Serialize encoding and decoding
+    Run from the src directory:
+      python -m benchmarks.serialization_benchmark
+
+    The legacy implementations are kept here as a reference,
+    so that the current implementation can be compared with them.
+'''
+
+import timeit
+
+from serialization_utils import Serialize, BufferTooShortException, BooleanConversionException, \
+                                UnknownTypeException, WrongVersionException, BufferTooLongException
+
+# ============ legacy encoder (type lookup by name, buffer grown in small steps) ============
+
+legacy_types_list = {"<class 'str'>":Serialize.DATA_STR_TYPE, "<class 'int'>":Serialize.DATA_INT_TYPE,
+                     "<class 'bool'>":Serialize.DATA_BOOL_TYPE, "<class 'list'>":Serialize.DATA_LIST_TYPE,
+                     "<class 'tuple'>":Serialize.DATA_TUPLE_TYPE, "<class 'dict'>":Serialize.DATA_DICT_TYPE,
+                     "<class 'bytes'>":Serialize.DATA_BYTES_TYPE, "<class 'bytearray'>":Serialize.DATA_BYTEARRAY_TYPE
+}
+
+def legacy_write_value(buffer, val):
+    if type(val) is list or type(val) is tuple:
+        buffer += legacy_types_list[str(type(val))].to_bytes(Serialize.TYPE_PREFIX_LENGTH, byteorder='big')
+        buffer += (len(val)).to_bytes(Serialize.SIZE_PREFIX_LENGTH, byteorder='big')
+        for elmt in val:
+            legacy_write_value(buffer, elmt)
+        return
+    elif type(val) is dict:
+        buffer += legacy_types_list[str(type(val))].to_bytes(Serialize.TYPE_PREFIX_LENGTH, byteorder='big')
+        buffer += (len(val)).to_bytes(Serialize.SIZE_PREFIX_LENGTH, byteorder='big')
+        for key in val.keys():
+            legacy_write_value(buffer, key)
+            legacy_write_value(buffer, val[key])
+        return
+    
+    if type(val) is str:
+        value_bytes = val.encode('utf-8')
+    elif type(val) is int:
+        value_bytes = val.to_bytes(1+( (val.bit_length() + 7) // 8), byteorder='big', signed=True)
+    elif type(val) is bool:
+        value_bytes = bytearray(b'1') if val else bytearray(b'0')
+    elif type(val) is bytes:
+        value_bytes = bytearray(val)
+    elif type(val) is bytearray:
+        value_bytes = val
+    else:
+        raise UnknownTypeException
+    
+    buffer += legacy_types_list[str(type(val))].to_bytes(Serialize.TYPE_PREFIX_LENGTH, byteorder='big')
+    buffer += (len(value_bytes)).to_bytes(Serialize.SIZE_PREFIX_LENGTH, byteorder='big')
+    buffer += value_bytes
+
+def legacy_to_bytes(val):
+    buffer = bytearray(b'')
+    buffer += int(0).to_bytes(Serialize.LENGTH_SIZE, byteorder='big')
+    buffer += int(0).to_bytes(Serialize.VERSION_LENGTH, byteorder='big')
+    legacy_write_value(buffer, val)
+    buffer[:Serialize.LENGTH_SIZE] = (len(buffer)).to_bytes(Serialize.LENGTH_SIZE, byteorder='big')
+    return buffer
+
+# ============ legacy decoder (recursive, one bytearray slice per prefix) ============
+
+def legacy_read_value(buffer, start_idx):
+    if len(buffer) < start_idx+Serialize.TYPE_PREFIX_LENGTH:
+        raise BufferTooShortException
+    data_type = int.from_bytes(buffer[start_idx:start_idx+Serialize.TYPE_PREFIX_LENGTH], byteorder='big')
+    start_idx += Serialize.TYPE_PREFIX_LENGTH
+    
+    if len(buffer) < start_idx+Serialize.SIZE_PREFIX_LENGTH:
+        raise BufferTooShortException
+    data_length = int.from_bytes(buffer[start_idx:start_idx+Serialize.SIZE_PREFIX_LENGTH], byteorder='big')
+    start_idx += Serialize.SIZE_PREFIX_LENGTH
+    
+    if data_type == Serialize.DATA_LIST_TYPE or data_type == Serialize.DATA_TUPLE_TYPE:
+        result_list = []
+        for _ in range(data_length):
+            elmt, start_idx = legacy_read_value(buffer, start_idx)
+            result_list.append(elmt)
+        if data_type == Serialize.DATA_LIST_TYPE:
+            return result_list, start_idx
+        else:
+            return tuple(result_list), start_idx
+    elif data_type == Serialize.DATA_DICT_TYPE:
+        result_dict = {}
+        for _ in range(data_length):
+            key, start_idx = legacy_read_value(buffer, start_idx)
+            value, start_idx = legacy_read_value(buffer, start_idx)
+            result_dict[key] = value
+        return result_dict, start_idx
+    
+    if len(buffer) < start_idx+data_length:
+        raise BufferTooShortException
+    
+    if data_type == Serialize.DATA_STR_TYPE:
+        val = buffer[start_idx:start_idx+data_length].decode('utf-8')
+    elif data_type == Serialize.DATA_INT_TYPE:
+        val = int.from_bytes(buffer[start_idx:start_idx+data_length], byteorder='big', signed=True)
+    elif data_type == Serialize.DATA_BOOL_TYPE:
+        if data_length != 1:
+            raise BooleanConversionException
+        val = True if buffer[start_idx:start_idx+data_length] == bytearray(b'1') else False
+    elif data_type == Serialize.DATA_BYTES_TYPE:
+        val = bytes(buffer[start_idx:start_idx+data_length])
+    elif data_type == Serialize.DATA_BYTEARRAY_TYPE:
+        val = buffer[start_idx:start_idx+data_length]
+    else:
+        raise UnknownTypeException
+    
+    start_idx += data_length
+    return val, start_idx
+
+def legacy_from_bytes(bytes_array):
+    if len(bytes_array) < Serialize.LENGTH_SIZE:
+        raise BufferTooShortException
+    total_length = int.from_bytes(bytes_array[0:Serialize.LENGTH_SIZE], byteorder='big')
+    start_idx = Serialize.LENGTH_SIZE
+    
+    if len(bytes_array) < total_length:
+        raise BufferTooShortException
+    
+    if len(bytes_array) < start_idx + Serialize.VERSION_LENGTH:
+        raise BufferTooShortException
+    version = int.from_bytes(bytes_array[start_idx:start_idx+Serialize.VERSION_LENGTH], byteorder='big')
+    if version != 0:
+        raise WrongVersionException
+    start_idx += Serialize.VERSION_LENGTH
+    
+    val, start_idx = legacy_read_value(bytes_array, start_idx)
+    
+    if start_idx < len(bytes_array):
+        raise BufferTooLongException
+    
+    return val
+
+# ============ payloads ============
+
+# chat history, list of [time, username, message]
+def chat_history_payload(nb_messages):
+    return [["2018-05-12 10:%02d:%02d" % (i // 60 % 60, i % 60), "user" + str(i % 17), "message number " + str(i) + " ok"]
+            for i in range(nb_messages)]
+
+# wiki page with its change comment, as sent with the WRITE command
+def wiki_page_payload(nb_lines):
+    page = "\n".join("line " + str(i) + " of the page with a [[link" + str(i) + "]]" for i in range(nb_lines))
+    return [page, "some comment"]
+
+# network message, as built by NetworkMessage.to_bytes()
+def network_message_payload():
+    return [0, "user1", "/chat/room1", "APPEND", "a short chat line"]
+
+def benchmark_payloads():
+    return [("chat history, 10000 messages", chat_history_payload(10000), 10),
+            ("chat history, 100 messages", chat_history_payload(100), 1000),
+            ("wiki page, 2000 lines", wiki_page_payload(2000), 1000),
+            ("network message", network_message_payload(), 100000)]
+
+# ============ benchmarks ============
+
+def benchmark_encoder():
+    print("Encoder: legacy recursive encoder vs. two-pass preallocated encoder (version 0)")
+    for name, payload, number in benchmark_payloads():
+        # the output must be byte-identical to the legacy encoder
+        assert legacy_to_bytes(payload) == Serialize.to_bytes_python(payload, 0)
+        
+        legacy_time = timeit.timeit(lambda: legacy_to_bytes(payload), number=number)
+        new_time = timeit.timeit(lambda: Serialize.to_bytes_python(payload, 0), number=number)
+        print("  %-30s legacy: %8.2f us   new: %8.2f us   speedup: x%.2f"
+              % (name, legacy_time / number * 1e6, new_time / number * 1e6, legacy_time / new_time))
+        
+        # throughput in encoded MB/s, meaningful for large payloads like INIT_CONTENT
+        encoded_mb = len(legacy_to_bytes(payload)) / 1e6
+        print("  %-30s legacy: %8.2f MB/s new: %8.2f MB/s"
+              % ("", encoded_mb * number / legacy_time, encoded_mb * number / new_time))
+
+def benchmark_decoder():
+    print("Decoder: legacy recursive decoder vs. memoryview decoder (version 0)")
+    for name, payload, number in benchmark_payloads():
+        # file reads give bytes, network reads give bytearray
+        encoded = bytes(Serialize.to_bytes(payload, 0))
+        assert legacy_from_bytes(encoded) == Serialize.from_bytes_python(encoded)
+        
+        legacy_time = timeit.timeit(lambda: legacy_from_bytes(encoded), number=number)
+        new_time = timeit.timeit(lambda: Serialize.from_bytes_python(encoded), number=number)
+        print("  %-30s legacy: %8.2f us   new: %8.2f us   speedup: x%.2f"
+              % (name, legacy_time / number * 1e6, new_time / number * 1e6, legacy_time / new_time))
+
+# encoded size and speed of version 1 compared with version 0
+def benchmark_versions():
+    print("Encoding versions: version 0 vs. version 1")
+    payloads = [("chat line", ["2018-05-12 10:00:00", "user1", "ok"], 100000)] + benchmark_payloads()
+    for name, payload, number in payloads:
+        size_v0 = len(Serialize.to_bytes(payload, 0))
+        size_v1 = len(Serialize.to_bytes(payload, 1))
+        print("  %-30s size v0: %9d bytes  v1: %9d bytes  saved: %5.1f%%"
+              % (name, size_v0, size_v1, 100 * (size_v0 - size_v1) / size_v0))
+        
+        for version in Serialize.SUPPORTED_VERSIONS:
+            encoded = Serialize.to_bytes(payload, version)
+            encode_time = timeit.timeit(lambda: Serialize.to_bytes_python(payload, version), number=number)
+            decode_time = timeit.timeit(lambda: Serialize.from_bytes_python(encoded), number=number)
+            print("  %-30s v%d encode: %8.2f us  decode: %8.2f us"
+                  % ("", version, encode_time / number * 1e6, decode_time / number * 1e6))
+
+# python implementation vs. compiled accelerator (if built with setup_accel.py)
+def benchmark_backends():
+    print("Backends: python vs. compiled (version %d)" % Serialize.SERIAL_VERSION)
+    if Serialize.BACKEND != "compiled":
+        print("  compiled accelerator not built, skipped")
+        return
+    
+    for name, payload, number in benchmark_payloads():
+        encoded = Serialize.to_bytes_python(payload)
+        timings = []
+        for to_bytes, from_bytes in [(Serialize.to_bytes_python, Serialize.from_bytes_python),
+                                     (Serialize.to_bytes_unguarded, Serialize.from_bytes_unguarded)]:
+            timings.append(timeit.timeit(lambda: to_bytes(payload), number=number) / number * 1e6)
+            timings.append(timeit.timeit(lambda: from_bytes(encoded), number=number) / number * 1e6)
+        print("  %-30s encode python: %8.2f us  compiled: %8.2f us   decode python: %8.2f us  compiled: %8.2f us"
+              % (name, timings[0], timings[2], timings[1], timings[3]))
+
+if __name__ == '__main__':
+    benchmark_encoder()
+    benchmark_decoder()
+    benchmark_versions()
+    benchmark_backends()
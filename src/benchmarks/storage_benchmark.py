@@ -0,0 +1,116 @@
+'''
+    Benchmark of the storage backends of FileManager (one file per path, SQLite database) on the server workloads:
+      login: user creation, then reads of user data
+      wiki: page writes (change log, revision, page content), then page and change log reads
+      chat: messages appended to the chat rooms, then pages of history read
+    Run from the src directory:
+      python -m benchmarks.storage_benchmark
+
+    Writes are done with write-behind and a flush every FLUSH_INTERVAL writes, as on the server
+    (one transaction per flush with SQLite), and without write-behind (one disk write or transaction per write)
+    The read cache is disabled, so that all reads access the storage
+'''
+
+import os
+import random
+import tempfile
+import time
+
+from file_manager import FileManager
+from revision_store import RevisionStore
+from storage_backends import FilesBackend, SQLiteBackend
+
+FLUSH_INTERVAL = 1000
+
+NB_USERS = 5000
+NB_PAGES = 1000
+NB_PAGE_EDITS = 5
+NB_CHAT_ROOMS = 50
+NB_CHAT_MESSAGES = 50000
+NB_READS = 10000
+
+# call a write function for each item, with a flush every FLUSH_INTERVAL calls when write-behind is enabled
+def write_all(items, write_function):
+    for i, item in enumerate(items):
+        write_function(item)
+        if FileManager.write_behind and i % FLUSH_INTERVAL == FLUSH_INTERVAL - 1:
+            FileManager.flush_writes()
+    FileManager.flush_writes()
+
+def login_workload():
+    user_data = ["2018-05-12 10:00:00", "public key " + "x" * 400, "private key " + "y" * 1800]
+    def create_user(i):
+        FileManager.file_write("/login/user" + str(i), ["user" + str(i)] + user_data)
+    def read_user(i):
+        FileManager.file_read("/login/user" + str(random.randrange(NB_USERS)))
+    return [(create_user, range(NB_USERS)), (read_user, range(NB_READS))]
+
+def wiki_workload():
+    lines = ["a line of the page, with a few words [[link]]\n"] * 50
+    edits = [(page_idx, revision_idx) for revision_idx in range(NB_PAGE_EDITS) for page_idx in range(NB_PAGES)]
+    def write_page(edit):
+        page_idx, revision_idx = edit
+        page_path = "/wiki/page" + str(page_idx)
+        previous_content = "".join(lines[revision_idx:]) if revision_idx > 0 else None
+        content = "".join(lines[revision_idx + 1:]) + "edit " + str(revision_idx) + "\n"
+        FileManager.append_record(page_path + ".log", [revision_idx, "2018-05-12 10:00:00", "user", "comment"])
+        RevisionStore(page_path).add_revision(revision_idx, content, previous_content)
+        FileManager.file_write(page_path, content)
+    def read_page(i):
+        page_path = "/wiki/page" + str(random.randrange(NB_PAGES))
+        FileManager.file_read(page_path)
+        FileManager.read_records_before(page_path + ".log", None, 50)
+    return [(write_page, edits), (read_page, range(NB_READS))]
+
+def chat_workload():
+    def append_message(i):
+        FileManager.append_record("/chat/room" + str(i % NB_CHAT_ROOMS),
+                                  ["2018-05-12 10:00:00", "user" + str(i % 100), "chat message number " + str(i)])
+    def read_history(i):
+        FileManager.read_records_before("/chat/room" + str(random.randrange(NB_CHAT_ROOMS)), None, 50)
+    return [(append_message, range(NB_CHAT_MESSAGES)), (read_history, range(NB_READS))]
+
+# number of files and disk space used by a directory (allocated blocks)
+def disk_usage(root_dir):
+    nb_files = 0
+    total_size = 0
+    for dir_path, _, filenames in os.walk(root_dir):
+        for filename in filenames:
+            nb_files += 1
+            total_size += os.stat(os.path.join(dir_path, filename)).st_blocks * 512
+    return nb_files, total_size
+
+def call_later(delay, function):
+    # flushes are done by write_all
+    return None
+
+if __name__ == '__main__':
+    FileManager.READ_CACHE_MAX_BYTES = 0
+    
+    print("Storage backends on the server workloads (write-behind: flush every %d writes)" % FLUSH_INTERVAL)
+    for workload_name, workload in [("login", login_workload), ("wiki", wiki_workload), ("chat", chat_workload)]:
+        for backend_class in [FilesBackend, SQLiteBackend]:
+            for write_behind in [True, False]:
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    FileManager.init_save_path(temp_dir + "/", backend_class)
+                    FileManager.write_behind = False
+                    if write_behind:
+                        FileManager.enable_write_behind(call_later)
+                    random.seed(0)
+                    
+                    (write_function, write_items), (read_function, read_items) = workload()
+                    start = time.perf_counter()
+                    write_all(write_items, write_function)
+                    write_time = (time.perf_counter() - start) / len(write_items)
+                    
+                    start = time.perf_counter()
+                    for item in read_items:
+                        read_function(item)
+                    read_time = (time.perf_counter() - start) / len(read_items)
+                    
+                    FileManager.backend.close()
+                    FileManager.backend = None
+                    nb_files, total_size = disk_usage(temp_dir)
+                    print("  %-6s %-13s %-20s write: %8.2f us   read: %8.2f us   %7d files, %8.2f MB"
+                          % (workload_name, backend_class.__name__, "write-behind" if write_behind else "immediate writes",
+                             write_time * 1e6, read_time * 1e6, nb_files, total_size / 1e6))
@@ -2,83 +2,1356 @@
     Interface to the host file system
     All "file accesses" should be done through FileManager
     It will allow in the future to cache data, and also reorganize it and store it efficiently 
+    
+    Files are stored by a storage backend (see storage_backends.py): one file per path (default) or an SQLite database
+    
+    Two kinds of files are stored:
+      files written completely by file_write and read by file_read (one serialized value)
+      record logs, where records are appended one by one with append_record and read with iter_records
+    
+    The server uses the asynchronous API (file_read_async, file_write_async...), whose disk accesses are done by a thread pool
 '''
 
+from collections import OrderedDict
 import hashlib
+import itertools
 import os
+import struct
+import sys
+import time
+import zlib
 
 from serialization_utils import Serialize
+from latency_stats import LatencyStats
+from storage_backends import FilesBackend
+
+# twisted is only needed by the asynchronous API (used by the server)
+try:
+    from twisted.internet import defer, threads
+    from twisted.python.threadpool import ThreadPool
+except ImportError:
+    defer = None
 
 class FileManager():
     
     VERSION = 0
     
+    # directory of all saved files, None until init_save_path() was called
+    root_dir = None
+    
+    # storage backend of the files (FilesBackend or SQLiteBackend), all disk accesses are done through it
+    backend = None
+    
+    # a record log is a sequence of records, each record is:
+    #   the serialized record (Serialize.to_bytes, starting with its total length)
+    #   a trailer with the crc32 and the length of the serialized record (so that the log can also be read backward)
+    RECORD_TRAILER_STRUCT = struct.Struct('>II')
+    
+    # number of records of each record log already opened since the application was started
+    # a record log is checked (tail recovery) the first time it is opened
+    record_counts = {}
+    
+    # when a maximum number of records is given, a log is compacted when it reaches this factor times the maximum
+    COMPACTION_FACTOR = 2
+    
+    # read cache of decoded files, ordered from the least recently used to the most recently used
+    # each item is network_path: (content, approximate memory size of the decoded content, see _decoded_size)
+    # the budget is in bytes of memory, a decoded content takes several times the size of its serialized bytes
+    # contents returned by file_read are shared with the cache, so they must not be modified by the caller
+    READ_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    read_cache = OrderedDict()
+    read_cache_bytes = 0
+    read_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+    
+    # files of at least MMAP_MIN_SIZE bytes are read through a memory mapping (FilesBackend): the deserializer decodes
+    # strings and bytes directly from the mapped file, instead of reading the whole file into a bytes object first
+    MMAP_MIN_SIZE = 256 * 1024
+    
+    # write-behind: written data is kept in memory and written to disk later (flush),
+    # so that several writes to the same file are merged into one disk write
+    # disabled by default (data written immediately), enabled by the server with enable_write_behind()
+    write_behind = False
+    
+    # pending data is flushed at most WRITE_BEHIND_DELAY seconds after being written,
+    # or immediately when more than WRITE_BEHIND_MAX_BYTES bytes are pending
+    WRITE_BEHIND_DELAY = 1.0
+    WRITE_BEHIND_MAX_BYTES = 4 * 1024 * 1024
+    
+    # serialized content waiting to be written, for files written by file_write and for record logs
+    pending_files = {}
+    pending_records = {}
+    pending_bytes = 0
+    
+    # function used to schedule a flush (call_later(delay, function), like twisted reactor.callLater), and the scheduled call
+    call_later = None
+    flush_call = None
+    
+    # counters of writes, of writes merged with a pending write, of files written to disk and of flushes
+    write_stats = {"writes": 0, "coalesced_writes": 0, "disk_writes": 0, "flushes": 0, "flushed_bytes": 0}
+    flush_durations = LatencyStats()
+    
+    # asynchronous API (file_read_async, file_write_async, read_records_before_async): disk accesses are done by
+    # a bounded thread pool, so that a slow disk does not block the reactor
+    # the FileManager state (index, caches, pending data) is only used in the reactor thread, threads only access the disk
+    # operations on the same network path are done one after the other, in the order they were requested
+    # enabled by the server with enable_async_io(), otherwise the asynchronous API accesses the disk immediately
+    thread_pool = None
+    reactor = None
+    
+    # last queued disk operation of each network path, a Deferred fired when the operation is done
+    path_operations = {}
+    
+    # content of the files being written by a queued operation, read instead of the disk until the operation is done
+    # (DELETED_FILE for a file being removed)
+    DELETED_FILE = object()
+    writing_files = {}
+    
+    # incremented by each write, a content read from disk is not cached if a write was done during the read
+    write_counter = 0
+    
+    # the index of all files is saved in two files:
+    #   the index file, with the complete index at the time of the last checkpoint
+    #   the index journal, a record log with one [network_path, filename] record per file added since the checkpoint
+    #   ([network_path, ""] for a removed file)
+    # a checkpoint (index file rewritten, journal emptied) is done when the journal has as many records as the index,
+    # so that maintaining the index costs O(1) per new file on average
+    INDEX_CHECKPOINT_MIN_RECORDS = 1000
+    
+    # files are stored in two levels of sub-directories named from the beginning of their hash (ab/cd/abcd...)
+    # files stored by older versions directly in root_dir (flat layout) are moved when they are accessed,
+    # and by migrate_to_sharded_layout(); flat_layout_files is False when no such file remains
+    FILE_HASH_LENGTH = 56
+    flat_layout_files = False
+    migration_iterator = None
+    
+    # filenames of all the existing files (files and record logs), so that file_exists and the reads of missing files
+    # do not access the disk; loaded by a scan of the storage the first time it is used (see scan_existing_files),
+    # then updated by each write and removal (FileManager must be the only writer of root_dir)
+    existing_files = None
+    
+    # filenames of the network paths already used (hash computed once), including paths of missing files
+    # emptied when it reaches FILE_NAMES_MAX_SIZE paths
+    FILE_NAMES_MAX_SIZE = 100000
+    file_names = {}
+    
     # Should be called only once when application is started
+    # backend_class is the storage backend (FilesBackend or SQLiteBackend from storage_backends.py)
     # return True if initialization was successful
-    def init_save_path():
-        FileManager.root_dir = "pykanet_data/"
+    def init_save_path(root_dir="pykanet_data/", backend_class=FilesBackend):
+        if FileManager.backend is not None:
+            FileManager.backend.close()
+            FileManager.backend = None
+        
+        FileManager.root_dir = root_dir
         FileManager.index_file = FileManager.root_dir + "index"
+        FileManager.index_journal_file = FileManager.root_dir + "index.journal"
         
-        if not os.path.exists(FileManager.root_dir):
-            try:
+        # file created when all files are in the sharded layout
+        FileManager.layout_file = FileManager.root_dir + "sharded_layout"
+        
+        try:
+            is_new_dir = not os.path.exists(FileManager.root_dir)
+            if is_new_dir:
                 os.makedirs(FileManager.root_dir)
-            except:
-                # save directory does not exist and could not be created
-                return False
+            FileManager.backend = backend_class(FileManager.root_dir)
+            if is_new_dir:
+                FileManager.backend.write(FileManager.layout_file, b'')
+        except:
+            # save directory does not exist and could not be created, or the storage could not be opened
+            FileManager.root_dir = None
+            return False
+        
+        FileManager.flat_layout_files = backend_class.HAS_FLAT_LAYOUT and not FileManager.backend.exists(FileManager.layout_file)
+        FileManager.migration_iterator = None
+        FileManager.existing_files = None
+        FileManager.file_names = {}
+        
+        # state of the files of a previous root directory
+        FileManager.record_counts = {}
+        FileManager.read_cache = OrderedDict()
+        FileManager.read_cache_bytes = 0
         
         # structure to keep a track of all files existing on the local node
-        FileManager._read_index()
+        # loaded when it is used for the first time (see _get_index)
+        FileManager.local_index = None
+        FileManager.index_journal_records = 0
         
         return True
     
+    # return the index of all files, loaded from the index file and the index journal the first time
+    def _get_index():
+        if FileManager.local_index is None:
+            FileManager._read_index()
+        return FileManager.local_index
+    
     def _read_index():
-        if os.path.isfile(FileManager.index_file):
-            FileManager.local_index = Serialize.from_bytes(FileManager._raw_file_read(FileManager.index_file))
-        else:
+        FileManager.local_index = None
+        index_data = FileManager._raw_file_read(FileManager.index_file)
+        if index_data is not None:
+            FileManager.local_index = Serialize.from_bytes(index_data)
+            if FileManager.local_index is None:
+                print("Warning: could not read the index file:", FileManager.index_file)
+        if FileManager.local_index is None:
             FileManager.local_index = {"version":FileManager.VERSION, "file_list":{}}
+        
+        # files added after the last checkpoint
+        FileManager.index_journal_records = 0
+        journal_data = FileManager._raw_file_read(FileManager.index_journal_file)
+        if journal_data is None:
+            return
+        
+        valid_length = 0
+        with memoryview(journal_data) as view:
+            for record_start, record_end in FileManager._scan_records(journal_data):
+                record_length = record_end - FileManager.RECORD_TRAILER_STRUCT.size - record_start
+                with view[record_start:record_start + record_length] as record_view:
+                    network_path, filename = Serialize.from_bytes(record_view)
+                if filename == "":
+                    FileManager.local_index["file_list"].pop(network_path, None)
+                else:
+                    FileManager.local_index["file_list"][network_path] = filename
+                FileManager.index_journal_records += 1
+                valid_length = record_end
+        
+        if valid_length < len(journal_data):
+            print("Warning: incomplete record removed at the end of:", FileManager.index_journal_file)
+            FileManager.backend.truncate(FileManager.index_journal_file, valid_length)
     
+    # checkpoint: write the complete index, and empty the journal
+    # if the application stops between both steps, journal records are applied again to the index, without any effect
     def _write_index():
-        FileManager._raw_file_write(FileManager.index_file, Serialize.to_bytes(FileManager.local_index))
+        if not FileManager._raw_file_write_atomic(FileManager.index_file, Serialize.to_bytes(FileManager._get_index())):
+            return
+        
+        FileManager._raw_file_write(FileManager.index_journal_file, b'')
+        FileManager.index_journal_records = 0
     
     # update the index of all files when a file is written
     def _update_index_file_write(network_path):
         # currently, only keep a track of existing files
-        if network_path not in FileManager.local_index:
-            FileManager.local_index["file_list"][network_path] = FileManager.get_file_name(network_path)
+        file_list = FileManager._get_index()["file_list"]
+        if network_path in file_list:
+            return
+        
+        filename = FileManager.get_file_name(network_path)
+        file_list[network_path] = filename
+        FileManager._append_index_journal(network_path, filename)
+    
+    # update the index of all files when a file is removed
+    def _update_index_file_delete(network_path):
+        file_list = FileManager._get_index()["file_list"]
+        if network_path not in file_list:
+            return
+        
+        del file_list[network_path]
+        FileManager._append_index_journal(network_path, "")
+    
+    def _append_index_journal(network_path, filename):
+        FileManager._raw_file_append(FileManager.index_journal_file, FileManager._encode_record([network_path, filename]))
+        FileManager.index_journal_records += 1
+        
+        if FileManager.index_journal_records >= max(FileManager.INDEX_CHECKPOINT_MIN_RECORDS,
+                                                    len(FileManager.local_index["file_list"])):
             FileManager._write_index()
     
     def get_file_name(network_path):
-        return FileManager.root_dir + hashlib.sha224(network_path.encode('utf-8')).hexdigest()
+        filename = FileManager.file_names.get(network_path)
+        if filename is not None:
+            return filename
+        
+        file_hash = hashlib.sha224(network_path.encode('utf-8')).hexdigest()
+        filename = FileManager._sharded_file_name(file_hash)
+        
+        # files in the flat layout are in the existing files, with their filename in the sharded layout
+        if FileManager.flat_layout_files:
+            existing_files = FileManager._get_existing_files()
+            if filename in existing_files or filename + ".records" in existing_files:
+                FileManager._move_from_flat_layout(file_hash)
+        
+        if len(FileManager.file_names) >= FileManager.FILE_NAMES_MAX_SIZE:
+            FileManager.file_names = {}
+        FileManager.file_names[network_path] = filename
+        return filename
+    
+    def _sharded_file_name(file_name):
+        return FileManager.root_dir + file_name[0:2] + "/" + file_name[2:4] + "/" + file_name
+    
+    # move the files of a hash (file and record log) from the flat layout to the sharded layout
+    # if a file also exists in the sharded layout, it is the most recent one and the flat file is removed
+    # (only with FilesBackend, other backends do not have a flat layout)
+    def _move_from_flat_layout(file_hash):
+        for file_name in [file_hash, file_hash + ".records"]:
+            flat_filename = FileManager.root_dir + file_name
+            if not os.path.isfile(flat_filename):
+                continue
+            
+            sharded_filename = FileManager._sharded_file_name(file_name)
+            if os.path.isfile(sharded_filename):
+                os.remove(flat_filename)
+            else:
+                FileManager.backend.make_parent_dir(sharded_filename)
+                os.replace(flat_filename, sharded_filename)
+    
+    # move up to max_files files from the flat layout to the sharded layout (all files if max_files is None)
+    # can be called regularly while the application is running (files are also moved when they are accessed)
+    # return True when all files were moved
+    def migrate_to_sharded_layout(max_files=None):
+        if not FileManager.flat_layout_files:
+            return True
+        
+        if FileManager.migration_iterator is None:
+            FileManager.migration_iterator = os.scandir(FileManager.root_dir)
+        
+        moved_files = 0
+        for entry in FileManager.migration_iterator:
+            if not FileManager._is_data_file_name(entry.name) or not entry.is_file():
+                continue
+            
+            FileManager._move_from_flat_layout(entry.name[:FileManager.FILE_HASH_LENGTH])
+            moved_files += 1
+            if max_files is not None and moved_files >= max_files:
+                return False
+        
+        # all files were checked
+        FileManager.migration_iterator.close()
+        FileManager.migration_iterator = None
+        FileManager._raw_file_write(FileManager.layout_file, b'')
+        FileManager.flat_layout_files = False
+        return True
+    
+    # True for the name of a file or of a record log (hash of its network path), False for the other files of root_dir
+    def _is_data_file_name(name):
+        file_hash = name[:FileManager.FILE_HASH_LENGTH]
+        if name not in [file_hash, file_hash + ".records"] or len(file_hash) != FileManager.FILE_HASH_LENGTH:
+            return False
+        try:
+            int(file_hash, 16)
+        except ValueError:
+            return False
+        return True
+    
+    # scan the storage to know all the existing files, should be done when the application is started
+    # return the number of existing files (files and record logs)
+    def scan_existing_files():
+        FileManager.existing_files = set()
+        for filename in FileManager.backend.list_files():
+            name = filename[len(FileManager.root_dir):]
+            file_name = name.rpartition("/")[2]
+            if not FileManager._is_data_file_name(file_name):
+                continue
+            
+            if "/" in name:
+                FileManager.existing_files.add(filename)
+            else:
+                # file in the flat layout, moved to the sharded layout when it is accessed
+                FileManager.existing_files.add(FileManager._sharded_file_name(file_name))
+        return len(FileManager.existing_files)
     
+    def _get_existing_files():
+        if FileManager.existing_files is None:
+            FileManager.scan_existing_files()
+        return FileManager.existing_files
+    
+    # answered from memory, without any disk access
     def file_exists(network_path):
-        filename = FileManager.get_file_name(network_path)
-        return os.path.isfile(filename)
+        return FileManager.get_file_name(network_path) in FileManager._get_existing_files()
     
     def _raw_file_read(filename):
         try:
-            with open(filename, "rb") as file:
-                return file.read()
+            return FileManager.backend.read(filename)
         except:
-            # could not read the file (probably file not existing yet)
+            print("Warning: an error occurred when reading data from:", filename)
             return None
     
+    # read a file to decode it: large files are not copied, a memoryview of a memory mapping of the file is returned
+    # the returned view must not be kept (the file is unmapped when the view is not used anymore)
+    def _raw_file_read_view(filename):
+        try:
+            return FileManager.backend.read_view(filename, FileManager.MMAP_MIN_SIZE)
+        except:
+            print("Warning: an error occurred when reading data from:", filename)
+            return None
+    
+    # read and decode a file, return the content and its approximate memory size (done in the thread pool)
+    def _raw_file_read_content(filename):
+        content_view = FileManager._raw_file_read_view(filename)
+        if content_view is None:
+            return None, 0
+        content = Serialize.from_bytes(content_view)
+        return content, FileManager._decoded_size(content)
+    
     def _raw_file_write(filename, bytearray_content):
         try:
-            with open(filename, "wb") as file:
-                file.write(bytearray_content)
+            FileManager.backend.write(filename, bytearray_content)
             return True
         except:
             print("Warning: an error occurred when writing data to:", filename)
             return False
     
+    # append data at the end of a file
+    def _raw_file_append(filename, bytearray_content):
+        try:
+            FileManager.backend.append(filename, bytearray_content)
+            return True
+        except:
+            print("Warning: an error occurred when writing data to:", filename)
+            return False
+    
+    def _raw_files_remove(filenames):
+        for filename in filenames:
+            FileManager.backend.remove(filename)
+    
+    # write a file atomically: after a crash, the file has either its old content or its new content
+    def _raw_file_write_atomic(filename, bytearray_content):
+        try:
+            FileManager.backend.write_atomic(filename, bytearray_content)
+            return True
+        except:
+            print("Warning: an error occurred when writing data to:", filename)
+            return False
+    
+    # the returned content may be shared with other callers (read cache), it must not be modified
     def file_read(network_path):
-        filename = FileManager.get_file_name(network_path)
-        return Serialize.from_bytes(FileManager._raw_file_read(filename))
+        cached = FileManager.read_cache.get(network_path)
+        if cached is not None:
+            FileManager.read_cache.move_to_end(network_path)
+            FileManager.read_cache_stats["hits"] += 1
+            return cached[0]
+        FileManager.read_cache_stats["misses"] += 1
+        
+        # the latest written content may not be on disk yet
+        content_bytes = FileManager._get_unwritten_bytes(network_path)
+        if content_bytes is FileManager.DELETED_FILE:
+            return None
+        if content_bytes is not None:
+            content = Serialize.from_bytes(content_bytes)
+            content_size = FileManager._decoded_size(content)
+        else:
+            filename = FileManager.get_file_name(network_path)
+            if filename not in FileManager._get_existing_files():
+                return None
+            content, content_size = FileManager._raw_file_read_content(filename)
+        
+        if content is not None:
+            FileManager._cache_add(network_path, content, content_size)
+        return content
+    
+    # serialized content written to a file but not written to disk yet (pending or being written), None if there is none
+    def _get_unwritten_bytes(network_path):
+        content_bytes = FileManager.pending_files.get(network_path)
+        if content_bytes is None:
+            content_bytes = FileManager.writing_files.get(network_path)
+        return content_bytes
     
     def file_write(network_path, new_content):    
         FileManager._update_index_file_write(network_path)
+        FileManager._get_existing_files().add(FileManager.get_file_name(network_path))
+        FileManager._cache_remove(network_path)
+        FileManager.write_stats["writes"] += 1
+        FileManager.write_counter += 1
+        
+        if FileManager.write_behind:
+            # content is serialized immediately, so that later modifications of new_content are not saved
+            new_bytes = Serialize.to_bytes(new_content)
+            previous_bytes = FileManager.pending_files.get(network_path)
+            if previous_bytes is not None:
+                FileManager.pending_bytes -= len(previous_bytes)
+                FileManager.write_stats["coalesced_writes"] += 1
+            FileManager.pending_files[network_path] = new_bytes
+            FileManager.pending_bytes += len(new_bytes)
+            FileManager._schedule_flush()
+            return
+        
+        if FileManager.thread_pool is not None:
+            # written after the queued operations on the file
+            FileManager._write_file_async(network_path, Serialize.to_bytes(new_content))
+            return
         
         filename = FileManager.get_file_name(network_path)
         FileManager._raw_file_write(filename, Serialize.to_bytes(new_content))
+        FileManager.write_stats["disk_writes"] += 1
+    
+    # network paths of all the stored files starting with prefix (files and record logs)
+    def list_files(prefix=""):
+        return [network_path for network_path in FileManager._get_index()["file_list"] if network_path.startswith(prefix)]
+    
+    # remove a file, and its record log if any
+    def file_delete(network_path):
+        FileManager._update_index_file_delete(network_path)
+        FileManager._cache_remove(network_path)
+        FileManager.write_counter += 1
+        FileManager._get_existing_files().difference_update([FileManager.get_file_name(network_path),
+                                                             FileManager.get_records_file_name(network_path)])
+        
+        pending_bytes = FileManager.pending_files.pop(network_path, None)
+        if pending_bytes is not None:
+            FileManager.pending_bytes -= len(pending_bytes)
+        for record_bytes in FileManager.pending_records.pop(network_path, []):
+            FileManager.pending_bytes -= len(record_bytes)
+        FileManager.record_counts.pop(network_path, None)
+        
+        filenames = [FileManager.get_file_name(network_path), FileManager.get_records_file_name(network_path)]
+        if FileManager.thread_pool is None:
+            FileManager._raw_files_remove(filenames)
+            return
+        
+        # removed after the queued operations on the file
+        FileManager.writing_files[network_path] = FileManager.DELETED_FILE
+        def removed(result):
+            if FileManager.writing_files.get(network_path) is FileManager.DELETED_FILE:
+                del FileManager.writing_files[network_path]
+            return result
+        FileManager._run_ordered([network_path], FileManager._raw_files_remove, filenames).addBoth(removed)
+    
+    # size on disk of a file and of its record log (pending records are written first)
+    # a content not on disk yet (write-behind, asynchronous API) is counted with the size it will have on disk,
+    # so the size is correct even when the writes are done later by the thread pool
+    def file_size(network_path):
+        FileManager._flush_records(network_path)
+        
+        content_bytes = FileManager._get_unwritten_bytes(network_path)
+        if content_bytes is FileManager.DELETED_FILE:
+            size = 0
+        elif content_bytes is not None:
+            size = len(content_bytes)
+        else:
+            size = FileManager.backend.size(FileManager.get_file_name(network_path)) or 0
+        return size + (FileManager.backend.size(FileManager.get_records_file_name(network_path)) or 0)
+    
+    # rewrite with the current serialization version all indexed files written with an older version
+    # files in older versions can still be read, so this can be done at any time while the server is running
+    # return the number of rewritten files
+    def upgrade_serial_version():
+        FileManager.flush_writes()
+        upgraded_nb = 0
+        for network_path in list(FileManager._get_index()["file_list"].keys()):
+            filename = FileManager.get_file_name(network_path)
+            raw_content = FileManager._raw_file_read(filename)
+            if raw_content is None or Serialize.read_version(raw_content) == Serialize.SERIAL_VERSION:
+                continue
+            
+            content = Serialize.from_bytes(raw_content)
+            if content is None:
+                print("Warning: could not read data from:", filename)
+                continue
+            
+            FileManager._raw_file_write(filename, Serialize.to_bytes(content))
+            upgraded_nb += 1
+        
+        FileManager._write_index()
+        return upgraded_nb
+    
+    # ============ read cache ============
+    
+    # number of elements of each list, tuple or dictionary used to estimate the size of all its elements
+    DECODED_SIZE_SAMPLE = 16
+    
+    # approximate memory size of a decoded content, the sum of the sizes of all its objects
+    # only the first DECODED_SIZE_SAMPLE elements of a container are measured, the size of the others is extrapolated,
+    # so the cost does not depend on the number of elements (objects shared by the interpreter are counted each time)
+    def _decoded_size(content):
+        size = 0
+        values = [(content, 1)]
+        while values:
+            value, weight = values.pop()
+            size += weight * sys.getsizeof(value)
+            value_type = type(value)
+            if value_type is list or value_type is tuple:
+                sample = value[:FileManager.DECODED_SIZE_SAMPLE]
+                elements_nb = len(value)
+            elif value_type is dict:
+                sample = [elmt for item in itertools.islice(value.items(), FileManager.DECODED_SIZE_SAMPLE) for elmt in item]
+                elements_nb = 2 * len(value)
+            else:
+                continue
+            if sample:
+                sample_weight = weight * elements_nb / len(sample)
+                values.extend([(elmt, sample_weight) for elmt in sample])
+        return int(size)
+    
+    def _cache_add(network_path, content, content_size):
+        if content_size > FileManager.READ_CACHE_MAX_BYTES:
+            return
+        
+        FileManager._cache_remove(network_path)
+        FileManager.read_cache[network_path] = (content, content_size)
+        FileManager.read_cache_bytes += content_size
+        
+        # remove the least recently used files until the cache fits in its budget
+        while FileManager.read_cache_bytes > FileManager.READ_CACHE_MAX_BYTES:
+            _, (_, evicted_size) = FileManager.read_cache.popitem(last=False)
+            FileManager.read_cache_bytes -= evicted_size
+            FileManager.read_cache_stats["evictions"] += 1
+    
+    def _cache_remove(network_path):
+        cached = FileManager.read_cache.pop(network_path, None)
+        if cached is not None:
+            FileManager.read_cache_bytes -= cached[1]
+    
+    # return a copy of the read cache counters, with its current size
+    def get_read_cache_stats():
+        stats = dict(FileManager.read_cache_stats)
+        stats["cached_files"] = len(FileManager.read_cache)
+        stats["cached_bytes"] = FileManager.read_cache_bytes
+        return stats
+    
+    # ============ write-behind ============
+    
+    # enable write-behind, call_later(delay, function) is used to schedule flushes (twisted reactor.callLater)
+    # flush_writes() should also be called before the application is stopped
+    def enable_write_behind(call_later):
+        FileManager.call_later = call_later
+        FileManager.write_behind = True
     
-    # Note : append not supported anymore for some time (because serialization is used)
+    def _schedule_flush():
+        if FileManager.pending_bytes >= FileManager.WRITE_BEHIND_MAX_BYTES:
+            FileManager.flush_writes()
+        elif FileManager.flush_call is None:
+            FileManager.flush_call = FileManager.call_later(FileManager.WRITE_BEHIND_DELAY, FileManager.flush_writes)
+    
+    # write all pending data to disk
+    # with the asynchronous API, the data is written by the thread pool and a Deferred fired when it is written is returned
+    def flush_writes():
+        if FileManager.flush_call is not None:
+            if FileManager.flush_call.active():
+                FileManager.flush_call.cancel()
+            FileManager.flush_call = None
+        
+        if not FileManager.pending_files and not FileManager.pending_records:
+            return
+        
+        start_time = time.perf_counter()
+        FileManager.write_stats["flushes"] += 1
+        FileManager.write_stats["flushed_bytes"] += FileManager.pending_bytes
+        
+        # [network path, filename, data] of the files to write and of the records to append
+        file_writes = [[network_path, FileManager.get_file_name(network_path), content_bytes]
+                       for network_path, content_bytes in FileManager.pending_files.items()]
+        record_appends = [[network_path, FileManager.get_records_file_name(network_path), b''.join(pending_records)]
+                          for network_path, pending_records in FileManager.pending_records.items()]
+        FileManager.pending_files = {}
+        FileManager.pending_records = {}
+        FileManager.pending_bytes = 0
+        
+        def flushed(results):
+            FileManager._flush_done(file_writes, record_appends, results)
+            FileManager.flush_durations.add(time.perf_counter() - start_time)
+            return results
+        
+        if FileManager.thread_pool is None:
+            flushed(FileManager._raw_flush(file_writes, record_appends))
+            return
+        
+        # written by one operation of the thread pool, after the queued operations on the same files
+        for network_path, _, content_bytes in file_writes:
+            FileManager.writing_files[network_path] = content_bytes
+        network_paths = [file_write[0] for file_write in file_writes] + [record_append[0] for record_append in record_appends]
+        return FileManager._run_ordered(network_paths, FileManager._raw_flush, file_writes, record_appends).addCallback(flushed)
+    
+    # write the pending data of flush_writes() in one batch (one transaction with SQLiteBackend)
+    # return the results of the file writes and of the record appends
+    def _raw_flush(file_writes, record_appends):
+        try:
+            with FileManager.backend.batch():
+                file_results = [FileManager._raw_file_write(filename, data) for _, filename, data in file_writes]
+                append_results = [FileManager._raw_file_append(filename, data) for _, filename, data in record_appends]
+            return file_results, append_results
+        except:
+            print("Warning: an error occurred when writing pending data")
+            return [False] * len(file_writes), [False] * len(record_appends)
+    
+    def _flush_done(file_writes, record_appends, results):
+        file_results, append_results = results
+        for network_path, _, content_bytes in file_writes:
+            if FileManager.writing_files.get(network_path) is content_bytes:
+                del FileManager.writing_files[network_path]
+        for (network_path, _, _), result in zip(record_appends, append_results):
+            if not result:
+                # records may have been partially written, check again the log before the next append
+                FileManager.record_counts.pop(network_path, None)
+        FileManager.write_stats["disk_writes"] += file_results.count(True) + append_results.count(True)
+    
+    # return a copy of the write counters, with the number of pending bytes and the flush duration percentiles
+    def get_write_stats():
+        stats = dict(FileManager.write_stats)
+        stats["pending_bytes"] = FileManager.pending_bytes
+        stats["flush_durations"] = FileManager.flush_durations.summary()
+        return stats
+    
+    # ============ append-only record logs ============
+    
+    def get_records_file_name(network_path):
+        return FileManager.get_file_name(network_path) + ".records"
+    
+    def records_exist(network_path):
+        return FileManager.get_records_file_name(network_path) in FileManager._get_existing_files()
+    
+    def _encode_record(record):
+        record_bytes = Serialize.to_bytes(record)
+        return record_bytes + FileManager.RECORD_TRAILER_STRUCT.pack(zlib.crc32(record_bytes), len(record_bytes))
+    
+    # yield the start and end indexes of the valid records of a record log content
+    # the end index includes the trailer, the scan stops at the first incomplete or corrupted record
+    def _scan_records(data):
+        trailer_size = FileManager.RECORD_TRAILER_STRUCT.size
+        with memoryview(data) as view:
+            idx = 0
+            while idx + Serialize.LENGTH_SIZE <= len(data):
+                record_length = int.from_bytes(view[idx:idx+Serialize.LENGTH_SIZE], byteorder='big')
+                record_end = idx + record_length
+                if record_length <= Serialize.LENGTH_SIZE or record_end + trailer_size > len(data):
+                    return
+                
+                crc, trailer_length = FileManager.RECORD_TRAILER_STRUCT.unpack_from(data, record_end)
+                if trailer_length != record_length or crc != zlib.crc32(view[idx:record_end]):
+                    return
+                
+                yield idx, record_end + trailer_size
+                idx = record_end + trailer_size
+    
+    # check a record log the first time it is used after the application was started
+    # a record partially written when the application stopped is removed (tail recovery)
+    def _recover_records(network_path):
+        if network_path in FileManager.record_counts:
+            return
+        
+        filename = FileManager.get_records_file_name(network_path)
+        data = None
+        if filename in FileManager._get_existing_files():
+            data = FileManager._raw_file_read_view(filename)
+        records_nb = 0
+        valid_length = 0
+        if data is not None:
+            for _, record_end in FileManager._scan_records(data):
+                records_nb += 1
+                valid_length = record_end
+            
+            # the file is unmapped before being truncated
+            data_length = len(data)
+            data = None
+            if valid_length < data_length:
+                print("Warning: incomplete record removed at the end of:", filename)
+                FileManager.backend.truncate(filename, valid_length)
+        
+        FileManager.record_counts[network_path] = records_nb
+    
+    # append one record at the end of a record log, the cost does not depend on the size of the log
+    # if max_records is given, only the last max_records records are kept (old records are removed by compaction)
+    # return True if the record was written (or queued, with write-behind or the asynchronous API)
+    def append_record(network_path, record, max_records=None):
+        FileManager._recover_records(network_path)
+        if FileManager.record_counts[network_path] == 0:
+            FileManager._update_index_file_write(network_path)
+            FileManager._get_existing_files().add(FileManager.get_records_file_name(network_path))
+        FileManager.write_stats["writes"] += 1
+        
+        record_bytes = FileManager._encode_record(record)
+        if FileManager.write_behind:
+            if network_path in FileManager.pending_records:
+                FileManager.write_stats["coalesced_writes"] += 1
+            FileManager.pending_records.setdefault(network_path, []).append(record_bytes)
+            FileManager.pending_bytes += len(record_bytes)
+        elif FileManager.thread_pool is not None:
+            # appended by the thread pool, after the queued operations on the log
+            FileManager._append_to_log_async(network_path, record_bytes)
+        elif not FileManager._append_to_log(network_path, record_bytes):
+            return False
+        
+        FileManager.record_counts[network_path] += 1
+        
+        # the compaction reads the log, it is postponed while asynchronous operations on the log are queued
+        if max_records is not None and FileManager.record_counts[network_path] >= FileManager.COMPACTION_FACTOR * max_records \
+           and network_path not in FileManager.path_operations:
+            FileManager.compact_records(network_path, max_records)
+        
+        if FileManager.write_behind:
+            FileManager._schedule_flush()
+        
+        return True
+    
+    # write encoded records at the end of a record log
+    def _append_to_log(network_path, records_bytes):
+        if not FileManager._raw_file_append(FileManager.get_records_file_name(network_path), records_bytes):
+            # records may have been partially written, check again the log before the next append
+            FileManager.record_counts.pop(network_path, None)
+            return False
+        
+        FileManager.write_stats["disk_writes"] += 1
+        return True
+    
+    # write the pending records of a record log, before it is read or rewritten
+    def _flush_records(network_path):
+        pending_records = FileManager.pending_records.pop(network_path, None)
+        if pending_records is None:
+            return
+        
+        records_bytes = b''.join(pending_records)
+        FileManager.pending_bytes -= len(records_bytes)
+        FileManager._append_to_log(network_path, records_bytes)
+    
+    # iterate over the records of a record log, from the oldest to the newest
+    def iter_records(network_path):
+        FileManager._flush_records(network_path)
+        data = FileManager._raw_file_read_view(FileManager.get_records_file_name(network_path))
+        if data is None:
+            return
+        
+        with memoryview(data) as view:
+            for record_start, record_end in FileManager._scan_records(data):
+                with view[record_start:record_end - FileManager.RECORD_TRAILER_STRUCT.size] as record_view:
+                    yield Serialize.from_bytes(record_view)
+    
+    # read at most max_records records located before the byte offset end_offset of a record log
+    # (None to read the last records of the log)
+    # only the returned records are read from the file, by following the trailers backward from end_offset
+    # return the records from the oldest to the newest, and the offset of the first returned record,
+    # to be used as end_offset to read the previous records (0 when the beginning of the log was reached)
+    # if end_offset is not the end of a valid record (for example after a compaction), return [] and 0
+    def read_records_before(network_path, end_offset=None, max_records=50):
+        FileManager._recover_records(network_path)
+        FileManager._flush_records(network_path)
+        return FileManager._raw_read_records_before(FileManager.get_records_file_name(network_path), end_offset, max_records)
+    
+    # the log is read backward by blocks, starting with READ_BLOCK_SIZE bytes and doubling the read size
+    READ_BLOCK_SIZE = 4096
+    
+    def _raw_read_records_before(filename, end_offset, max_records):
+        file_size = FileManager.backend.size(filename)
+        if file_size is None:
+            # empty log
+            return [], 0
+        if end_offset is None:
+            end_offset = file_size
+        if end_offset <= 0 or end_offset > file_size:
+            return [], 0
+        
+        # bytes of the log already read, from the offset data_start
+        data = b''
+        data_start = end_offset
+        def read_from(start):
+            nonlocal data, data_start
+            if start < data_start:
+                read_start = max(0, min(start, data_start - max(FileManager.READ_BLOCK_SIZE, len(data))))
+                data = FileManager.backend.read_range(filename, read_start, data_start) + data
+                data_start = read_start
+        
+        trailer_size = FileManager.RECORD_TRAILER_STRUCT.size
+        records = []
+        while end_offset > 0 and len(records) < max_records:
+            if end_offset < trailer_size:
+                return [], 0
+            read_from(end_offset - trailer_size)
+            crc, record_length = FileManager.RECORD_TRAILER_STRUCT.unpack_from(data, end_offset - trailer_size - data_start)
+            
+            record_start = end_offset - trailer_size - record_length
+            if record_start < 0:
+                return [], 0
+            read_from(record_start)
+            record_bytes = data[record_start - data_start:record_start - data_start + record_length]
+            if zlib.crc32(record_bytes) != crc \
+               or int.from_bytes(record_bytes[:Serialize.LENGTH_SIZE], byteorder='big') != record_length:
+                return [], 0
+            
+            records.append(Serialize.from_bytes(record_bytes))
+            end_offset = record_start
+        
+        records.reverse()
+        return records, end_offset
+    
+    # number of records of a record log
+    def records_count(network_path):
+        FileManager._recover_records(network_path)
+        return FileManager.record_counts[network_path]
+    
+    # replace all the records of a record log (atomic)
+    def write_records(network_path, records):
+        FileManager._flush_records(network_path)
+        filename = FileManager.get_records_file_name(network_path)
+        data = b''.join(FileManager._encode_record(record) for record in records)
+        if not FileManager._raw_file_write_atomic(filename, data):
+            return False
+        
+        FileManager.record_counts[network_path] = len(records)
+        FileManager._update_index_file_write(network_path)
+        FileManager._get_existing_files().add(filename)
+        return True
+    
+    # rewrite a record log without its invalid tail, keeping only the last max_records records if given (atomic)
+    # records are copied without being decoded
+    def compact_records(network_path, max_records=None):
+        FileManager._flush_records(network_path)
+        filename = FileManager.get_records_file_name(network_path)
+        data = FileManager._raw_file_read_view(filename)
+        if data is None:
+            return False
+        
+        records_pos = list(FileManager._scan_records(data))
+        if max_records is not None:
+            records_pos = records_pos[-max_records:] if max_records > 0 else []
+        
+        with memoryview(data) as view:
+            compacted_data = b''.join(view[record_start:record_end] for record_start, record_end in records_pos)
+        if not FileManager._raw_file_write_atomic(filename, compacted_data):
+            return False
+        
+        FileManager.record_counts[network_path] = len(records_pos)
+        return True
+    
+    # convert a file written by file_write and containing a list into a record log, with one record per item
+    # the original file is removed once the record log was written
+    def convert_to_records(network_path):
+        FileManager.flush_writes()
+        content = FileManager.file_read(network_path)
+        if type(content) is not list:
+            return False
+        
+        if not FileManager.write_records(network_path, content):
+            return False
+        
+        FileManager._cache_remove(network_path)
+        FileManager._get_existing_files().discard(FileManager.get_file_name(network_path))
+        FileManager.backend.remove(FileManager.get_file_name(network_path))
+        return True
+    
+    # ============ asynchronous API ============
+    
+    # enable the asynchronous API, with a thread pool of at most max_threads threads stopped with the reactor
+    # synchronous reads of a record log do not wait for its queued asynchronous operations,
+    # record logs should then be read with read_records_before_async
+    def enable_async_io(reactor, max_threads=4):
+        FileManager.reactor = reactor
+        FileManager.thread_pool = ThreadPool(1, max_threads, "FileManager")
+        FileManager.thread_pool.start()
+        # the thread pool is stopped once all the queued operations are done
+        reactor.addSystemEventTrigger('before', 'shutdown', FileManager.wait_async_operations)
+        reactor.addSystemEventTrigger('during', 'shutdown', FileManager.thread_pool.stop)
+    
+    # return a Deferred fired when no asynchronous operation is queued anymore, pending write-behind data is written first
+    # an operation waiting for a previous operation on the same path is only submitted to the thread pool
+    # when the previous operation is done, so the queued operations are waited until there is none left
+    def wait_async_operations():
+        FileManager.flush_writes()
+        if not FileManager.path_operations:
+            return defer.succeed(None)
+        
+        queued_operations = list(set(FileManager.path_operations.values()))
+        return defer.DeferredList(queued_operations).addCallback(lambda _: FileManager.wait_async_operations())
+    
+    # call function(*args) in the thread pool once the previous operations on the network paths are done
+    # return a Deferred fired in the reactor thread with the result of function
+    # function must only access the disk, not the FileManager state
+    def _run_ordered(network_paths, function, *args):
+        done = defer.Deferred()
+        previous_operations = []
+        for network_path in network_paths:
+            previous_done = FileManager.path_operations.get(network_path)
+            if previous_done is not None and previous_done not in previous_operations:
+                previous_operations.append(previous_done)
+            FileManager.path_operations[network_path] = done
+        
+        result = defer.Deferred()
+        def run(_):
+            if FileManager.thread_pool is None:
+                operation = defer.maybeDeferred(function, *args)
+            else:
+                operation = threads.deferToThreadPool(FileManager.reactor, FileManager.thread_pool, function, *args)
+            
+            def operation_done(value):
+                for network_path in network_paths:
+                    if FileManager.path_operations.get(network_path) is done:
+                        del FileManager.path_operations[network_path]
+                done.callback(None)
+                return value
+            operation.addBoth(operation_done)
+            operation.chainDeferred(result)
+        
+        if not previous_operations:
+            run(None)
+        elif len(previous_operations) == 1:
+            previous_operations[0].addCallback(run)
+        else:
+            defer.DeferredList(previous_operations).addCallback(run)
+        return result
+    
+    # asynchronous file_read: return a Deferred fired with the content of the file (None if it could not be read)
+    # the content of the last write is returned, even if this write is not on disk yet (read-your-writes)
+    def file_read_async(network_path):
+        cached = FileManager.read_cache.get(network_path)
+        if cached is not None:
+            FileManager.read_cache.move_to_end(network_path)
+            FileManager.read_cache_stats["hits"] += 1
+            return defer.succeed(cached[0])
+        FileManager.read_cache_stats["misses"] += 1
+        
+        content_bytes = FileManager._get_unwritten_bytes(network_path)
+        if content_bytes is FileManager.DELETED_FILE:
+            return defer.succeed(None)
+        if content_bytes is not None:
+            content = Serialize.from_bytes(content_bytes)
+            if content is not None:
+                FileManager._cache_add(network_path, content, FileManager._decoded_size(content))
+            return defer.succeed(content)
+        
+        filename = FileManager.get_file_name(network_path)
+        if filename not in FileManager._get_existing_files():
+            return defer.succeed(None)
+        
+        # the file is read and decoded in the thread pool
+        write_counter = FileManager.write_counter
+        def decoded(result):
+            content, content_size = result
+            if content is not None and FileManager.write_counter == write_counter:
+                FileManager._cache_add(network_path, content, content_size)
+            return content
+        return FileManager._run_ordered([network_path], FileManager._raw_file_read_content, filename).addCallback(decoded)
+    
+    # asynchronous file_write: return a Deferred fired with True when the content is written to disk (False on error)
+    # the new content is returned by file_read and file_read_async as soon as file_write_async was called
+    def file_write_async(network_path, new_content):
+        FileManager._update_index_file_write(network_path)
+        FileManager._get_existing_files().add(FileManager.get_file_name(network_path))
+        FileManager._cache_remove(network_path)
+        FileManager.write_stats["writes"] += 1
+        FileManager.write_counter += 1
+        
+        # a pending write-behind content is replaced by the new content
+        previous_bytes = FileManager.pending_files.pop(network_path, None)
+        if previous_bytes is not None:
+            FileManager.pending_bytes -= len(previous_bytes)
+            FileManager.write_stats["coalesced_writes"] += 1
+        
+        return FileManager._write_file_async(network_path, Serialize.to_bytes(new_content))
+    
+    # write serialized content in the thread pool, after the previous operations on the file
+    def _write_file_async(network_path, content_bytes):
+        FileManager.writing_files[network_path] = content_bytes
+        def written(result):
+            if FileManager.writing_files.get(network_path) is content_bytes:
+                del FileManager.writing_files[network_path]
+            FileManager.write_stats["disk_writes"] += 1
+            return result
+        
+        filename = FileManager.get_file_name(network_path)
+        return FileManager._run_ordered([network_path], FileManager._raw_file_write, filename, content_bytes).addBoth(written)
+    
+    # write the pending records of a record log in the thread pool
+    def _flush_records_async(network_path):
+        pending_records = FileManager.pending_records.pop(network_path, None)
+        if pending_records is None:
+            return defer.succeed(True)
+        
+        records_bytes = b''.join(pending_records)
+        FileManager.pending_bytes -= len(records_bytes)
+        return FileManager._append_to_log_async(network_path, records_bytes)
+    
+    # asynchronous _append_to_log: return a Deferred fired with True when the records are written
+    def _append_to_log_async(network_path, records_bytes):
+        def appended(result):
+            if result:
+                FileManager.write_stats["disk_writes"] += 1
+            else:
+                # records may have been partially written, check again the log before the next append
+                FileManager.record_counts.pop(network_path, None)
+            return result
+        
+        filename = FileManager.get_records_file_name(network_path)
+        return FileManager._run_ordered([network_path], FileManager._raw_file_append, filename, records_bytes).addCallback(appended)
+    
+    # asynchronous read_records_before: return a Deferred fired with the records and the cursor
+    # pending records are written first, so that they are also read
+    def read_records_before_async(network_path, end_offset=None, max_records=50):
+        FileManager._recover_records(network_path)
+        FileManager._flush_records_async(network_path)
+        filename = FileManager.get_records_file_name(network_path)
+        return FileManager._run_ordered([network_path], FileManager._raw_read_records_before, filename, end_offset, max_records)
+
+# perform unit tests if the module was not imported
+if __name__ == '__main__':
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.init_save_path(temp_dir + "/")
+        
+        # append and read records
+        path = "/chat/test_room"
+        records = [["2018-05-12 10:00:00", "user" + str(i), "message " + str(i)] for i in range(100)]
+        for record in records:
+            FileManager.append_record(path, record)
+        if list(FileManager.iter_records(path)) != records:
+            print("FAIL. Records not read correctly")
+        
+        # incomplete record at the end of the log (crash during an append)
+        FileManager.record_counts = {}
+        with open(FileManager.get_records_file_name(path), "ab") as file:
+            file.write(FileManager._encode_record(["incomplete"])[:-3])
+        if list(FileManager.iter_records(path)) != records:
+            print("FAIL. Incomplete record not ignored")
+        FileManager.append_record(path, ["after recovery"])
+        if list(FileManager.iter_records(path)) != records + [["after recovery"]]:
+            print("FAIL. Tail recovery not correct")
+        
+        # backward reading by pages
+        page, cursor = FileManager.read_records_before(path, max_records=30)
+        read_records = page
+        while cursor > 0:
+            page, cursor = FileManager.read_records_before(path, cursor, max_records=30)
+            read_records = page + read_records
+        if read_records != records + [["after recovery"]]:
+            print("FAIL. Records read backward not correct")
+        if FileManager.read_records_before(path, 5) != ([], 0) or FileManager.read_records_before(path, -5) != ([], 0) \
+           or FileManager.read_records_before("/no_log") != ([], 0):
+            print("FAIL. Invalid offset not detected")
+        
+        # compaction keeps the last records
+        for i in range(300):
+            FileManager.append_record(path, i, max_records=100)
+        kept_records = list(FileManager.iter_records(path))
+        if len(kept_records) < 100 or len(kept_records) >= 200 or kept_records[-1] != 299:
+            print("FAIL. Compaction not correct", len(kept_records))
+        if FileManager.records_count(path) != len(kept_records):
+            print("FAIL. Wrong records count")
+        
+        # conversion of a list written by file_write
+        path = "/chat/legacy_room"
+        FileManager.file_write(path, records)
+        if not FileManager.convert_to_records(path) or FileManager.file_exists(path):
+            print("FAIL. Legacy file not converted")
+        if list(FileManager.iter_records(path)) != records:
+            print("FAIL. Converted records not correct")
+        
+        # index journal and checkpoint
+        FileManager.local_index = None
+        FileManager.INDEX_CHECKPOINT_MIN_RECORDS = 10
+        for i in range(25):
+            FileManager._update_index_file_write("/index/" + str(i))
+        # 2 files already indexed, checkpoint when the 8th file is added (10 files), then 17 files added to the journal
+        if FileManager.index_journal_records != 17:
+            print("FAIL. Index checkpoint not done", FileManager.index_journal_records)
+        expected_file_list = dict(FileManager.local_index["file_list"])
+        FileManager.local_index = None
+        if FileManager._get_index()["file_list"] != expected_file_list or len(expected_file_list) != 27:
+            print("FAIL. Index not read correctly")
+        
+        # large files and record logs decoded from a memory mapping
+        path = "/wiki/large_page"
+        content = ["line " + str(i) + "\n" for i in range(50000)] + [b'\x00' * 100000, bytearray(b'\x01' * 10)]
+        FileManager.file_write(path, content)
+        FileManager._cache_remove(path)
+        if not isinstance(FileManager._raw_file_read_view(FileManager.get_file_name(path)), memoryview) \
+           or FileManager.file_read(path) != content:
+            print("FAIL. Large file not read correctly from a memory mapping")
+        path = "/chat/large_room"
+        for record in content:
+            FileManager.append_record(path, record)
+        FileManager.record_counts = {}
+        with open(FileManager.get_records_file_name(path), "ab") as file:
+            file.write(FileManager._encode_record(["incomplete"])[:-3])
+        if FileManager.records_count(path) != len(content) or list(FileManager.iter_records(path)) != content \
+           or not FileManager.compact_records(path, 10) \
+           or list(FileManager.iter_records(path)) != content[-10:]:
+            print("FAIL. Large record log not read correctly from a memory mapping")
+        
+        # files of older versions in the flat layout, moved when accessed or by the migration
+        FileManager.flat_layout_files = True
+        file_hash = hashlib.sha224("/flat/file".encode('utf-8')).hexdigest()
+        FileManager._raw_file_write(FileManager.root_dir + file_hash, Serialize.to_bytes("flat content"))
+        FileManager.existing_files = None
+        if FileManager.file_read("/flat/file") != "flat content" or os.path.isfile(FileManager.root_dir + file_hash):
+            print("FAIL. File in flat layout not moved when accessed")
+        file_hash = hashlib.sha224("/flat/log".encode('utf-8')).hexdigest()
+        FileManager._raw_file_write(FileManager.root_dir + file_hash + ".records", FileManager._encode_record("flat record"))
+        if not FileManager.migrate_to_sharded_layout() or FileManager.flat_layout_files \
+           or not os.path.isfile(FileManager._sharded_file_name(file_hash + ".records")):
+            print("FAIL. Flat layout not migrated")
+        if list(FileManager.iter_records("/flat/log")) != ["flat record"]:
+            print("FAIL. Migrated record log not correct")
+        
+        # removed file
+        FileManager.file_write("/removed/file", "content")
+        FileManager.append_record("/removed/file", "record")
+        FileManager.file_delete("/removed/file")
+        FileManager.local_index = None
+        if FileManager.file_exists("/removed/file") or FileManager.records_exist("/removed/file") \
+           or "/removed/file" in FileManager._get_index()["file_list"] or FileManager.file_size("/removed/file") != 0:
+            print("FAIL. File not removed")
+        
+        # existence answered from memory: a file written outside of FileManager is only found by a new scan
+        FileManager._raw_file_write(FileManager.get_file_name("/outside/file"), Serialize.to_bytes("outside"))
+        if FileManager.file_exists("/outside/file") or FileManager.file_read("/outside/file") is not None:
+            print("FAIL. Existence not answered from memory")
+        FileManager.scan_existing_files()
+        if not FileManager.file_exists("/outside/file") or not FileManager.records_exist("/chat/test_room") \
+           or FileManager.file_exists("/removed/file") or FileManager.records_exist("/removed/file"):
+            print("FAIL. Existing files not scanned")
+        
+        # read cache, with a budget of about 3 files (measured on a decoded content, lists built by the decoder
+        # may be larger than list literals)
+        FileManager.READ_CACHE_MAX_BYTES = 3 * FileManager._decoded_size(Serialize.from_bytes(Serialize.to_bytes(["x" * 1000])))
+        FileManager.read_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+        FileManager.read_cache = OrderedDict()
+        FileManager.read_cache_bytes = 0
+        for i in range(4):
+            FileManager.file_write("/cache/" + str(i), ["x" * 1000])
+        for i in [0, 1, 2, 0, 3, 0]:
+            FileManager.file_read("/cache/" + str(i))
+        stats = FileManager.get_read_cache_stats()
+        if stats["hits"] != 2 or stats["misses"] != 4 or stats["evictions"] != 1 or "/cache/1" in FileManager.read_cache:
+            print("FAIL. Wrong read cache stats", stats)
+        FileManager.file_write("/cache/0", "new content")
+        if FileManager.file_read("/cache/0") != "new content":
+            print("FAIL. Read cache not invalidated")
+        
+        # many small objects take much more memory than their serialized bytes
+        chat_messages = [[i, "2020-01-01 10:00:00", "user", "hello"] for i in range(100)]
+        if FileManager._decoded_size(chat_messages) < 5 * len(Serialize.to_bytes(chat_messages)):
+            print("FAIL. Decoded size underestimated")
+        
+        # write-behind, flushes are scheduled manually
+        scheduled_calls = []
+        class ScheduledCall():
+            def active(self):
+                return False
+        def call_later(delay, function):
+            scheduled_calls.append(function)
+            return ScheduledCall()
+        FileManager.enable_write_behind(call_later)
+        
+        path = "/wiki/page"
+        for i in range(10):
+            FileManager.file_write(path, "version " + str(i))
+            FileManager.append_record("/chat/test_room", i)
+        if FileManager.file_exists(path) is not True or FileManager.file_read(path) != "version 9":
+            print("FAIL. Pending write not visible")
+        if os.path.isfile(FileManager.get_file_name(path)):
+            print("FAIL. Data written before the flush")
+        if list(FileManager.iter_records("/chat/test_room"))[-10:] != list(range(10)):
+            print("FAIL. Pending records not visible")
+        if len(scheduled_calls) != 1:
+            print("FAIL. Wrong number of scheduled flushes")
+        
+        scheduled_calls[0]()
+        if FileManager._raw_file_read(FileManager.get_file_name(path)) != Serialize.to_bytes("version 9"):
+            print("FAIL. Pending write not flushed")
+        stats = FileManager.get_write_stats()
+        if stats["coalesced_writes"] != 18 or stats["pending_bytes"] != 0 or stats["flushes"] != 1:
+            print("FAIL. Wrong write stats", stats)
+        
+        # asynchronous API, with a reactor replaced by a queue of the calls done from the threads
+        if defer is not None:
+            import queue
+            class QueueReactor():
+                def __init__(self):
+                    self.calls = queue.Queue()
+                def callFromThread(self, function, *args):
+                    self.calls.put((function, args))
+                def addSystemEventTrigger(self, *args):
+                    pass
+            test_reactor = QueueReactor()
+            FileManager.enable_async_io(test_reactor)
+            
+            # run the calls from the threads until the Deferred is fired, return its result
+            def wait_result(deferred):
+                results = []
+                deferred.addBoth(results.append)
+                while not results:
+                    function, args = test_reactor.calls.get(timeout=10)
+                    function(*args)
+                return results[0]
+            
+            path = "/async/file"
+            writes = [FileManager.file_write_async(path, "version " + str(i)) for i in range(20)]
+            if FileManager.file_size(path) != len(Serialize.to_bytes("version 19")):
+                print("FAIL. Wrong size of a file written by the thread pool")
+            if FileManager.file_read(path) != "version 19" or wait_result(FileManager.file_read_async(path)) != "version 19":
+                print("FAIL. Asynchronous write not visible")
+            if wait_result(defer.gatherResults(writes)) != [True] * 20:
+                print("FAIL. Asynchronous writes failed")
+            if FileManager._raw_file_read(FileManager.get_file_name(path)) != Serialize.to_bytes("version 19") \
+               or FileManager.writing_files or FileManager.path_operations:
+                print("FAIL. Asynchronous writes not done in order")
+            
+            FileManager.read_cache = OrderedDict()
+            FileManager.read_cache_bytes = 0
+            if wait_result(FileManager.file_read_async(path)) != "version 19" or path not in FileManager.read_cache:
+                print("FAIL. Asynchronous read not correct")
+            
+            # pending records are written before the read
+            for i in range(10):
+                FileManager.append_record("/async/log", i)
+            if wait_result(FileManager.read_records_before_async("/async/log", None, 5)) \
+               != ([5, 6, 7, 8, 9], 5 * len(FileManager._encode_record(0))):
+                print("FAIL. Asynchronous records read not correct")
+            
+            # removal done after the queued operations
+            FileManager.file_write("/async/pending", "pending content")
+            FileManager.file_delete(path)
+            if FileManager.file_exists(path) or wait_result(FileManager.file_read_async(path)) is not None:
+                print("FAIL. Removed file still visible")
+            wait_result(FileManager.flush_writes())
+            wait_result(FileManager.read_records_before_async(path))
+            if os.path.isfile(FileManager.get_file_name(path)) \
+               or FileManager._raw_file_read(FileManager.get_file_name("/async/pending")) != Serialize.to_bytes("pending content"):
+                print("FAIL. Asynchronous flush not correct")
+            
+            # all queued writes are done before the thread pool is stopped (reactor shutdown)
+            path = "/async/shutdown"
+            for i in range(10):
+                FileManager.file_write_async(path, "version " + str(i))
+                FileManager.file_write("/async/shutdown_pending", "pending " + str(i))
+            wait_result(FileManager.wait_async_operations())
+            if FileManager.path_operations or FileManager.pending_files \
+               or FileManager._raw_file_read(FileManager.get_file_name(path)) != Serialize.to_bytes("version 9") \
+               or FileManager._raw_file_read(FileManager.get_file_name("/async/shutdown_pending")) != Serialize.to_bytes("pending 9"):
+                print("FAIL. Queued writes not done before shutdown")
+            
+            # without write-behind, records are also appended by the thread pool
+            FileManager.write_behind = False
+            path = "/async/direct_log"
+            for i in range(10):
+                FileManager.append_record(path, i)
+            if FileManager.path_operations.get(path) is None \
+               or wait_result(FileManager.read_records_before_async(path, None, 20)) != (list(range(10)), 0):
+                print("FAIL. Records not appended by the thread pool")
+            
+            FileManager.thread_pool.stop()
+            FileManager.thread_pool = None
+    
+    # SQLite storage backend
+    from storage_backends import SQLiteBackend
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.write_behind = False
+        FileManager.init_save_path(temp_dir + "/", SQLiteBackend)
+        
+        FileManager.file_write("/login/user", ["user", "key"])
+        FileManager.read_cache = OrderedDict()
+        FileManager.read_cache_bytes = 0
+        if FileManager.file_read("/login/user") != ["user", "key"] or not FileManager.file_exists("/login/user"):
+            print("FAIL. File not read from SQLite")
+        
+        path = "/chat/sqlite_room"
+        records = [["2018-05-12 10:00:00", "user", "message " + str(i)] for i in range(100)]
+        for record in records:
+            FileManager.append_record(path, record)
+        FileManager.record_counts = {}
+        FileManager.backend.append(FileManager.get_records_file_name(path), FileManager._encode_record(["incomplete"])[:-3])
+        if FileManager.records_count(path) != 100 or list(FileManager.iter_records(path)) != records:
+            print("FAIL. SQLite record log not recovered")
+        
+        # backward reading by small blocks
+        FileManager.READ_BLOCK_SIZE = 100
+        page, cursor = FileManager.read_records_before(path, max_records=30)
+        read_records = page
+        while cursor > 0:
+            page, cursor = FileManager.read_records_before(path, cursor, max_records=30)
+            read_records = page + read_records
+        if read_records != records:
+            print("FAIL. SQLite records read backward not correct")
+        
+        FileManager.file_delete("/login/user")
+        FileManager.init_save_path(temp_dir + "/", SQLiteBackend)
+        if FileManager.file_exists("/login/user") or FileManager.list_files() != [path] or FileManager.flat_layout_files:
+            print("FAIL. SQLite index not correct", FileManager.list_files())
+        if [name for name in os.listdir(temp_dir) if not name.startswith(SQLiteBackend.DATABASE_NAME)]:
+            print("FAIL. Files written outside of the SQLite database")
+        FileManager.backend.close()
+        FileManager.backend = None
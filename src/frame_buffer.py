@@ -0,0 +1,168 @@
+'''
+    Receive buffer of a connection, splitting the received stream of bytes into frames
+    Each frame is one serialized message, prefixed by its total length (see Serialize.to_bytes)
+
+    Received data is appended at the end of the buffer, and frames are read from a read index
+    Read frames are not removed immediately from the buffer:
+      the consumed part is removed only from time to time (compaction), so that each byte is moved at most once on average
+    Frames are returned as memoryviews on the buffer, so they are not copied before deserialization
+'''
+
+import struct
+
+class FrameLengthException(Exception): pass
+class FrameTooLongException(FrameLengthException): pass
+
+class FrameBuffer():
+    
+    # prefix size for the total length of a frame, same as Serialize.LENGTH_SIZE
+    FRAME_PREFIX_SIZE = 4
+    FRAME_PREFIX_STRUCT = struct.Struct('>I')
+    
+    # shortest possible frame : total length and serialization version
+    MIN_FRAME_LENGTH = FRAME_PREFIX_SIZE + 1
+    
+    # consumed bytes are removed when they are at least half of the buffer, and at least this size
+    COMPACTION_MIN_SIZE = 64 * 1024
+    
+    # max_frame_length : frames announcing a longer length are rejected as soon as their length prefix is received
+    def __init__(self, max_frame_length=None):
+        self.buffer = bytearray(b'')
+        self.max_frame_length = max_frame_length
+        
+        # index of the first byte not read yet
+        self.read_idx = 0
+    
+    # add received data at the end of the buffer
+    # memoryviews returned by next_frame() must have been released before calling this function
+    def append(self, data):
+        self.compact()
+        self.buffer += data
+    
+    # remove the consumed part of the buffer if it is big enough
+    def compact(self):
+        if self.read_idx == 0:
+            return
+        
+        if self.read_idx == len(self.buffer):
+            # everything was consumed, usual case when all messages were processed
+            del self.buffer[:]
+            self.read_idx = 0
+        elif self.read_idx >= FrameBuffer.COMPACTION_MIN_SIZE and 2*self.read_idx >= len(self.buffer):
+            del self.buffer[:self.read_idx]
+            self.read_idx = 0
+    
+    # number of received bytes not read yet (complete frames and beginning of the next frame)
+    def pending_bytes(self):
+        return len(self.buffer) - self.read_idx
+    
+    # length of the next frame, or None if its length prefix was not received yet
+    def next_frame_length(self):
+        if len(self.buffer) - self.read_idx < FrameBuffer.FRAME_PREFIX_SIZE:
+            return None
+        
+        frame_length, = FrameBuffer.FRAME_PREFIX_STRUCT.unpack_from(self.buffer, self.read_idx)
+        if frame_length < FrameBuffer.MIN_FRAME_LENGTH:
+            # the stream cannot be split into frames anymore
+            raise FrameLengthException
+        if self.max_frame_length is not None and frame_length > self.max_frame_length:
+            raise FrameTooLongException
+        return frame_length
+    
+    # True if the next frame was completely received
+    # a frame with an invalid length is never complete (next_frame() raises the exception)
+    def has_complete_frame(self):
+        try:
+            frame_length = self.next_frame_length()
+        except FrameLengthException:
+            return False
+        return frame_length is not None and len(self.buffer) - self.read_idx >= frame_length
+    
+    # return the next complete frame as a memoryview, or None if no complete frame was received yet
+    # the memoryview must be released by the caller (for example with a "with" statement) before the next append()
+    def next_frame(self):
+        frame_length = self.next_frame_length()
+        if frame_length is None or len(self.buffer) - self.read_idx < frame_length:
+            return None
+        
+        frame_end = self.read_idx + frame_length
+        with memoryview(self.buffer) as view:
+            frame = view[self.read_idx:frame_end]
+        self.read_idx = frame_end
+        return frame
+
+# perform unit tests if the module was not imported
+if __name__ == '__main__':
+    def frame(content):
+        return (len(content) + FrameBuffer.MIN_FRAME_LENGTH).to_bytes(FrameBuffer.FRAME_PREFIX_SIZE, byteorder='big') \
+               + b'\0' + content
+    
+    # several frames received in one chunk
+    frames = [frame(b'a' * i) for i in range(100)]
+    receive_buffer = FrameBuffer()
+    receive_buffer.append(b''.join(frames))
+    for expected in frames:
+        with receive_buffer.next_frame() as data:
+            if data != expected:
+                print("FAIL. Wrong frame", bytes(data), expected)
+    if receive_buffer.next_frame() is not None or receive_buffer.pending_bytes() != 0:
+        print("FAIL. Buffer not empty")
+    
+    # frames received one byte at a time, the buffer must be compacted when all data was read
+    stream = b''.join(frames)
+    received = []
+    for i in range(len(stream)):
+        receive_buffer.append(stream[i:i+1])
+        data = receive_buffer.next_frame()
+        if data is not None:
+            received.append(bytes(data))
+            data.release()
+    if received != frames:
+        print("FAIL. Frames received byte per byte are not correct")
+    receive_buffer.append(b'')
+    if len(receive_buffer.buffer) != 0:
+        print("FAIL. Buffer not compacted")
+    
+    # large frame received in pieces, with the beginning of the next frame
+    large_frame = frame(b'x' * 1000000)
+    receive_buffer.append(large_frame[:500000])
+    if receive_buffer.next_frame() is not None:
+        print("FAIL. Incomplete frame returned")
+    receive_buffer.append(large_frame[500000:] + frames[10][:3])
+    with receive_buffer.next_frame() as data:
+        if data != large_frame:
+            print("FAIL. Large frame not correct")
+    receive_buffer.append(frames[10][3:])
+    with receive_buffer.next_frame() as data:
+        if data != frames[10]:
+            print("FAIL. Frame following a large frame not correct")
+    if len(receive_buffer.buffer) > FrameBuffer.COMPACTION_MIN_SIZE + len(frames[10]):
+        print("FAIL. Buffer not compacted after a large frame")
+    
+    # frame length shorter than the length prefix
+    receive_buffer = FrameBuffer()
+    receive_buffer.append(b'\0\0\0\0')
+    try:
+        receive_buffer.next_frame()
+    except FrameLengthException:
+        # in this test, this is the normal case
+        pass
+    else:
+        print("FAIL. FrameLengthException was not raised.")
+    
+    # frame length longer than the maximum, rejected before the frame is received
+    receive_buffer = FrameBuffer(max_frame_length=1000)
+    receive_buffer.append(frame(b'a' * 900)[:5])
+    if receive_buffer.has_complete_frame():
+        print("FAIL. Incomplete frame considered complete")
+    receive_buffer = FrameBuffer(max_frame_length=1000)
+    receive_buffer.append(frame(b'a' * 1000)[:5])
+    if receive_buffer.has_complete_frame():
+        print("FAIL. Frame too long considered complete")
+    try:
+        receive_buffer.next_frame()
+    except FrameTooLongException:
+        # in this test, this is the normal case
+        pass
+    else:
+        print("FAIL. FrameTooLongException was not raised.")
@@ -0,0 +1,69 @@
+'''
+    Latency measurements, to follow the tail latency of the server (percentiles)
+'''
+
+class LatencyStats():
+    '''
+        Latency samples of one operation
+        Only the last max_samples samples are kept to compute percentiles, count and maximum are kept for all samples
+        Latencies are in seconds
+    '''
+    
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.samples = []
+        
+        # index of the next sample to replace when max_samples is reached
+        self.next_idx = 0
+        
+        self.count = 0
+        self.max = 0.0
+    
+    def add(self, latency):
+        if len(self.samples) < self.max_samples:
+            self.samples.append(latency)
+        else:
+            self.samples[self.next_idx] = latency
+            self.next_idx = (self.next_idx + 1) % self.max_samples
+        
+        self.count += 1
+        if latency > self.max:
+            self.max = latency
+    
+    # percentile (between 0 and 100) of the kept samples, 0 if there is no sample
+    def percentile(self, percent):
+        return LatencyStats.sorted_percentile(sorted(self.samples), percent)
+    
+    def sorted_percentile(sorted_samples, percent):
+        if not sorted_samples:
+            return 0.0
+        return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * percent / 100))]
+    
+    # dictionary with the usual percentiles
+    def summary(self):
+        sorted_samples = sorted(self.samples)
+        summary = {"count": self.count, "max": self.max}
+        for name, percent in [("p50", 50), ("p90", 90), ("p99", 99), ("p999", 99.9)]:
+            summary[name] = LatencyStats.sorted_percentile(sorted_samples, percent)
+        return summary
+    
+    def reset(self):
+        self.samples = []
+        self.next_idx = 0
+        self.count = 0
+        self.max = 0.0
+
+# perform unit tests if the module was not imported
+if __name__ == '__main__':
+    stats = LatencyStats(max_samples=100)
+    for i in range(1000):
+        stats.add(i % 100 / 1000)
+    summary = stats.summary()
+    if summary["count"] != 1000 or summary["max"] != 0.099 or summary["p50"] != 0.05 or summary["p99"] != 0.099:
+        print("FAIL. Wrong summary", summary)
+    if len(stats.samples) != 100:
+        print("FAIL. Too many samples kept")
+    
+    stats.reset()
+    if stats.summary()["count"] != 0 or stats.percentile(99) != 0.0:
+        print("FAIL. Reset not correct")
@@ -0,0 +1,151 @@
+'''
+    Index of the links between pages (for example wiki pages), stored with FileManager
+
+    Links of each page (forward links), also used to know which pages were indexed
+      index_path + "links/" + page_path : [target page paths]
+    Pages linking to each page (backlinks)
+      index_path + "backlinks/" + page_path : [source page paths]
+    Indexed pages without any backlink
+      index_path + "orphans" : {page_path: 0}
+
+    Links are written [[page name]], and link to link_prefix + page name
+    Links of a page to itself are ignored
+'''
+
+import re
+
+from file_manager import FileManager
+
+class LinkIndex():
+    
+    # same syntax as format_wiki_syntax() in widgets/custom_labels.py
+    LINK_PATTERN = re.compile(r'\[\[(\S*)\]\]')
+    
+    def __init__(self, index_path, link_prefix):
+        self.index_path = index_path
+        self.link_prefix = link_prefix
+    
+    def links_path(self, page_path):
+        return self.index_path + "links/" + page_path
+    
+    def backlinks_path(self, page_path):
+        return self.index_path + "backlinks/" + page_path
+    
+    def _read(self, network_path, default):
+        if FileManager.file_exists(network_path):
+            return FileManager.file_read(network_path)
+        return default
+    
+    # pages linked by a text, without duplicates
+    def get_links(self, page_path, content):
+        links = set(self.link_prefix + name for name in LinkIndex.LINK_PATTERN.findall(content) if name)
+        links.discard(page_path)
+        return links
+    
+    # update the index with the new content of a page
+    # only the backlinks of the links added or removed since the previous content are written
+    def update_page(self, page_path, content):
+        previous_links = self._read(self.links_path(page_path), None)
+        is_new_page = previous_links is None
+        previous_links = set(previous_links or [])
+        links = self.get_links(page_path, content)
+        
+        # pages which are not orphans anymore, and new orphans
+        linked_pages = set()
+        orphan_pages = set()
+        
+        for target_path in links - previous_links:
+            # copy of the list, which can be shared with the FileManager read cache
+            backlinks = list(self._read(self.backlinks_path(target_path), []))
+            backlinks.append(page_path)
+            FileManager.file_write(self.backlinks_path(target_path), backlinks)
+            linked_pages.add(target_path)
+        
+        for target_path in previous_links - links:
+            backlinks = list(self._read(self.backlinks_path(target_path), []))
+            if page_path in backlinks:
+                backlinks.remove(page_path)
+            if backlinks:
+                FileManager.file_write(self.backlinks_path(target_path), backlinks)
+            else:
+                FileManager.file_delete(self.backlinks_path(target_path))
+                if FileManager.file_exists(self.links_path(target_path)):
+                    orphan_pages.add(target_path)
+        
+        if is_new_page or links != previous_links:
+            FileManager.file_write(self.links_path(page_path), sorted(links))
+        
+        if is_new_page and not FileManager.file_exists(self.backlinks_path(page_path)):
+            orphan_pages.add(page_path)
+        
+        orphans = self._read(self.index_path + "orphans", {})
+        if any(target_path in orphans for target_path in linked_pages) or orphan_pages:
+            orphans = dict(orphans)
+            for target_path in linked_pages:
+                orphans.pop(target_path, None)
+            for target_path in orphan_pages:
+                orphans[target_path] = 0
+            FileManager.file_write(self.index_path + "orphans", orphans)
+    
+    # pages linking to a page
+    def read_backlinks(self, page_path):
+        return sorted(self._read(self.backlinks_path(page_path), []))
+    
+    # indexed pages without any backlink
+    def list_orphans(self):
+        return sorted(self._read(self.index_path + "orphans", {}))
+    
+    # rebuild the complete index from the content of the pages
+    # pages is an iterable of (page_path, content), for example reading all the pages from FileManager
+    # the previous index is removed, so this should be done while the index is not used (server stopped)
+    def rebuild(self, pages):
+        for network_path in FileManager.list_files(self.index_path):
+            FileManager.file_delete(network_path)
+        
+        all_backlinks = {}
+        page_paths = []
+        for page_path, content in pages:
+            links = self.get_links(page_path, content)
+            FileManager.file_write(self.links_path(page_path), sorted(links))
+            for target_path in links:
+                all_backlinks.setdefault(target_path, []).append(page_path)
+            page_paths.append(page_path)
+        
+        for target_path, backlinks in all_backlinks.items():
+            FileManager.file_write(self.backlinks_path(target_path), backlinks)
+        orphans = {page_path: 0 for page_path in page_paths if page_path not in all_backlinks}
+        FileManager.file_write(self.index_path + "orphans", orphans)
+        return len(page_paths)
+
+# perform unit tests if the module was not imported
+if __name__ == '__main__':
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.init_save_path(temp_dir + "/")
+        
+        link_index = LinkIndex("/index/links/", "/wiki/")
+        link_index.update_page("/wiki/home", "Welcome, see [[cats]] and [[dogs]] and [[home]]")
+        link_index.update_page("/wiki/cats", "Cats, not [[dogs]]")
+        link_index.update_page("/wiki/dogs", "Dogs")
+        link_index.update_page("/wiki/lost", "Nobody links here, see [[cats]]")
+        
+        if link_index.read_backlinks("/wiki/dogs") != ["/wiki/cats", "/wiki/home"]:
+            print("FAIL. Wrong backlinks", link_index.read_backlinks("/wiki/dogs"))
+        if link_index.list_orphans() != ["/wiki/home", "/wiki/lost"]:
+            print("FAIL. Wrong orphans", link_index.list_orphans())
+        
+        # links removed and added
+        link_index.update_page("/wiki/home", "Welcome, see [[cats]] and [[lost]]")
+        if link_index.read_backlinks("/wiki/dogs") != ["/wiki/cats"] or link_index.list_orphans() != ["/wiki/home"]:
+            print("FAIL. Link index not updated")
+        link_index.update_page("/wiki/cats", "Cats")
+        if link_index.list_orphans() != ["/wiki/dogs", "/wiki/home"]:
+            print("FAIL. Page without backlinks not orphan", link_index.list_orphans())
+        
+        # rebuild gives the same index
+        pages = [("/wiki/home", "Welcome, see [[cats]] and [[lost]]"), ("/wiki/cats", "Cats"), ("/wiki/dogs", "Dogs"),
+                 ("/wiki/lost", "Nobody links here, see [[cats]]")]
+        if link_index.rebuild(pages) != 4 or link_index.list_orphans() != ["/wiki/dogs", "/wiki/home"] \
+           or link_index.read_backlinks("/wiki/cats") != ["/wiki/home", "/wiki/lost"]:
+            print("FAIL. Rebuilt index not correct")
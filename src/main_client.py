@@ -43,6 +43,8 @@ from apps.desktop_client import DesktopClient
 # currently needed to set localhost
 from network_interface import NetworkInterface
 
+from file_manager import FileManager
+
 # Kivy does not include fonts supporting japanese
 # A font file must be provided manually
 # NOTO font downloaded from here: https://www.google.com/get/noto/help/cjk/
@@ -59,4 +61,8 @@ if __name__ == '__main__':
     if custom_args.use_localhost:
         NetworkInterface.set_server_to_localhost()
     
+    # local files of the client (for example the cache of wiki pages), the client also works without them
+    if not FileManager.init_save_path("pykanet_client_data/"):
+        print("FileManager initialization... [FAILED]. Local files not used.")
+    
     MainClient().run()
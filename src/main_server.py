@@ -5,21 +5,43 @@
 
 from twisted.internet import reactor
 from twisted.internet import protocol
+from twisted.internet import task
 
 from message_passing_protocol import MessagePassingProtocol
 from server_services import ServerServices
 from file_manager import FileManager
+import server_config
 
 port_to_listen = 8883
 
 def main():
     # initialize file saving directories
-    if not FileManager.init_save_path():
+    if not FileManager.init_save_path(server_config.save_path, server_config.storage_backend_class):
         # file saving not working correctly, we should not run the server
         print("FileManager initialization... [FAILED]. Stopping.")
         return
     else:
         print("FileManager initialization... [OK]")
+    
+    # existence of files is then answered from memory, without disk access
+    print("FileManager scan of existing files... [OK] (%d files)" % FileManager.scan_existing_files())
+    
+    # file writes are grouped and written to disk regularly, pending writes are written when the server is stopped
+    FileManager.enable_write_behind(reactor.callLater)
+    reactor.addSystemEventTrigger('before', 'shutdown', FileManager.flush_writes)
+    
+    # disk accesses of the asynchronous API are done by a thread pool, so that a slow disk does not block the server
+    FileManager.enable_async_io(reactor)
+    reactor.addSystemEventTrigger('after', 'shutdown', FileManager.backend.close)
+    
+    # files saved by older versions directly in the data directory are moved to sub-directories in the background
+    if FileManager.flat_layout_files:
+        def migrate_layout():
+            if FileManager.migrate_to_sharded_layout(max_files = 100):
+                print("FileManager migration to sharded layout... [OK]")
+                migration_task.stop()
+        migration_task = task.LoopingCall(migrate_layout)
+        migration_task.start(0.05)
         
     factory = protocol.ServerFactory()
     factory.protocol = MessagePassingProtocol
@@ -1,7 +1,11 @@
 
-from twisted.internet import protocol, task
+from twisted.internet import protocol, task, reactor
 
-from network_message import NetworkMessage
+from network_message import NetworkMessage, InvalidContentException
+from serialization_utils import Serialize
+from frame_buffer import FrameBuffer, FrameLengthException, FrameTooLongException
+from latency_stats import LatencyStats
+from collections import deque
 import time
 
 class MessagePassingProtocol(protocol.Protocol):
@@ -10,6 +14,47 @@ class MessagePassingProtocol(protocol.Protocol):
         One instance of this class is created for each new connection received by the server
     '''
     
+    # maximum length of one received message, longer messages are rejected as soon as their length is received
+    MAX_MESSAGE_LENGTH = 32 * 1024 * 1024
+    
+    # stop reading a connection (backpressure) when it has more received bytes than this waiting to be processed
+    PAUSE_THRESHOLD = 1024 * 1024
+    
+    # maximum number of received bytes buffered by one connection, the connection is closed above this limit
+    CONNECTION_BUFFER_BUDGET = MAX_MESSAGE_LENGTH + 2 * PAUSE_THRESHOLD
+    
+    # maximum number of received bytes buffered by all connections together
+    # when it is reached, connections trying to add more data are closed
+    GLOBAL_BUFFER_BUDGET = 256 * 1024 * 1024
+    
+    # received bytes currently buffered by all connections
+    global_buffered_bytes = 0
+    
+    # fairness between connections: maximum number of messages and maximum time (in seconds)
+    # used to process the messages of one connection in one reactor turn
+    # remaining messages are processed in a next reactor turn, after other connections had a chance to be processed
+    MAX_MESSAGES_PER_TURN = 50
+    MAX_TIME_PER_TURN = 0.002
+    
+    # counters of rejected, paused connections, and of processing postponed to a next reactor turn
+    # counters of received messages dropped because they could not be decoded
+    # counters of sent messages, and of transport writes used to send them
+    stats = {"rejected_messages": 0, "rejected_connections": 0, "paused_connections": 0, "resumed_connections": 0,
+             "deferred_turns": 0, "invalid_messages": 0, "sent_messages": 0, "sent_writes": 0, "sent_bytes": 0}
+    
+    # delay between the reception of a message and the start of its processing
+    queue_latency = LatencyStats()
+    
+    # return a copy of the counters, with the current buffer usage and the queue latency percentiles
+    def get_stats():
+        stats = dict(MessagePassingProtocol.stats)
+        stats["global_buffered_bytes"] = MessagePassingProtocol.global_buffered_bytes
+        stats["queue_latency"] = MessagePassingProtocol.queue_latency.summary()
+        if stats["sent_writes"] > 0:
+            stats["writes_per_message"] = stats["sent_writes"] / stats["sent_messages"]
+            stats["bytes_per_write"] = stats["sent_bytes"] / stats["sent_writes"]
+        return stats
+    
     # called by Twisted when the connection is created
     def connectionMade(self):
         # disable Nagle's algorithm
@@ -17,8 +62,35 @@ class MessagePassingProtocol(protocol.Protocol):
         
         self.transport.setTcpKeepAlive(True)
         
-        # bytearray buffer to receive data, initialized as an empty array
-        self.receive_buffer = bytearray(b'')
+        # buffer to receive data, split into complete messages
+        self.receive_buffer = FrameBuffer(max_frame_length = MessagePassingProtocol.MAX_MESSAGE_LENGTH)
+        
+        # number of bytes of this connection counted in global_buffered_bytes
+        self.buffered_bytes = 0
+        
+        # True when reading was paused because too much received data is waiting to be processed
+        self.is_paused = False
+        
+        # True when the connection was closed because it did not respect the limits
+        self.is_rejected = False
+        
+        # processing of remaining messages scheduled in a next reactor turn (twisted DelayedCall)
+        self.processing_call = None
+        
+        # messages to send, written together once per reactor turn
+        self.send_queue = []
+        self.flush_call = None
+        
+        # reception time of received data, to measure the queue latency of messages
+        # each item is (total number of bytes received after this data, reception time)
+        self.reception_times = deque()
+        self.received_bytes = 0
+        self.processed_bytes = 0
+        
+        # serialization version of sent messages
+        # version 0 (the only one known by older nodes) until the other end shows that it knows a newer version,
+        # with the supported versions it sends at connection, or with a message received in a newer version
+        self.serial_version = min(Serialize.SUPPORTED_VERSIONS)
         
         # callbacks to call when messages are received or the connection is lost
         # these callbacks are initialized by server_services class in the case of the server-end of a connection
@@ -30,6 +102,8 @@ class MessagePassingProtocol(protocol.Protocol):
         # time of last message
         self.last_message_time = time.monotonic()
         
+        self.send_serial_versions()
+        
         if self.factory.is_server:
             self.factory.server_services.connection_made(self)
         else:
@@ -37,54 +111,197 @@ class MessagePassingProtocol(protocol.Protocol):
             self.activate_keep_alive()
     
     # send a NetworkMessage to the other end of the connection 
+    # the message is queued, and all messages queued during the same reactor turn are written together
     def send_message(self, message):
-        self.transport.write(message.to_bytes())
+        self.send_bytes(message.to_bytes(self.serial_version))
+    
+    # send the same NetworkMessage to all the clients, except excluded_client
+    # the message is serialized only once for each serialization version used by the clients,
+    # and the same bytes are queued on all the connections
+    def broadcast_message(clients, message, excluded_client = None):
+        encoded_messages = {}
+        for client in clients:
+            if client is excluded_client:
+                continue
+            message_bytes = encoded_messages.get(client.serial_version)
+            if message_bytes is None:
+                message_bytes = bytes(message.to_bytes(client.serial_version))
+                encoded_messages[client.serial_version] = message_bytes
+            client.send_bytes(message_bytes)
+    
+    # send an already serialized message
+    def send_bytes(self, message_bytes):
+        self.send_queue.append(message_bytes)
+        MessagePassingProtocol.stats["sent_messages"] += 1
+        if self.flush_call is None:
+            self.flush_call = reactor.callLater(0, self.flush)
+    
+    # write all queued messages to the transport
+    # called automatically in the next reactor turn, can be called directly for latency-critical messages
+    def flush(self):
+        if self.flush_call is not None:
+            if self.flush_call.active():
+                self.flush_call.cancel()
+            self.flush_call = None
+        
+        if not self.send_queue:
+            return
+        
+        MessagePassingProtocol.stats["sent_writes"] += 1
+        MessagePassingProtocol.stats["sent_bytes"] += sum(len(message_bytes) for message_bytes in self.send_queue)
+        self.transport.writeSequence(self.send_queue)
+        self.send_queue = []
     
     # called by Twisted when some data is received on the connection
     # transform the raw stream of data into messages, and send the messages to the correct service
     def dataReceived(self, data):
+        if self.is_rejected:
+            # connection is being closed, ignore remaining data
+            return
+        
+        # check the buffer budgets before adding data to the buffer
+        if self.buffered_bytes + len(data) > MessagePassingProtocol.CONNECTION_BUFFER_BUDGET \
+          or MessagePassingProtocol.global_buffered_bytes + len(data) > MessagePassingProtocol.GLOBAL_BUFFER_BUDGET:
+            self.reject_connection()
+            return
+        
         # add all received data to the buffer
-        self.receive_buffer += data
+        self.receive_buffer.append(data)
+        self.received_bytes += len(data)
+        self.reception_times.append((self.received_bytes, time.monotonic()))
+        self.update_buffered_bytes()
+        
+        if self.processing_call is None:
+            self.process_messages()
+        # else: messages already waiting are processed first, in the next reactor turn
+        
+        self.update_buffered_bytes()
+        self.update_backpressure()
+    
+    # called by the reactor to continue processing the messages of the receive buffer
+    def resume_processing(self):
+        self.processing_call = None
+        self.process_messages()
+        self.update_buffered_bytes()
+        self.update_backpressure()
+    
+    # process the complete messages of the receive buffer
+    # at most MAX_MESSAGES_PER_TURN messages or MAX_TIME_PER_TURN seconds are used,
+    # so that a client sending a lot of messages does not block other connections
+    def process_messages(self):
+        start_time = time.monotonic()
+        processed_nb = 0
         
-        # we need an infinite loop here to process all the already received messages as soon as possible
-        # the loop stops when there is no more "complete messages" in the buffer
-        # note for later : infinite loop here could be a problem if the buffer contains really a lot of messages
         while True:
-            # exit the loop if there is no more message, or if the bytes for the total message length are not received
-            if len(self.receive_buffer) < NetworkMessage.MESSAGE_PREFIX_SIZE:
+            if processed_nb >= MessagePassingProtocol.MAX_MESSAGES_PER_TURN \
+              or time.monotonic() - start_time >= MessagePassingProtocol.MAX_TIME_PER_TURN:
+                # continue later if there are remaining messages, after other events of the reactor
+                if not self.is_rejected and self.receive_buffer.pending_bytes() > 0:
+                    MessagePassingProtocol.stats["deferred_turns"] += 1
+                    self.processing_call = reactor.callLater(0, self.resume_processing)
                 return
+            processed_nb += 1
             
-            message_length = int.from_bytes(self.receive_buffer[:NetworkMessage.MESSAGE_PREFIX_SIZE], byteorder='big')
+            # get the next complete message, without copying it out of the buffer
+            try:
+                next_message_data = self.receive_buffer.next_frame()
+            except FrameTooLongException:
+                # announced message is too long, reject it before receiving it
+                MessagePassingProtocol.stats["rejected_messages"] += 1
+                self.reject_connection()
+                return
+            except FrameLengthException:
+                # invalid message length, the stream cannot be read anymore
+                self.reject_connection()
+                return
             
-            # exit the loop if a complete message is not received yet
-            if len(self.receive_buffer) < message_length:
+            # exit the loop if there is no more message, or if a complete message is not received yet
+            if next_message_data is None:
                 return
             
-            # next_message is received, extract it and remove it from the buffer
-            next_message_data = self.receive_buffer[:message_length]
-            self.receive_buffer = self.receive_buffer[message_length:]
+            self.record_queue_latency(len(next_message_data))
             
+            # the message is routed while its content is still in the buffer, the content is decoded only if it is used
+            # the memoryview must be released before the next data is added to the buffer
             message = NetworkMessage()
-            message.from_bytes(next_message_data)
-            
-            # update the time of the last received message
-            self.last_message_time = time.monotonic()
-            
-            # ignore keep-alive messages
-            if message.command == "KEEP_ALIVE":
-                continue
-            
-            # initialize the client name if not already done
-            # TODO : this is also here that we will check message signatures
-            #       (so that all applications receive only messages with valid signatures)
-            if self.username == "":
-                self.username = message.username
-            
+            with next_message_data:
+                message.from_bytes(next_message_data)
+                self.route_message(message)
+    
+    # transmit a received message to the service (server end of the connection) or to the local client
+    def route_message(self, message):
+        if message.serial_version is not None and message.serial_version > self.serial_version:
+            self.serial_version = message.serial_version
+        
+        # update the time of the last received message
+        self.last_message_time = time.monotonic()
+        
+        # ignore keep-alive messages, except the supported serialization versions sent at connection
+        if message.command == "KEEP_ALIVE":
+            if self.serial_version < Serialize.SERIAL_VERSION:
+                self.read_serial_versions(message)
+            return
+        
+        # drop messages that could not be decoded
+        if message.command is None:
+            MessagePassingProtocol.stats["invalid_messages"] += 1
+            return
+        
+        # initialize the client name if not already done
+        # TODO : this is also here that we will check message signatures
+        #       (so that all applications receive only messages with valid signatures)
+        if self.username == "":
+            self.username = message.username
+        
+        # a message whose content cannot be decoded is dropped when its content is used
+        # the content is copied if it was not decoded, because the message may be kept after the buffer is released
+        try:
             if self.factory.is_server:
                 self.factory.server_services.receive_message(self, message)
             else:
                 # case of client end of the connection
                 self.factory.network_interface.receive_message(message)
+        except InvalidContentException:
+            MessagePassingProtocol.stats["invalid_messages"] += 1
+        finally:
+            message.detach_content()
+    
+    # record the delay since the reception of the last part of the message
+    def record_queue_latency(self, message_length):
+        self.processed_bytes += message_length
+        while self.reception_times[0][0] < self.processed_bytes:
+            self.reception_times.popleft()
+        MessagePassingProtocol.queue_latency.add(time.monotonic() - self.reception_times[0][1])
+    
+    # update the count of buffered bytes of this connection in the global count
+    def update_buffered_bytes(self):
+        buffered_bytes = self.receive_buffer.pending_bytes()
+        MessagePassingProtocol.global_buffered_bytes += buffered_bytes - self.buffered_bytes
+        self.buffered_bytes = buffered_bytes
+    
+    # pause reading when complete messages waiting to be processed exceed the threshold, resume when they are processed
+    # a connection waiting for the end of an incomplete message is never paused, it needs more data to make progress
+    def update_backpressure(self):
+        if self.is_rejected:
+            return
+        
+        waiting = self.receive_buffer.has_complete_frame() and self.buffered_bytes > MessagePassingProtocol.PAUSE_THRESHOLD
+        if waiting and not self.is_paused:
+            self.is_paused = True
+            MessagePassingProtocol.stats["paused_connections"] += 1
+            self.transport.pauseProducing()
+        elif not waiting and self.is_paused:
+            self.is_paused = False
+            MessagePassingProtocol.stats["resumed_connections"] += 1
+            self.transport.resumeProducing()
+    
+    # close a connection that did not respect the limits, and free its buffer
+    def reject_connection(self):
+        self.is_rejected = True
+        MessagePassingProtocol.stats["rejected_connections"] += 1
+        self.receive_buffer = FrameBuffer()
+        self.update_buffered_bytes()
+        self.lose_connection()
         
     # activate application-level keep alive messages
     # it needs to be activated for connections to a service that keeps running for a long time
@@ -99,6 +316,26 @@ class MessagePassingProtocol(protocol.Protocol):
         message = NetworkMessage("dummy_address", "KEEP_ALIVE", "")
         self.send_message(message)
     
+    # send the serialization versions supported by this end, in version 0
+    # a keep-alive message is used, so that older nodes ignore it
+    def send_serial_versions(self):
+        message = NetworkMessage("dummy_address", "KEEP_ALIVE", list(Serialize.SUPPORTED_VERSIONS))
+        self.send_message(message)
+    
+    # use the newest serialization version supported by both ends, from a keep-alive message of the other end
+    # (usual keep-alive messages have an empty content)
+    def read_serial_versions(self, message):
+        try:
+            versions = message.content
+        except InvalidContentException:
+            return
+        if type(versions) is not list:
+            return
+        
+        for version in versions:
+            if type(version) is int and version in Serialize.SUPPORTED_VERSIONS and version > self.serial_version:
+                self.serial_version = version
+    
     # get the ip address
     def get_host_name(self):
         return self.transport.getPeer().host
@@ -108,9 +345,25 @@ class MessagePassingProtocol(protocol.Protocol):
         return time.monotonic() - self.last_message_time
     
     def lose_connection(self):
+        # queued messages are sent before the connection is closed
+        self.flush()
         self.transport.loseConnection()
     
     # called by Twisted when the connection is lost
     def connectionLost(self, reason):
+        if self.processing_call is not None:
+            self.processing_call.cancel()
+            self.processing_call = None
+        
+        # messages not sent yet cannot be sent anymore
+        if self.flush_call is not None:
+            self.flush_call.cancel()
+            self.flush_call = None
+        self.send_queue = []
+        
+        # free the buffer of the connection
+        self.receive_buffer = FrameBuffer()
+        self.update_buffered_bytes()
+        
         if self.factory.is_server:
             self.factory.server_services.connection_lost(self)
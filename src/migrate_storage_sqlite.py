@@ -0,0 +1,66 @@
+'''
+    Copy of a data directory stored with one file per path (FilesBackend) into an SQLite database (SQLiteBackend)
+    Must be run while the server is stopped:
+      python migrate_storage_sqlite.py [source directory] [destination directory]
+    Default directories: pykanet_data/ and pykanet_data_sqlite/
+    The source directory is kept (files of older versions are only moved to the sharded layout first),
+    the server then uses the destination directory with SQLiteBackend (see server_config.py)
+'''
+
+import os
+import sys
+
+from file_manager import FileManager
+from storage_backends import SQLiteBackend
+
+# number of files copied in each transaction
+BATCH_SIZE = 1000
+
+def main():
+    source_dir = sys.argv[1] if len(sys.argv) > 1 else "pykanet_data/"
+    destination_dir = sys.argv[2] if len(sys.argv) > 2 else "pykanet_data_sqlite/"
+    source_dir = os.path.join(source_dir, "")
+    destination_dir = os.path.join(destination_dir, "")
+    
+    if not os.path.isdir(source_dir) or not FileManager.init_save_path(source_dir):
+        print("FileManager initialization... [FAILED]. Stopping.")
+        return
+    if os.path.exists(destination_dir + SQLiteBackend.DATABASE_NAME):
+        print("Destination database already existing:", destination_dir + SQLiteBackend.DATABASE_NAME)
+        return
+    
+    # the same filenames are used by both backends, once all files are in the sharded layout
+    FileManager.migrate_to_sharded_layout()
+    
+    # temporary files of interrupted atomic writes are not copied
+    filenames = [os.path.join(dir_path, name) for dir_path, _, names in os.walk(source_dir) for name in names
+                 if not name.endswith(".tmp") and not name.startswith(SQLiteBackend.DATABASE_NAME)]
+    
+    os.makedirs(destination_dir, exist_ok=True)
+    destination = SQLiteBackend(destination_dir)
+    copied_bytes = 0
+    for batch_start in range(0, len(filenames), BATCH_SIZE):
+        with destination.batch():
+            for filename in filenames[batch_start:batch_start + BATCH_SIZE]:
+                relative_name = os.path.relpath(filename, source_dir).replace(os.sep, "/")
+                with open(filename, "rb") as file:
+                    data = file.read()
+                destination.write(destination_dir + relative_name, data)
+                copied_bytes += len(data)
+        print("  %d / %d files copied" % (min(batch_start + BATCH_SIZE, len(filenames)), len(filenames)))
+    destination.close()
+    
+    # check that all indexed files can be read from the database
+    if not FileManager.init_save_path(destination_dir, SQLiteBackend):
+        print("SQLite database initialization... [FAILED]")
+        return
+    indexed_files = FileManager.list_files()
+    missing_files = [network_path for network_path in indexed_files
+                     if not FileManager.file_exists(network_path) and not FileManager.records_exist(network_path)]
+    FileManager.backend.close()
+    
+    print("%d files (%d bytes) copied to %s, %d indexed paths, %d missing"
+          % (len(filenames), copied_bytes, destination_dir + SQLiteBackend.DATABASE_NAME, len(indexed_files), len(missing_files)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+'''
+    Conversion of the wiki history saved by older versions (one complete file per revision: page.old0, page.old1, ...)
+    into revision stores (see RevisionStore), with a report of the disk space saved
+    Must be run while the server is stopped:
+      python migrate_wiki_revisions.py
+    The data directory and the storage backend of the server are used (see server_config.py)
+    Pages not converted by this script are converted by the server the next time they are written
+'''
+
+import server_config
+from file_manager import FileManager
+from revision_store import RevisionStore
+
+def main():
+    if not FileManager.init_save_path(server_config.save_path, server_config.storage_backend_class):
+        print("FileManager initialization... [FAILED]. Stopping.")
+        return
+    
+    old_size, new_size = RevisionStore.migrate_all()
+    if old_size == 0:
+        print("No history file to convert.")
+        return
+    
+    print("History files converted: %d bytes -> %d bytes (%.1f%% saved)"
+          % (old_size, new_size, 100 * (old_size - new_size) / old_size))
+
+if __name__ == '__main__':
+    main()
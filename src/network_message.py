@@ -11,19 +11,35 @@
 
     A message is converted to an array of bytes when sent on the tcp connection with to_bytes()
     The array of bytes is converted back to a Message class when received with from_bytes()
+    The content of a large received message is decoded only when it is used (many messages are routed or dropped
+    with only their command), InvalidContentException is raised if it cannot be decoded
+    Short messages are decoded at once, their content is decoded faster with the header than on its own
     Most exception handling is done inside Serialize class
 '''
 
 from user_utils import MainUser
 from serialization_utils import Serialize
 
+class InvalidContentException(Exception): pass
+
 class NetworkMessage():
+    __slots__ = ("version", "username", "network_path", "command", "_content", "_content_data", "_content_idx",
+                 "serial_version")
+    
     # constant defining the version number of the message encoding
     MESSAGE_VERSION = 0
     
     # prefix size for the total length
     MESSAGE_PREFIX_SIZE = Serialize.LENGTH_SIZE
     
+    # number of values of a message, and number of values decoded when a message is received (all except the content)
+    MESSAGE_VALUES_NB = 5
+    HEADER_VALUES_NB = 4
+    
+    # messages up to this length are decoded at once, the content of longer messages is decoded when it is used
+    # (decoding the content separately costs one more call, small compared to the decoding of a long content)
+    EAGER_DECODING_MAX_LENGTH = 16 * 1024
+    
     # username : utf8 string, username of message sender
     # network_path : utf8 string, target address on the network where the message is sent
     # command : utf8 string, requested action at the target address
@@ -33,32 +49,83 @@ class NetworkMessage():
         self.username = MainUser.username
         self.network_path = network_path
         self.command = command
-        self.content = content
+        self._content = content
+        
+        # received data containing the serialized content, until it is decoded (None when there is nothing to decode)
+        # the content starts at _content_idx in the received data, or in its copy made by detach_content()
+        self._content_data = None
+        
+        # serialization version used by the sender of a received message (None if not received)
+        self.serial_version = None
+    
+    # the content of a long received message is decoded the first time it is used
+    # InvalidContentException is raised at each use if it cannot be decoded
+    @property
+    def content(self):
+        if self._content_data is not None:
+            try:
+                self._content = Serialize.from_bytes_tail_unguarded(self._content_data, self.serial_version,
+                                                                    self._content_idx)
+            except Exception:
+                raise InvalidContentException
+            self._content_data = None
+        return self._content
+    
+    @content.setter
+    def content(self, content):
+        self._content = content
+        self._content_data = None
+    
+    # copy the serialized content if it was not decoded yet, so that the received data can be released
+    # (receive buffer of the connection) while the message is still used
+    def detach_content(self):
+        if self._content_data is not None and type(self._content_data) is not bytes:
+            self._content_data = bytes(self._content_data[self._content_idx:])
+            self._content_idx = 0
     
     # we convert each subpart of the message to bytes, and prefix each of them with their length in bytes
     # the complete message is also prefixed with the complete message length
-    def to_bytes(self):
-        return Serialize.to_bytes([self.version, self.username, self.network_path, self.command, self.content])
+    # serial_version can be set to answer with the serialization version used by the other end
+    def to_bytes(self, serial_version=None):
+        return Serialize.to_bytes([self.version, self.username, self.network_path, self.command, self.content], serial_version)
     
     # read each subpart of the message from a byte encoding
+    # the content of a long message is decoded when it is used, from complete_message (not copied):
+    # detach_content() must be called before complete_message is released or modified
+    # a short message whose content cannot be decoded is read again without its content, as a long message
     def from_bytes(self, complete_message):
-        result = Serialize.from_bytes(complete_message)
+        decoded = False
+        if len(complete_message) <= NetworkMessage.EAGER_DECODING_MAX_LENGTH:
+            try:
+                self.version, self.username, self.network_path, self.command, self._content = \
+                    Serialize.from_bytes_unguarded(complete_message)
+                self.serial_version = complete_message[Serialize.LENGTH_SIZE]
+                decoded = True
+            except Exception:
+                pass
         
-        # None means deserialization did not work correctly
-        if result is not None:
+        if not decoded:
             try:
-                self.version, self.username, self.network_path, self.command, self.content = result
-                
-                # ignore messages without the correct version number and correct types
-                if self.version != NetworkMessage.MESSAGE_VERSION or type(self.username) is not str \
-                  or type(self.network_path) is not str or type(self.command) is not str:
-                    self.username = None
-                    self.network_path = None
-                    self.command = None
-                    self.content = None
-            except:
+                header, values_nb, self.serial_version, content_idx = \
+                    Serialize.from_bytes_head_unguarded(complete_message, NetworkMessage.HEADER_VALUES_NB)
+            except Exception:
+                # deserialization did not work correctly
+                return
+            
+            if values_nb != NetworkMessage.MESSAGE_VALUES_NB:
                 # could not parse the result in the correct list of variables
-                pass
+                return
+            self.version, self.username, self.network_path, self.command = header
+            self._content_data = complete_message
+            self._content_idx = content_idx
+        
+        # ignore messages without the correct version number and correct types
+        if self.version != NetworkMessage.MESSAGE_VERSION or type(self.username) is not str \
+          or type(self.network_path) is not str or type(self.command) is not str:
+            self.username = None
+            self.network_path = None
+            self.command = None
+            self.content = None
 
 def check_message_equality(message_a, message_b):
     if message_a.username != message_b.username:
@@ -103,3 +170,52 @@ if __name__ == '__main__':
     check_identity("\n", "test", [1, 2, 3, 4])
     check_identity("\n", "\n", [(12,23), (50,20), (40, 20)])
     check_identity("aa", "aaa", {"a":12, "b":[1, 2, 3], "ccc":(-25, {})})
+    
+    # messages in all serialization versions can be read, and the version of the sender is known
+    for serial_version in Serialize.SUPPORTED_VERSIONS:
+        message_a = NetworkMessage("/chat/room", "APPEND", "test")
+        message_b = NetworkMessage()
+        message_b.from_bytes( message_a.to_bytes(serial_version) )
+        if check_message_equality(message_a, message_b) and message_b.serial_version == serial_version:
+            print("Test... OK")
+        else:
+            print("FAILED: serial_version")
+    
+    # the content of a long message is decoded when it is used, from the received data or from a copy made by detach_content()
+    # a short message is decoded at once
+    content = ["a" * NetworkMessage.EAGER_DECODING_MAX_LENGTH, {"b": 1}]
+    data = bytearray(NetworkMessage("/chat/room", "APPEND", content).to_bytes())
+    messages = [NetworkMessage() for _ in range(3)]
+    with memoryview(data) as view:
+        for message in messages[:2]:
+            message.from_bytes(view)
+        if messages[0].command != "APPEND" or messages[0]._content_data is None or messages[0].content != content:
+            print("FAILED: content not decoded when used")
+        messages[1].detach_content()
+    data[:] = bytes(len(data))
+    data += b'received data'
+    messages[2].from_bytes(NetworkMessage("/chat/room", "APPEND", "short").to_bytes())
+    if type(messages[1]._content_data) is not bytes or messages[1].content != content:
+        print("FAILED: content not copied by detach_content")
+    elif messages[2]._content_data is not None or messages[2].content != "short":
+        print("FAILED: short message not decoded at once")
+    else:
+        print("Test... OK")
+    
+    # invalid content, or wrong number of values
+    data = NetworkMessage("/chat/room", "APPEND", "abc").to_bytes()
+    data = data[:-1] + b'\xff'
+    invalid_messages = [NetworkMessage() for _ in range(2)]
+    invalid_messages[0].from_bytes(data)
+    invalid_messages[1].from_bytes(Serialize.to_bytes([0, "user", "/chat/room", "APPEND", "abc", "def"]))
+    try:
+        invalid_messages[0].content
+        print("FAILED: InvalidContentException was not raised")
+    except InvalidContentException:
+        # in this test, this is the normal case
+        pass
+    if invalid_messages[0].command != "APPEND" \
+       or invalid_messages[1].command is not None or invalid_messages[1].content is not None:
+        print("FAILED: invalid message")
+    else:
+        print("Test... OK")
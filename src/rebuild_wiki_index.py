@@ -0,0 +1,22 @@
+'''
+    Rebuild of the indexes of the wiki pages from the content of all the pages
+    Must be run while the server is stopped:
+      python rebuild_wiki_index.py
+    The data directory and the storage backend of the server are used (see server_config.py)
+'''
+
+import server_config
+from file_manager import FileManager
+from apps.wiki_server import WikiServer
+
+def main():
+    if not FileManager.init_save_path(server_config.save_path, server_config.storage_backend_class):
+        print("FileManager initialization... [FAILED]. Stopping.")
+        return
+    
+    pages_count = WikiServer.rebuild_indexes()
+    FileManager.flush_writes()
+    print("Indexes rebuilt for %d pages." % pages_count)
+
+if __name__ == '__main__':
+    main()
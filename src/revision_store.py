@@ -0,0 +1,191 @@
+'''
+    Storage of all the revisions of a file (for example a wiki page)
+
+    Revisions are saved by chunks of SNAPSHOT_INTERVAL revisions, each chunk is a FileManager record log:
+      the first revision of a chunk is saved completely (snapshot)
+      the next revisions are saved as the differences with the previous revision (delta)
+    A revision is rebuilt from at most SNAPSHOT_INTERVAL records, whatever the number of revisions
+
+    Each record is [revision index, content] for a snapshot, and [revision index, delta] for a delta
+    A delta is a list of operations on the lines of the previous revision:
+      [start, end] : copy the lines start to end-1 of the previous revision
+      "text"       : insert new text
+'''
+
+import difflib
+import re
+
+from file_manager import FileManager
+
+class RevisionStore():
+    
+    SNAPSHOT_INTERVAL = 16
+    
+    def __init__(self, network_path):
+        self.network_path = network_path
+    
+    def chunk_path(self, revision_idx):
+        return self.network_path + ".revisions" + str(revision_idx // RevisionStore.SNAPSHOT_INTERVAL)
+    
+    # differences between two contents, as a list of operations
+    def diff(previous_content, content):
+        previous_lines = previous_content.splitlines(keepends=True)
+        lines = content.splitlines(keepends=True)
+        
+        delta = []
+        matcher = difflib.SequenceMatcher(None, previous_lines, lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                delta.append([i1, i2])
+            elif tag == 'replace' or tag == 'insert':
+                delta.append("".join(lines[j1:j2]))
+        return delta
+    
+    # apply the operations of diff() to the previous content
+    def patch(previous_content, delta):
+        previous_lines = previous_content.splitlines(keepends=True)
+        
+        result = []
+        for operation in delta:
+            if type(operation) is str:
+                result.append(operation)
+            else:
+                result.extend(previous_lines[operation[0]:operation[1]])
+        return "".join(result)
+    
+    # save a new revision
+    # previous_content is the content of the previous revision (None if there is no previous revision)
+    def add_revision(self, revision_idx, content, previous_content):
+        chunk_path = self.chunk_path(revision_idx)
+        if previous_content is None or FileManager.records_count(chunk_path) == 0:
+            record = [revision_idx, content]
+        else:
+            record = [revision_idx, RevisionStore.diff(previous_content, content)]
+        FileManager.append_record(chunk_path, record)
+    
+    # content of a revision, None if the revision does not exist
+    def read_revision(self, revision_idx):
+        content = None
+        for idx, data in FileManager.iter_records(self.chunk_path(revision_idx)):
+            if type(data) is str:
+                content = data
+            elif content is not None:
+                content = RevisionStore.patch(content, data)
+            if idx == revision_idx:
+                return content
+        return None
+    
+    # migration of the revisions saved by older versions as complete files (network_path.old0, .old1, ...)
+    # the chunks are written completely before the old files are removed, so the migration can be done again if
+    # it was interrupted
+    # an old file that cannot be read is skipped and kept (its revision does not exist in the chunks)
+    # return the size of the old files and the size of the new chunks, or None if there was nothing to migrate
+    def migrate_old_files(self):
+        old_path = self.network_path + ".old0"
+        if not FileManager.file_exists(old_path):
+            return None
+        
+        old_paths = []
+        chunks = {}
+        previous_content = None
+        revision_idx = 0
+        while FileManager.file_exists(old_path):
+            content = FileManager.file_read(old_path)
+            if type(content) is not str:
+                print("Warning: revision file cannot be read, not migrated:", old_path)
+                revision_idx += 1
+                old_path = self.network_path + ".old" + str(revision_idx)
+                continue
+            
+            chunk_records = chunks.setdefault(self.chunk_path(revision_idx), [])
+            if previous_content is None or not chunk_records:
+                chunk_records.append([revision_idx, content])
+            else:
+                chunk_records.append([revision_idx, RevisionStore.diff(previous_content, content)])
+            
+            old_paths.append(old_path)
+            previous_content = content
+            revision_idx += 1
+            old_path = self.network_path + ".old" + str(revision_idx)
+        
+        old_size = sum(FileManager.file_size(path) for path in old_paths)
+        new_size = 0
+        for chunk_path, records in chunks.items():
+            if not FileManager.write_records(chunk_path, records):
+                return None
+            new_size += FileManager.file_size(chunk_path)
+        
+        for path in old_paths:
+            FileManager.file_delete(path)
+        return old_size, new_size
+    
+    # migrate the old revision files of all the indexed pages
+    # return the total size of the old files and the total size of the new chunks
+    def migrate_all():
+        old_size = 0
+        new_size = 0
+        old_file_pattern = re.compile(r"(.*)\.old0$")
+        for network_path in FileManager.list_files():
+            match = old_file_pattern.match(network_path)
+            if match is None:
+                continue
+            
+            sizes = RevisionStore(match.group(1)).migrate_old_files()
+            if sizes is not None:
+                old_size += sizes[0]
+                new_size += sizes[1]
+        return old_size, new_size
+
+# perform unit tests if the module was not imported
+if __name__ == '__main__':
+    import random
+    import tempfile
+    
+    # diff and patch
+    for previous_content, content in [("", "a\nb\n"), ("a\nb\nc\n", "a\nc\nd"), ("a\nb", ""), ("x\n" * 10, "x\n" * 11)]:
+        if RevisionStore.patch(previous_content, RevisionStore.diff(previous_content, content)) != content:
+            print("FAIL. Wrong patch of", repr(previous_content), repr(content))
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.init_save_path(temp_dir + "/")
+        
+        # random edits of a page
+        random.seed(0)
+        lines = ["line " + str(i) + "\n" for i in range(200)]
+        revisions = []
+        store = RevisionStore("/wiki/test_page")
+        for revision_idx in range(50):
+            lines[random.randrange(len(lines))] = "edited line " + str(revision_idx) + "\n"
+            lines.insert(random.randrange(len(lines)), "new line\n")
+            revisions.append("".join(lines))
+            store.add_revision(revision_idx, revisions[-1], revisions[-2] if revision_idx > 0 else None)
+        for revision_idx in range(50):
+            if store.read_revision(revision_idx) != revisions[revision_idx]:
+                print("FAIL. Revision not rebuilt correctly", revision_idx)
+        if store.read_revision(50) is not None:
+            print("FAIL. Revision not existing")
+        
+        # migration of old revision files
+        for revision_idx, content in enumerate(revisions):
+            FileManager.file_write("/wiki/old_page.old" + str(revision_idx), content)
+        old_size, new_size = RevisionStore.migrate_all()
+        store = RevisionStore("/wiki/old_page")
+        for revision_idx in range(50):
+            if store.read_revision(revision_idx) != revisions[revision_idx]:
+                print("FAIL. Migrated revision not correct", revision_idx)
+        if FileManager.file_exists("/wiki/old_page.old0") or new_size >= old_size / 4:
+            print("FAIL. Old revision files not migrated", old_size, new_size)
+        
+        # an unreadable old revision file is skipped and kept
+        for revision_idx, content in enumerate(revisions[:10]):
+            FileManager.file_write("/wiki/bad_page.old" + str(revision_idx), content)
+        FileManager.flush_writes()
+        FileManager._raw_file_write(FileManager.get_file_name("/wiki/bad_page.old3"), b"garbage")
+        FileManager._cache_remove("/wiki/bad_page.old3")
+        RevisionStore("/wiki/bad_page").migrate_old_files()
+        store = RevisionStore("/wiki/bad_page")
+        for revision_idx in range(10):
+            if store.read_revision(revision_idx) != (None if revision_idx == 3 else revisions[revision_idx]):
+                print("FAIL. Revision not migrated correctly after an unreadable one", revision_idx)
+        if not FileManager.file_exists("/wiki/bad_page.old3") or FileManager.file_exists("/wiki/bad_page.old4"):
+            print("FAIL. Unreadable revision file not kept")
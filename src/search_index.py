@@ -0,0 +1,149 @@
+'''
+    Full-text search index of pages (for example wiki pages), stored with FileManager
+
+    Inverted index: for each term, the pages containing the term and the number of occurrences (postings)
+      index_path + "term/" + term : {page_path: occurrences}
+    Terms of each indexed page, to update only the postings of the terms which changed when a page is written
+      index_path + "page/" + page_path : {term: occurrences}
+    Number of indexed pages
+      index_path + "pages_count" : number
+
+    Results are ranked by tf-idf: (1 + log(occurrences)) * log(1 + pages_count / number of pages containing the term),
+    summed over the terms of the query
+'''
+
+import heapq
+import math
+import re
+from collections import Counter
+
+from file_manager import FileManager
+
+class SearchIndex():
+    
+    TERM_PATTERN = re.compile(r"\w+")
+    
+    # longer terms are not indexed
+    MAX_TERM_LENGTH = 64
+    
+    def __init__(self, index_path):
+        self.index_path = index_path
+    
+    def term_path(self, term):
+        return self.index_path + "term/" + term
+    
+    def page_terms_path(self, page_path):
+        return self.index_path + "page/" + page_path
+    
+    # occurrences of each term of a text
+    def get_terms(text):
+        return Counter(term for term in SearchIndex.TERM_PATTERN.findall(text.lower())
+                       if len(term) <= SearchIndex.MAX_TERM_LENGTH)
+    
+    def _read(self, network_path, default):
+        if FileManager.file_exists(network_path):
+            return FileManager.file_read(network_path)
+        return default
+    
+    def pages_count(self):
+        return self._read(self.index_path + "pages_count", 0)
+    
+    # update the index with the new content of a page
+    # only the postings of the terms whose number of occurrences changed are written
+    def update_page(self, page_path, content):
+        previous_terms = self._read(self.page_terms_path(page_path), None)
+        terms = SearchIndex.get_terms(content)
+        
+        if previous_terms is None:
+            previous_terms = {}
+            FileManager.file_write(self.index_path + "pages_count", self.pages_count() + 1)
+        
+        for term in set(previous_terms) | set(terms):
+            occurrences = terms.get(term, 0)
+            if previous_terms.get(term, 0) == occurrences:
+                continue
+            
+            # copy of the postings, which can be shared with the FileManager read cache
+            postings = dict(self._read(self.term_path(term), {}))
+            if occurrences > 0:
+                postings[page_path] = occurrences
+            else:
+                postings.pop(page_path, None)
+            
+            if postings:
+                FileManager.file_write(self.term_path(term), postings)
+            else:
+                FileManager.file_delete(self.term_path(term))
+        
+        FileManager.file_write(self.page_terms_path(page_path), dict(terms))
+    
+    # pages matching the query, as a list of [page_path, score] from the best score
+    def search(self, query, max_results=20):
+        pages_count = max(1, self.pages_count())
+        scores = {}
+        for term in set(SearchIndex.get_terms(query)):
+            postings = self._read(self.term_path(term), None)
+            if postings is None:
+                continue
+            
+            idf = math.log(1 + pages_count / len(postings))
+            for page_path, occurrences in postings.items():
+                scores[page_path] = scores.get(page_path, 0.0) + (1 + math.log(occurrences)) * idf
+        
+        best_pages = heapq.nlargest(max_results, scores.items(), key=lambda item: item[1])
+        return [[page_path, score] for page_path, score in best_pages]
+    
+    # rebuild the complete index from the content of the pages
+    # pages is an iterable of (page_path, content), for example reading all the pages from FileManager
+    # the previous index is removed, so this should be done while the index is not used (server stopped)
+    def rebuild(self, pages):
+        for network_path in FileManager.list_files(self.index_path):
+            FileManager.file_delete(network_path)
+        
+        all_postings = {}
+        pages_count = 0
+        for page_path, content in pages:
+            terms = SearchIndex.get_terms(content)
+            FileManager.file_write(self.page_terms_path(page_path), dict(terms))
+            for term, occurrences in terms.items():
+                all_postings.setdefault(term, {})[page_path] = occurrences
+            pages_count += 1
+        
+        for term, postings in all_postings.items():
+            FileManager.file_write(self.term_path(term), postings)
+        FileManager.file_write(self.index_path + "pages_count", pages_count)
+        return pages_count
+
+# perform unit tests if the module was not imported
+if __name__ == '__main__':
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        FileManager.init_save_path(temp_dir + "/")
+        
+        search_index = SearchIndex("/index/search/")
+        search_index.update_page("/wiki/cats", "Cats are small animals. Cats sleep a lot.")
+        search_index.update_page("/wiki/dogs", "Dogs are animals too, dogs like cats sometimes.")
+        search_index.update_page("/wiki/home", "Welcome to the wiki")
+        
+        results = search_index.search("cats")
+        if [page_path for page_path, _ in results] != ["/wiki/cats", "/wiki/dogs"]:
+            print("FAIL. Wrong search results", results)
+        if search_index.search("animals welcome", max_results=1)[0][0] != "/wiki/home":
+            print("FAIL. Rare terms not ranked first")
+        if search_index.search("unknown") != [] or search_index.pages_count() != 3:
+            print("FAIL. Wrong search index content")
+        
+        # page rewritten without some terms
+        search_index.update_page("/wiki/dogs", "Dogs are animals.")
+        if [page_path for page_path, _ in search_index.search("cats")] != ["/wiki/cats"]:
+            print("FAIL. Search index not updated")
+        if FileManager.file_exists(search_index.term_path("sometimes")) or search_index.pages_count() != 3:
+            print("FAIL. Removed term still indexed")
+        
+        # rebuild gives the same results
+        results = search_index.search("animals cats dogs")
+        pages = [("/wiki/cats", "Cats are small animals. Cats sleep a lot."), ("/wiki/dogs", "Dogs are animals."),
+                 ("/wiki/home", "Welcome to the wiki")]
+        if search_index.rebuild(pages) != 3 or search_index.search("animals cats dogs") != results:
+            print("FAIL. Rebuilt index not correct")
@@ -5,21 +5,40 @@
     Each data block is converted to bytes, and prefixed with the data type and byte length
     Supported types : str, int, bool, list, tuple, dict
     
+    Two encoding versions exist, indicated by the version byte following the total length:
+      version 0: 1-byte type prefix and 4-byte length prefix for each data block
+      version 1: varint length prefix, and 1-byte encoding for small ints and short strings
+    Both versions can always be decoded, new data is encoded with SERIAL_VERSION
+    
     During deserialization, data structure and data range will be checked for security 
     If something goes wrong, None value is returned by deserialization
     
     Everything here will be critical for safe data exchange 
 '''
 
+import struct
+
+# optional compiled implementation, see serialize_accel.c
+try:
+    import _serialize_accel
+except ImportError:
+    _serialize_accel = None
+
 class BufferTooShortException(Exception): pass
 class BufferTooLongException(Exception): pass
 class UnknownTypeException(Exception): pass
 class BooleanConversionException(Exception): pass
 class WrongVersionException(Exception): pass
+class LengthEncodingException(Exception): pass
+# subclass of RecursionError, raised for the same reason as the recursive decoder used to
+class MaxDepthException(RecursionError): pass
 
 class Serialize():
-    # version number of serialization
-    SERIAL_VERSION = 0
+    # version number of serialization used for encoding
+    SERIAL_VERSION = 1
+    
+    # all versions that can be decoded
+    SUPPORTED_VERSIONS = (0, 1)
     
     # version encoding size
     VERSION_LENGTH = 1
@@ -45,155 +64,601 @@ class Serialize():
     DATA_BYTES_TYPE = 6
     DATA_BYTEARRAY_TYPE = 7
     
-    # dictionary of supported types
-    types_list = {"<class 'str'>":DATA_STR_TYPE, "<class 'int'>":DATA_INT_TYPE, "<class 'bool'>":DATA_BOOL_TYPE,
-                  "<class 'list'>":DATA_LIST_TYPE, "<class 'tuple'>":DATA_TUPLE_TYPE, "<class 'dict'>":DATA_DICT_TYPE,
-                  "<class 'bytes'>":DATA_BYTES_TYPE, "<class 'bytearray'>":DATA_BYTEARRAY_TYPE
+    # version 1 only: value encoded directly in the type byte
+    # small int from 0 to 63, or type byte followed by the string bytes for strings of 0 to 63 bytes
+    SMALL_INT_TAG = 0x80
+    SMALL_INT_MAX = 63
+    SHORT_STR_TAG = 0xC0
+    SHORT_STR_MAX = 63
+    
+    # version 1 only: lengths are encoded as varint (7 bits per byte, lowest bits first)
+    # the maximum length is the same as in version 0
+    MAX_BLOCK_LENGTH = 256**SIZE_PREFIX_LENGTH - 1
+    VARINT_MAX_SIZE = 5
+    
+    # dictionary of supported types, the type object is used directly as key
+    types_list = {str:DATA_STR_TYPE, int:DATA_INT_TYPE, bool:DATA_BOOL_TYPE,
+                  list:DATA_LIST_TYPE, tuple:DATA_TUPLE_TYPE, dict:DATA_DICT_TYPE,
+                  bytes:DATA_BYTES_TYPE, bytearray:DATA_BYTEARRAY_TYPE
     }
     
-    def new_buffer():
-        complete_message = bytearray(b'')
+    # conversion of basic types to their byte encoding
+    # for int, use one more byte than the length obtained with bit_length because of using signed numbers
+    value_encoders = {str: lambda val: val.encode('utf-8'),
+                      int: lambda val: val.to_bytes(1+( (val.bit_length() + 7) // 8), byteorder='big', signed=True),
+                      bool: lambda val: b'1' if val else b'0',
+                      bytes: lambda val: val,
+                      bytearray: lambda val: val
+    }
+    
+    # type prefix and size prefix of a data block, packed and unpacked together in one struct call
+    HEADER_STRUCT = struct.Struct('>BI')
+    HEADER_LENGTH = TYPE_PREFIX_LENGTH + SIZE_PREFIX_LENGTH
+    
+    # total serialization length, at the beginning of the serialization
+    LENGTH_STRUCT = struct.Struct('>I')
+    
+    # maximum nesting of lists, tuples and dictionaries accepted during serialization and deserialization
+    # encoder and decoder use an explicit stack, so this limit replaces the python recursion limit
+    # values nested deeper than MAX_DEPTH are rejected, including the ones from 501 to about 990 levels
+    # that the recursive implementation accepted
+    MAX_DEPTH = 500
+    
+    # marker for a dictionary waiting for its next key
+    NO_KEY = object()
     
     # convert some value to bytes and add it to some data buffer
-    def write_value(buffer, val):        
-        # recursive types
-        if type(val) is list or type(val) is tuple:
-            # encode first the length of the list, and then each value separately
-            buffer += Serialize.types_list[str(type(val))].to_bytes(Serialize.TYPE_PREFIX_LENGTH, byteorder='big')
-            buffer += (len(val)).to_bytes(Serialize.SIZE_PREFIX_LENGTH, byteorder='big')
-            for elmt in val:
-                Serialize.write_value(buffer, elmt)
-            return
-        elif type(val) is dict:
-            # encode first the length of the dict, then each (key, value) pair
-            buffer += Serialize.types_list[str(type(val))].to_bytes(Serialize.TYPE_PREFIX_LENGTH, byteorder='big')
-            buffer += (len(val)).to_bytes(Serialize.SIZE_PREFIX_LENGTH, byteorder='big')
-            for key in val.keys():
-                Serialize.write_value(buffer, key)
-                Serialize.write_value(buffer, val[key])
-            return
+    # the value is not prefixed by its version: version 0 by default, as for values written before the version 1
+    def write_value(buffer, val, version=0):
+        if version == 0:
+            blocks, data_length = Serialize.encode_blocks(val)
+        else:
+            blocks, data_length = Serialize.encode_blocks_v1(val)
+        
+        start_idx = len(buffer)
+        buffer += bytes(data_length)
         
-        # basic types (direct non-recursive serialization is possible)
-        if type(val) is str:
-            value_bytes = val.encode('utf-8')
-        elif type(val) is int:
-            # use one more byte than the length obtained with bit_length because of using signed numbers
-            value_bytes = val.to_bytes(1+( (val.bit_length() + 7) // 8), byteorder='big', signed=True)
-        elif type(val) is bool:
-            value_bytes = bytearray(b'1') if val else bytearray(b'0')
-        elif type(val) is bytes:
-            value_bytes = bytearray(val)
-        elif type(val) is bytearray:
-            value_bytes = val
+        if version == 0:
+            Serialize.write_blocks(buffer, start_idx, blocks)
         else:
-            raise UnknownTypeException
+            Serialize.write_blocks_v1(buffer, start_idx, blocks)
+    
+    # first encoding pass: flatten the value into a list of blocks (data_type, data_length, value_bytes)
+    # value_bytes is None for lists, tuples and dictionaries, their data_length is the number of elements
+    # return the list of blocks and the total encoded length
+    # nested containers are handled with an explicit stack instead of recursion
+    def encode_blocks(val):
+        types_list = Serialize.types_list
+        value_encoders = Serialize.value_encoders
+        header_length = Serialize.HEADER_LENGTH
+        str_type = Serialize.DATA_STR_TYPE
+        max_block_length = Serialize.MAX_BLOCK_LENGTH
+        
+        blocks = []
+        total_length = 0
+        
+        # iterators over the values remaining to encode in each open container
+        stack = [iter((val,))]
+        while stack:
+            for elmt in stack[-1]:
+                elmt_type = type(elmt)
+                if elmt_type is str:
+                    # fast path for the most common type
+                    value_bytes = elmt.encode('utf-8')
+                    if len(value_bytes) > max_block_length:
+                        raise OverflowError
+                    blocks.append((str_type, len(value_bytes), value_bytes))
+                    total_length += header_length + len(value_bytes)
+                    continue
+                
+                data_type = types_list.get(elmt_type)
+                if data_type is None:
+                    raise UnknownTypeException
+                
+                if elmt_type is list or elmt_type is tuple or elmt_type is dict:
+                    # encode first the number of elements, then each element (each (key, value) pair for dict)
+                    if len(elmt) > max_block_length:
+                        raise OverflowError
+                    blocks.append((data_type, len(elmt), None))
+                    total_length += header_length
+                    if elmt:
+                        if len(stack) > Serialize.MAX_DEPTH:
+                            raise MaxDepthException
+                        stack.append(iter(elmt) if elmt_type is not dict else Serialize.iter_pairs(elmt))
+                        break
+                else:
+                    value_bytes = value_encoders[elmt_type](elmt)
+                    if len(value_bytes) > max_block_length:
+                        raise OverflowError
+                    blocks.append((data_type, len(value_bytes), value_bytes))
+                    total_length += header_length + len(value_bytes)
+            else:
+                # all the elements of the container were encoded
+                stack.pop()
         
-        buffer += Serialize.types_list[str(type(val))].to_bytes(Serialize.TYPE_PREFIX_LENGTH, byteorder='big')
-        buffer += (len(value_bytes)).to_bytes(Serialize.SIZE_PREFIX_LENGTH, byteorder='big')
-        buffer += value_bytes
+        return blocks, total_length
     
-    def read_value(buffer, start_idx):
-        if len(buffer) < start_idx+Serialize.TYPE_PREFIX_LENGTH:
-            raise BufferTooShortException
-        data_type = int.from_bytes(buffer[start_idx:start_idx+Serialize.TYPE_PREFIX_LENGTH], byteorder='big')
-        start_idx += Serialize.TYPE_PREFIX_LENGTH
-
-        if len(buffer) < start_idx+Serialize.SIZE_PREFIX_LENGTH:
-            raise BufferTooShortException
-        data_length = int.from_bytes(buffer[start_idx:start_idx+Serialize.SIZE_PREFIX_LENGTH], byteorder='big')
-        start_idx += Serialize.SIZE_PREFIX_LENGTH
+    def iter_pairs(dictionary):
+        for key, value in dictionary.items():
+            yield key
+            yield value
+    
+    # second encoding pass: write the blocks in a buffer already allocated with the final size
+    # return the index following the written data
+    def write_blocks(buffer, start_idx, blocks):
+        header_pack = Serialize.HEADER_STRUCT.pack_into
+        header_length = Serialize.HEADER_LENGTH
+        for data_type, data_length, value_bytes in blocks:
+            header_pack(buffer, start_idx, data_type, data_length)
+            start_idx += header_length
+            if value_bytes is not None:
+                buffer[start_idx:start_idx+data_length] = value_bytes
+                start_idx += data_length
+        return start_idx
+    
+    # number of bytes of a varint encoding
+    def varint_length(value):
+        length = 1
+        while value >= 0x80:
+            value >>= 7
+            length += 1
+        return length
+    
+    # version 1 of encode_blocks
+    # blocks are (type_byte, data_length, value_bytes), data_length is None when it is not encoded
+    def encode_blocks_v1(val):
+        types_list = Serialize.types_list
+        value_encoders = Serialize.value_encoders
+        varint_length = Serialize.varint_length
+        str_type = Serialize.DATA_STR_TYPE
+        
+        blocks = []
+        total_length = 0
         
-        # recursive types
-        if data_type == Serialize.DATA_LIST_TYPE or data_type == Serialize.DATA_TUPLE_TYPE:
-            # read each element and append them to the list
-            result_list = []
-            for _ in range(data_length):
-                elmt, start_idx = Serialize.read_value(buffer, start_idx)
-                result_list.append(elmt)
-            if data_type == Serialize.DATA_LIST_TYPE:
-                return result_list, start_idx
+        stack = [iter((val,))]
+        while stack:
+            for elmt in stack[-1]:
+                elmt_type = type(elmt)
+                if elmt_type is str:
+                    value_bytes = elmt.encode('utf-8')
+                    length = len(value_bytes)
+                    if length <= Serialize.SHORT_STR_MAX:
+                        # length encoded in the type byte
+                        blocks.append((Serialize.SHORT_STR_TAG + length, None, value_bytes))
+                        total_length += 1 + length
+                    else:
+                        if length > Serialize.MAX_BLOCK_LENGTH:
+                            raise OverflowError
+                        blocks.append((str_type, length, value_bytes))
+                        total_length += 1 + varint_length(length) + length
+                    continue
+                
+                if elmt_type is int and 0 <= elmt <= Serialize.SMALL_INT_MAX:
+                    # value encoded in the type byte
+                    blocks.append((Serialize.SMALL_INT_TAG + elmt, None, None))
+                    total_length += 1
+                    continue
+                
+                data_type = types_list.get(elmt_type)
+                if data_type is None:
+                    raise UnknownTypeException
+                
+                if elmt_type is list or elmt_type is tuple or elmt_type is dict:
+                    length = len(elmt)
+                    if length > Serialize.MAX_BLOCK_LENGTH:
+                        raise OverflowError
+                    blocks.append((data_type, length, None))
+                    total_length += 1 + varint_length(length)
+                    if elmt:
+                        if len(stack) > Serialize.MAX_DEPTH:
+                            raise MaxDepthException
+                        stack.append(iter(elmt) if elmt_type is not dict else Serialize.iter_pairs(elmt))
+                        break
+                else:
+                    value_bytes = value_encoders[elmt_type](elmt)
+                    length = len(value_bytes)
+                    if length > Serialize.MAX_BLOCK_LENGTH:
+                        raise OverflowError
+                    blocks.append((data_type, length, value_bytes))
+                    total_length += 1 + varint_length(length) + length
             else:
-                return tuple(result_list), start_idx
-        elif data_type == Serialize.DATA_DICT_TYPE:
-            # read each (key, value) pair and add them to the dictionary
-            result_dict = {}
-            for _ in range(data_length):
-                key, start_idx = Serialize.read_value(buffer, start_idx)
-                value, start_idx = Serialize.read_value(buffer, start_idx)
-                result_dict[key] = value
-            return result_dict, start_idx
+                stack.pop()
         
-        # basic types
-        if len(buffer) < start_idx+data_length:
-            raise BufferTooShortException
+        return blocks, total_length
+    
+    # version 1 of write_blocks
+    def write_blocks_v1(buffer, start_idx, blocks):
+        for type_byte, data_length, value_bytes in blocks:
+            buffer[start_idx] = type_byte
+            start_idx += 1
+            
+            if data_length is not None:
+                while data_length >= 0x80:
+                    buffer[start_idx] = (data_length & 0x7F) | 0x80
+                    data_length >>= 7
+                    start_idx += 1
+                buffer[start_idx] = data_length
+                start_idx += 1
+            
+            if value_bytes:
+                end_idx = start_idx + len(value_bytes)
+                buffer[start_idx:end_idx] = value_bytes
+                start_idx = end_idx
+        return start_idx
+    
+    # read one value starting at start_idx, return the value and the index following it
+    # buffer can be any object supporting the buffer protocol (bytes, bytearray, memoryview)
+    # version 0 by default, same as write_value
+    def read_value(buffer, start_idx, version=0):
+        with memoryview(buffer) as view:
+            if version == 0:
+                return Serialize.read_view(view, start_idx)
+            else:
+                return Serialize.read_view_v1(view, start_idx)
+    
+    # same as read_value, with a memoryview already created by the caller
+    # the view is walked with struct.unpack_from, only the final values are copied out of it
+    # nested containers are handled with an explicit stack instead of recursion
+    def read_view(view, start_idx):
+        end_idx = len(view)
+        header_unpack = Serialize.HEADER_STRUCT.unpack_from
+        header_length = Serialize.HEADER_LENGTH
+        no_key = Serialize.NO_KEY
+        str_type, int_type, bool_type = Serialize.DATA_STR_TYPE, Serialize.DATA_INT_TYPE, Serialize.DATA_BOOL_TYPE
+        list_type, tuple_type, dict_type = Serialize.DATA_LIST_TYPE, Serialize.DATA_TUPLE_TYPE, Serialize.DATA_DICT_TYPE
+        bytes_type, bytearray_type = Serialize.DATA_BYTES_TYPE, Serialize.DATA_BYTEARRAY_TYPE
         
-        if data_type == Serialize.DATA_STR_TYPE:
-            val = buffer[start_idx:start_idx+data_length].decode('utf-8')
-        elif data_type == Serialize.DATA_INT_TYPE:
-            val = int.from_bytes(buffer[start_idx:start_idx+data_length], byteorder='big', signed=True)
-        elif data_type == Serialize.DATA_BOOL_TYPE:
-            if data_length != 1:
-                raise BooleanConversionException
-            val = True if buffer[start_idx:start_idx+data_length] == bytearray(b'1') else False
-        elif data_type == Serialize.DATA_BYTES_TYPE:
-            val = bytes(buffer[start_idx:start_idx+data_length])
-        elif data_type == Serialize.DATA_BYTEARRAY_TYPE:
-            val = buffer[start_idx:start_idx+data_length]
-        else:
-            raise UnknownTypeException
+        # containers being filled, each item is [data_type, remaining_values, container, pending_key]
+        stack = []
+        
+        while True:
+            if end_idx < start_idx + header_length:
+                raise BufferTooShortException
+            data_type, data_length = header_unpack(view, start_idx)
+            start_idx += header_length
+            
+            # recursive types
+            if data_type == list_type or data_type == tuple_type or data_type == dict_type:
+                if data_length > 0:
+                    if len(stack) >= Serialize.MAX_DEPTH:
+                        raise MaxDepthException
+                    if data_type == dict_type:
+                        # each (key, value) pair is made of two values
+                        stack.append([data_type, 2*data_length, {}, no_key])
+                    else:
+                        stack.append([data_type, data_length, [], no_key])
+                    continue
+                
+                # empty container, nothing more to read
+                if data_type == list_type:
+                    val = []
+                elif data_type == tuple_type:
+                    val = ()
+                else:
+                    val = {}
+            else:
+                # basic types
+                data_end = start_idx + data_length
+                if end_idx < data_end:
+                    raise BufferTooShortException
+                
+                if data_type == str_type:
+                    val = str(view[start_idx:data_end], 'utf-8')
+                elif data_type == int_type:
+                    val = int.from_bytes(view[start_idx:data_end], byteorder='big', signed=True)
+                elif data_type == bool_type:
+                    if data_length != 1:
+                        raise BooleanConversionException
+                    val = view[start_idx] == 0x31 # ascii '1'
+                elif data_type == bytes_type:
+                    val = bytes(view[start_idx:data_end])
+                elif data_type == bytearray_type:
+                    val = bytearray(view[start_idx:data_end])
+                else:
+                    raise UnknownTypeException
+                
+                start_idx = data_end
+            
+            # add the value to the current container, and close all the containers that are now complete
+            while stack:
+                frame = stack[-1]
+                if frame[0] == dict_type:
+                    if frame[3] is no_key:
+                        frame[3] = val
+                    else:
+                        frame[2][frame[3]] = val
+                        frame[3] = no_key
+                else:
+                    frame[2].append(val)
+                
+                frame[1] -= 1
+                if frame[1] > 0:
+                    break
+                
+                stack.pop()
+                val = tuple(frame[2]) if frame[0] == tuple_type else frame[2]
+            else:
+                # no container left, the complete value has been read
+                return val, start_idx
+    
+    # version 1 of read_view
+    def read_view_v1(view, start_idx):
+        end_idx = len(view)
+        no_key = Serialize.NO_KEY
+        str_type, int_type, bool_type = Serialize.DATA_STR_TYPE, Serialize.DATA_INT_TYPE, Serialize.DATA_BOOL_TYPE
+        list_type, tuple_type, dict_type = Serialize.DATA_LIST_TYPE, Serialize.DATA_TUPLE_TYPE, Serialize.DATA_DICT_TYPE
+        bytes_type, bytearray_type = Serialize.DATA_BYTES_TYPE, Serialize.DATA_BYTEARRAY_TYPE
+        small_int_tag, short_str_tag = Serialize.SMALL_INT_TAG, Serialize.SHORT_STR_TAG
+        
+        stack = []
         
-        start_idx += data_length
-        return val, start_idx
+        while True:
+            if end_idx <= start_idx:
+                raise BufferTooShortException
+            data_type = view[start_idx]
+            start_idx += 1
+            
+            if data_type >= short_str_tag:
+                # short string, length encoded in the type byte
+                data_end = start_idx + data_type - short_str_tag
+                if end_idx < data_end:
+                    raise BufferTooShortException
+                val = str(view[start_idx:data_end], 'utf-8')
+                start_idx = data_end
+            elif data_type >= small_int_tag:
+                # small int, value encoded in the type byte
+                val = data_type - small_int_tag
+            elif data_type > bytearray_type:
+                raise UnknownTypeException
+            else:
+                # varint length
+                data_length = 0
+                shift = 0
+                while True:
+                    if end_idx <= start_idx:
+                        raise BufferTooShortException
+                    byte = view[start_idx]
+                    start_idx += 1
+                    data_length |= (byte & 0x7F) << shift
+                    if byte < 0x80:
+                        break
+                    shift += 7
+                    if shift >= 7*Serialize.VARINT_MAX_SIZE:
+                        raise LengthEncodingException
+                if data_length > Serialize.MAX_BLOCK_LENGTH:
+                    raise LengthEncodingException
+                
+                if data_type == list_type or data_type == tuple_type or data_type == dict_type:
+                    if data_length > 0:
+                        if len(stack) >= Serialize.MAX_DEPTH:
+                            raise MaxDepthException
+                        if data_type == dict_type:
+                            stack.append([data_type, 2*data_length, {}, no_key])
+                        else:
+                            stack.append([data_type, data_length, [], no_key])
+                        continue
+                    
+                    if data_type == list_type:
+                        val = []
+                    elif data_type == tuple_type:
+                        val = ()
+                    else:
+                        val = {}
+                else:
+                    data_end = start_idx + data_length
+                    if end_idx < data_end:
+                        raise BufferTooShortException
+                    
+                    if data_type == str_type:
+                        val = str(view[start_idx:data_end], 'utf-8')
+                    elif data_type == int_type:
+                        val = int.from_bytes(view[start_idx:data_end], byteorder='big', signed=True)
+                    elif data_type == bool_type:
+                        if data_length != 1:
+                            raise BooleanConversionException
+                        val = view[start_idx] == 0x31 # ascii '1'
+                    elif data_type == bytes_type:
+                        val = bytes(view[start_idx:data_end])
+                    else:
+                        val = bytearray(view[start_idx:data_end])
+                    
+                    start_idx = data_end
+            
+            while stack:
+                frame = stack[-1]
+                if frame[0] == dict_type:
+                    if frame[3] is no_key:
+                        frame[3] = val
+                    else:
+                        frame[2][frame[3]] = val
+                        frame[3] = no_key
+                else:
+                    frame[2].append(val)
+                
+                frame[1] -= 1
+                if frame[1] > 0:
+                    break
+                
+                stack.pop()
+                val = tuple(frame[2]) if frame[0] == tuple_type else frame[2]
+            else:
+                return val, start_idx
     
-    def to_bytes_unguarded(val):
-        buffer = bytearray(b'')
+    # python implementation of to_bytes_unguarded
+    def to_bytes_python(val, version=None):
+        if version is None:
+            version = Serialize.SERIAL_VERSION
+        if version not in Serialize.SUPPORTED_VERSIONS:
+            raise WrongVersionException
         
-        # reserve the space for encoding the total length
-        buffer += int(0).to_bytes(Serialize.LENGTH_SIZE, byteorder='big')        
+        if version == 0:
+            blocks, data_length = Serialize.encode_blocks(val)
+        else:
+            blocks, data_length = Serialize.encode_blocks_v1(val)
         
-        # serialization encoding version
-        buffer += int(Serialize.SERIAL_VERSION).to_bytes(Serialize.VERSION_LENGTH, byteorder='big')
+        # allocate the complete buffer at once, prefixed by the total length and the serialization encoding version
+        total_length = Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH + data_length
+        buffer = bytearray(total_length)
+        Serialize.LENGTH_STRUCT.pack_into(buffer, 0, total_length)
+        buffer[Serialize.LENGTH_SIZE] = version
         
         # serialize data
-        Serialize.write_value(buffer, val)
-        
-        # initialize the total length in front of serialization with real value
-        buffer[:Serialize.LENGTH_SIZE] = (len(buffer)).to_bytes(Serialize.LENGTH_SIZE, byteorder='big')
+        if version == 0:
+            Serialize.write_blocks(buffer, Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH, blocks)
+        else:
+            Serialize.write_blocks_v1(buffer, Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH, blocks)
         
         return buffer
         
-    def from_bytes_unguarded(bytes_array):
+    # read the total length and the serialization encoding version at the beginning of some serialized data
+    # return the version and the index of the serialized value
+    def read_prefix(view):
         # read the total length
-        if len(bytes_array) < Serialize.LENGTH_SIZE:
+        if len(view) < Serialize.LENGTH_SIZE:
             raise BufferTooShortException
-        total_length = int.from_bytes(bytes_array[0:Serialize.LENGTH_SIZE], byteorder='big')
+        total_length, = Serialize.LENGTH_STRUCT.unpack_from(view, 0)
         start_idx = Serialize.LENGTH_SIZE
         
-        if len(bytes_array) < total_length:
+        if len(view) < total_length:
             raise BufferTooShortException
         
         # read the serialization encoding version
-        if len(bytes_array) < start_idx + Serialize.VERSION_LENGTH:
+        if len(view) < start_idx + Serialize.VERSION_LENGTH:
             raise BufferTooShortException
-        version = int.from_bytes(bytes_array[start_idx:start_idx+Serialize.VERSION_LENGTH], byteorder='big')
-        if version != Serialize.SERIAL_VERSION:
-            #print("wrong version")
-            raise WrongVersionException 
-        start_idx += Serialize.VERSION_LENGTH
+        version = view[start_idx]
+        if version not in Serialize.SUPPORTED_VERSIONS:
+            raise WrongVersionException
         
-        # deserialize data
-        val, start_idx = Serialize.read_value(bytes_array, start_idx)
+        return version, start_idx + Serialize.VERSION_LENGTH
+    
+    # version 1 only: read a varint length, return the length and the index following it
+    def read_length_v1(view, start_idx):
+        data_length = 0
+        shift = 0
+        while True:
+            if len(view) <= start_idx:
+                raise BufferTooShortException
+            byte = view[start_idx]
+            start_idx += 1
+            data_length |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+            if shift >= 7*Serialize.VARINT_MAX_SIZE:
+                raise LengthEncodingException
+        if data_length > Serialize.MAX_BLOCK_LENGTH:
+            raise LengthEncodingException
+        return data_length, start_idx
+    
+    # python implementation of from_bytes_unguarded
+    def from_bytes_python(bytes_array):
+        # all reads are done through a memoryview, so that no intermediate copy is created
+        with memoryview(bytes_array) as view:
+            version, start_idx = Serialize.read_prefix(view)
+            
+            # deserialize data
+            if version == 0:
+                val, start_idx = Serialize.read_view(view, start_idx)
+            else:
+                val, start_idx = Serialize.read_view_v1(view, start_idx)
+            
+            if start_idx < len(view):
+                # some data in the buffer was not used, we also consider this as an anormal case
+                raise BufferTooLongException
         
-        if start_idx < len(bytes_array):
-            # some data in the buffer was not used, we also consider this as an anormal case
-            raise BufferTooLongException
+        return val
+    
+    # python implementation of from_bytes_head_unguarded
+    # the serialized value must be a list of at least nb_values values (TypeError otherwise)
+    def from_bytes_head_python(bytes_array, nb_values):
+        with memoryview(bytes_array) as view:
+            version, start_idx = Serialize.read_prefix(view)
+            
+            # read the type and the length of the list
+            if version == 0:
+                if len(view) < start_idx + Serialize.HEADER_LENGTH:
+                    raise BufferTooShortException
+                data_type, list_length = Serialize.HEADER_STRUCT.unpack_from(view, start_idx)
+                if data_type != Serialize.DATA_LIST_TYPE:
+                    raise TypeError("serialized value is not a list")
+                start_idx += Serialize.HEADER_LENGTH
+                read_view = Serialize.read_view
+            else:
+                if len(view) <= start_idx:
+                    raise BufferTooShortException
+                if view[start_idx] != Serialize.DATA_LIST_TYPE:
+                    raise TypeError("serialized value is not a list")
+                list_length, start_idx = Serialize.read_length_v1(view, start_idx + 1)
+                read_view = Serialize.read_view_v1
+            
+            if nb_values < 0 or list_length < nb_values:
+                raise TypeError("serialized list is too short")
+            
+            # the first values are usually short strings and small ints (version 1), decoded here without read_view_v1
+            short_str_tag, small_int_tag = Serialize.SHORT_STR_TAG, Serialize.SMALL_INT_TAG
+            values = []
+            for _ in range(nb_values):
+                data_type = view[start_idx] if version == 1 and start_idx < len(view) else 0
+                if data_type >= short_str_tag:
+                    data_end = start_idx + 1 + data_type - short_str_tag
+                    if len(view) < data_end:
+                        raise BufferTooShortException
+                    val = str(view[start_idx+1:data_end], 'utf-8')
+                    start_idx = data_end
+                elif data_type >= small_int_tag:
+                    val = data_type - small_int_tag
+                    start_idx += 1
+                else:
+                    val, start_idx = read_view(view, start_idx)
+                values.append(val)
+            
+            return tuple(values), list_length, version, start_idx
+    
+    # python implementation of from_bytes_tail_unguarded
+    def from_bytes_tail_python(bytes_array, version, start_idx=0):
+        with memoryview(bytes_array) as view:
+            if start_idx < 0 or start_idx > len(view):
+                raise ValueError("start index out of the buffer")
+            if version == 0:
+                val, start_idx = Serialize.read_view(view, start_idx)
+            elif version == 1:
+                val, start_idx = Serialize.read_view_v1(view, start_idx)
+            else:
+                raise WrongVersionException
+            
+            if start_idx < len(view):
+                raise BufferTooLongException
         
         return val
     
+    # implementation used by default, replaced by the compiled accelerator when it is available (see below)
+    to_bytes_unguarded = to_bytes_python
+    from_bytes_unguarded = from_bytes_python
+    
+    # decoding of a list in two steps, so that the last value is decoded only when it is used
+    # from_bytes_head_unguarded(bytes_array, nb_values): decode the first nb_values values of a serialized list,
+    #   return them (tuple), the number of values of the list, the serialization version,
+    #   and the index of the tail in bytes_array: the serialized values that follow (not copied)
+    # from_bytes_tail_unguarded(bytes_array, version, start_idx=0): decode the tail starting at start_idx,
+    #   which must contain exactly one value
+    # the same checks as from_bytes are done on the decoded parts
+    from_bytes_head_unguarded = from_bytes_head_python
+    from_bytes_tail_unguarded = from_bytes_tail_python
+    
+    # name of the implementation currently used: "python" or "compiled"
+    BACKEND = "python"
+    
+    # read the serialization encoding version of some serialized data, without deserializing it
+    # return None if the version cannot be read
+    def read_version(bytes_array):
+        if len(bytes_array) < Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH:
+            return None
+        return bytes_array[Serialize.LENGTH_SIZE]
+    
     # only difference with unguarded is that all exceptions are catched, and None is returned    
-    def to_bytes(val):
+    def to_bytes(val, version=None):
         try:
-            return Serialize.to_bytes_unguarded(val)
+            return Serialize.to_bytes_unguarded(val, version)
         except:
             return None
     
@@ -204,10 +669,23 @@ class Serialize():
         except:
             return None
 
+# use the compiled accelerator (built with setup_accel.py) when it is available
+# it implements the same format and the same checks, and raises the same exceptions
+if _serialize_accel is not None:
+    _serialize_accel.init(BufferTooShortException, BufferTooLongException, UnknownTypeException,
+                          BooleanConversionException, WrongVersionException, LengthEncodingException,
+                          MaxDepthException, Serialize.MAX_DEPTH, Serialize.SERIAL_VERSION)
+    Serialize.to_bytes_unguarded = _serialize_accel.to_bytes
+    Serialize.from_bytes_unguarded = _serialize_accel.from_bytes
+    Serialize.from_bytes_head_unguarded = _serialize_accel.from_bytes_head
+    Serialize.from_bytes_tail_unguarded = _serialize_accel.from_bytes_tail
+    Serialize.BACKEND = "compiled"
+
 def test_identity(value):
-    new_value = Serialize.from_bytes( Serialize.to_bytes(value) )
-    if new_value != value:
-        print("Identity FAILED", value, new_value)
+    for version in Serialize.SUPPORTED_VERSIONS:
+        new_value = Serialize.from_bytes( Serialize.to_bytes(value, version) )
+        if new_value != value or type(new_value) is not type(value):
+            print("Identity FAILED", version, value, new_value)
 
 if __name__ == '__main__':
     # ======= Test that deserialization(serialization()) = Identity ========
@@ -372,4 +850,210 @@ if __name__ == '__main__':
     else:
         print("FAIL. WrongVersionException was not raised.")
     
-    #TODO: test of using wrongly more than 1 byte for a boolean encoding
+    # wrong length for a boolean encoding
+    s = Serialize.to_bytes(True, version=0)
+    s[Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH + Serialize.TYPE_PREFIX_LENGTH + Serialize.SIZE_PREFIX_LENGTH - 1] = 2
+    s += bytearray(b'1')
+    s[:Serialize.LENGTH_SIZE] = len(s).to_bytes(Serialize.LENGTH_SIZE, byteorder='big')
+    try:
+        a = Serialize.from_bytes_unguarded(s)
+    except BooleanConversionException:
+        # in this test, this is the normal case
+        pass
+    else:
+        print("FAIL. BooleanConversionException was not raised.")
+    
+    # nesting deeper than the maximum depth
+    # built by hand, because the encoder rejects values nested deeper than MAX_DEPTH
+    depth = Serialize.MAX_DEPTH + 1
+    list_header = Serialize.DATA_LIST_TYPE.to_bytes(Serialize.TYPE_PREFIX_LENGTH, byteorder='big') \
+                  + (1).to_bytes(Serialize.SIZE_PREFIX_LENGTH, byteorder='big')
+    s = Serialize.to_bytes(0, version=0)
+    s[Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH:Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH] = list_header * depth
+    s[:Serialize.LENGTH_SIZE] = len(s).to_bytes(Serialize.LENGTH_SIZE, byteorder='big')
+    try:
+        a = Serialize.from_bytes_unguarded(s)
+    except MaxDepthException:
+        # in this test, this is the normal case
+        pass
+    else:
+        print("FAIL. MaxDepthException was not raised.")
+    
+    # block longer than the maximum length, with a lower maximum so that the test does not allocate 4GB
+    max_block_length = Serialize.MAX_BLOCK_LENGTH
+    Serialize.MAX_BLOCK_LENGTH = 4
+    for version in Serialize.SUPPORTED_VERSIONS:
+        for value in ["a" * 100, b"abcde", [1, 2, 3, 4, 5], 2**100]:
+            try:
+                Serialize.to_bytes_python(value, version)
+            except OverflowError:
+                # in this test, this is the normal case
+                pass
+            else:
+                print("FAIL. OverflowError was not raised.", version, value)
+    Serialize.MAX_BLOCK_LENGTH = max_block_length
+    
+    # version 1: varint length longer than the maximum size
+    s = Serialize.to_bytes("a" * 100, version=1)
+    s[Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH + 1:Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH + 1] = b'\x80' * Serialize.VARINT_MAX_SIZE
+    s[:Serialize.LENGTH_SIZE] = len(s).to_bytes(Serialize.LENGTH_SIZE, byteorder='big')
+    try:
+        a = Serialize.from_bytes_unguarded(s)
+    except LengthEncodingException:
+        # in this test, this is the normal case
+        pass
+    else:
+        print("FAIL. LengthEncodingException was not raised.")
+    
+    # version 1: encoding is shorter than version 0, and small values use only one byte
+    for value in [["2018-05-12 10:00:00", "user1", "ok"], [0, "user1", "/chat/room1", "APPEND", "some text"]]:
+        if len(Serialize.to_bytes(value, version=1)) >= len(Serialize.to_bytes(value, version=0)):
+            print("FAIL. Version 1 encoding is not shorter", value)
+    if len(Serialize.to_bytes(Serialize.SMALL_INT_MAX, version=1)) != Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH + 1:
+        print("FAIL. Small int is not encoded on one byte")
+    
+    # version 1: limits of small ints and short strings
+    for value in [-1, Serialize.SMALL_INT_MAX, Serialize.SMALL_INT_MAX + 1, "a" * Serialize.SHORT_STR_MAX, "a" * (Serialize.SHORT_STR_MAX + 1),
+                  "\u3042" * 21, "\u3042" * 22, "a" * 200, list(range(200)), bytes(300)]:
+        test_identity(value)
+    
+    # version 0 data can still be decoded with the current version
+    if Serialize.read_version(Serialize.to_bytes("a", version=0)) != 0 or Serialize.from_bytes(Serialize.to_bytes("a", version=0)) != "a":
+        print("FAIL. Version 0 data could not be decoded")
+    
+    # deserialization from bytes, bytearray and memoryview gives the same result
+    value = {"a":[1, "b", (b'c', bytearray(b'd'))], 2:{}}
+    s = Serialize.to_bytes(value)
+    for t in [bytes(s), s, memoryview(s)]:
+        if Serialize.from_bytes(t) != value:
+            print("FAIL. Deserialization from", type(t), "is not correct")
+    
+    # decoding of a list in two steps: first values, then last value
+    value = [0, "user", "/chat/room", {"a":[1, "b"], 2:(b'c',)}]
+    for version in Serialize.SUPPORTED_VERSIONS:
+        s = Serialize.to_bytes(value, version)
+        head, values_nb, head_version, tail_idx = Serialize.from_bytes_head_unguarded(s, 3)
+        if list(head) != value[:3] or values_nb != 4 or head_version != version \
+           or Serialize.from_bytes_tail_unguarded(s, version, tail_idx) != value[3] \
+           or Serialize.from_bytes_tail_unguarded(s[tail_idx:], version) != value[3]:
+            print("FAIL. List not decoded in two steps", version)
+        for args in [(Serialize.to_bytes("a", version), 1), (s, 5), (s[:tail_idx - 1], 3)]:
+            try:
+                Serialize.from_bytes_head_unguarded(*args)
+                print("FAIL. Invalid list head decoded", version, args)
+            except (TypeError, BufferTooShortException):
+                pass
+    
+    # values without version prefix are written and read in version 0 by default
+    buffer = bytearray()
+    Serialize.write_value(buffer, value)
+    if buffer != Serialize.to_bytes(value, 0)[Serialize.LENGTH_SIZE + Serialize.VERSION_LENGTH:] \
+       or Serialize.read_value(buffer, 0) != (value, len(buffer)):
+        print("FAIL. Value not written and read in version 0 by default")
+    
+    # ======== Differential test of the python and compiled implementations ========
+    # both implementations must give the same bytes, the same values, and the same exceptions
+    if _serialize_accel is None:
+        print("Compiled accelerator not built, differential test skipped")
+    else:
+        # result of a function call, as a comparable value
+        # repr() distinguishes the types (tuple/list, bytes/bytearray, True/1)
+        def call_result(function, *args):
+            try:
+                return repr(function(*args))
+            except Exception as e:
+                return type(e)
+        
+        def random_value(depth=0):
+            choice = random.randrange(10 if depth < 6 else 6)
+            if choice == 0:
+                return "".join(random.choice("abあ\n") for _ in range(random.choice([0, 1, 5, 63, 64, 200])))
+            elif choice == 1:
+                return random.choice([0, 1, 63, 64, 127, 128, 255, 256, -1, -128, -129, 2**63, -2**63, 2**100, -2**100])
+            elif choice == 2:
+                return random.randint(-10**6, 10**6)
+            elif choice == 3:
+                return random.choice([True, False])
+            elif choice == 4:
+                return bytes(random.randrange(256) for _ in range(random.randrange(80)))
+            elif choice == 5:
+                return bytearray(random.randrange(256) for _ in range(random.randrange(10)))
+            elif choice == 6:
+                return [random_value(depth+1) for _ in range(random.randrange(8))]
+            elif choice == 7:
+                return tuple(random_value(depth+1) for _ in range(random.randrange(5)))
+            elif choice == 8:
+                return {random.choice([random.randrange(100), str(random.randrange(100))]):random_value(depth+1) for _ in range(random.randrange(5))}
+            else:
+                return [[random_value(depth+2)]]
+        
+        def corrupt(data):
+            data = bytearray(data)
+            for _ in range(random.randrange(1, 4)):
+                action = random.randrange(4)
+                idx = random.randrange(len(data) + 1)
+                if action == 0 and idx < len(data):
+                    data[idx] = random.randrange(256)
+                elif action == 1:
+                    data[idx:idx] = bytes([random.randrange(256)])
+                elif action == 2 and idx < len(data):
+                    del data[idx]
+                else:
+                    data = data[:idx]
+            # keep a correct total length most of the time, so that corruption reaches the data blocks
+            if random.randrange(4) != 0 and len(data) >= Serialize.LENGTH_SIZE:
+                data[:Serialize.LENGTH_SIZE] = len(data).to_bytes(Serialize.LENGTH_SIZE, byteorder='big')
+            return data
+        
+        random.seed(1234)
+        for _ in range(20000):
+            value = random_value()
+            for version in Serialize.SUPPORTED_VERSIONS:
+                encoded_python = call_result(Serialize.to_bytes_python, value, version)
+                encoded_compiled = call_result(_serialize_accel.to_bytes, value, version)
+                if encoded_python != encoded_compiled:
+                    print("FAIL. Different encoding", version, value, encoded_python, encoded_compiled)
+                    continue
+                
+                encoded = Serialize.to_bytes_python(value, version)
+                for data in [encoded, corrupt(encoded), bytes(corrupt(encoded)), memoryview(corrupt(encoded))]:
+                    decoded_python = call_result(Serialize.from_bytes_python, data)
+                    decoded_compiled = call_result(_serialize_accel.from_bytes, data)
+                    if decoded_python != decoded_compiled:
+                        print("FAIL. Different decoding", bytes(data), decoded_python, decoded_compiled)
+                    
+                    # decoding in two steps
+                    nb_values = random.randrange(4)
+                    head_python = call_result(Serialize.from_bytes_head_python, data, nb_values)
+                    head_compiled = call_result(_serialize_accel.from_bytes_head, data, nb_values)
+                    if head_python != head_compiled:
+                        print("FAIL. Different decoding of list head", bytes(data), nb_values, head_python, head_compiled)
+                    elif type(head_python) is str:
+                        tail_idx = Serialize.from_bytes_head_python(data, nb_values)[3]
+                        if call_result(Serialize.from_bytes_tail_python, data, version, tail_idx) \
+                           != call_result(_serialize_accel.from_bytes_tail, data, version, tail_idx):
+                            print("FAIL. Different decoding of list tail", bytes(data), tail_idx)
+        
+        # unsupported types and nesting limits
+        class UnknownTypeClass:
+            pass
+        for value in [UnknownTypeClass(), [1, UnknownTypeClass()], {1: set()}, 1.5, None, "\ud800"]:
+            for version in Serialize.SUPPORTED_VERSIONS:
+                if call_result(Serialize.to_bytes_python, value, version) != call_result(_serialize_accel.to_bytes, value, version):
+                    print("FAIL. Different encoding error", version, value)
+        for depth in [Serialize.MAX_DEPTH, Serialize.MAX_DEPTH + 1]:
+            value = 0
+            for _ in range(depth):
+                value = [value]
+            for version in Serialize.SUPPORTED_VERSIONS:
+                if call_result(Serialize.to_bytes_python, value, version) != call_result(_serialize_accel.to_bytes, value, version):
+                    print("FAIL. Different encoding at depth", depth, version)
+        
+        # random bytes
+        for _ in range(20000):
+            data = bytearray(random.randrange(256) for _ in range(random.randrange(30)))
+            if len(data) > Serialize.LENGTH_SIZE:
+                data[:Serialize.LENGTH_SIZE] = len(data).to_bytes(Serialize.LENGTH_SIZE, byteorder='big')
+                data[Serialize.LENGTH_SIZE] = random.choice(Serialize.SUPPORTED_VERSIONS)
+            if call_result(Serialize.from_bytes_python, data) != call_result(_serialize_accel.from_bytes, data):
+                print("FAIL. Different decoding of random bytes", bytes(data))
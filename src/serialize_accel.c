@@ -0,0 +1,824 @@
+/*
+    Optional compiled implementation of Serialize.to_bytes_unguarded and Serialize.from_bytes_unguarded
+    (and of Serialize.from_bytes_head_unguarded and Serialize.from_bytes_tail_unguarded)
+    See serialization_utils.py for the description of the encoding format
+
+    This module must give exactly the same results as the python implementation:
+      same encoded bytes, same decoded values, same exception classes for invalid data
+    The exception classes and the limits are given by serialization_utils.py with init()
+
+    Build from the src directory:
+      python setup_accel.py build_ext --inplace
+*/
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <string.h>
+
+/* constants, identical to Serialize class constants */
+#define LENGTH_SIZE 4
+#define VERSION_LENGTH 1
+#define HEADER_LENGTH 5
+
+#define DATA_STR_TYPE 0
+#define DATA_INT_TYPE 1
+#define DATA_BOOL_TYPE 2
+#define DATA_LIST_TYPE 3
+#define DATA_TUPLE_TYPE 4
+#define DATA_DICT_TYPE 5
+#define DATA_BYTES_TYPE 6
+#define DATA_BYTEARRAY_TYPE 7
+
+#define SMALL_INT_TAG 0x80
+#define SMALL_INT_MAX 63
+#define SHORT_STR_TAG 0xC0
+#define SHORT_STR_MAX 63
+
+#define MAX_BLOCK_LENGTH 0xFFFFFFFFULL
+#define VARINT_MAX_SIZE 5
+
+/* exception classes of serialization_utils, set by init() */
+static PyObject *BufferTooShortException = NULL;
+static PyObject *BufferTooLongException = NULL;
+static PyObject *UnknownTypeException = NULL;
+static PyObject *BooleanConversionException = NULL;
+static PyObject *WrongVersionException = NULL;
+static PyObject *LengthEncodingException = NULL;
+static PyObject *MaxDepthException = NULL;
+
+static int max_depth = 0;
+static int default_version = 0;
+static int initialized = 0;
+
+/* ======================== encoding ======================== */
+
+static Py_ssize_t varint_length(uint64_t value)
+{
+    Py_ssize_t length = 1;
+    while (value >= 0x80) {
+        value >>= 7;
+        length++;
+    }
+    return length;
+}
+
+/* number of bytes of the int encoding, one more byte than bit_length because of signed numbers */
+static Py_ssize_t int_length(PyObject *obj)
+{
+    size_t nb_bits = _PyLong_NumBits(obj);
+    if (nb_bits == (size_t)-1 && PyErr_Occurred())
+        return -1;
+    return 1 + (Py_ssize_t)((nb_bits + 7) / 8);
+}
+
+/* check the length of a data block for both versions */
+static int check_block_length(Py_ssize_t length)
+{
+    if ((uint64_t)length > MAX_BLOCK_LENGTH) {
+        PyErr_SetNone(PyExc_OverflowError);
+        return -1;
+    }
+    return 0;
+}
+
+/* size of the length prefix of a data block */
+static Py_ssize_t prefix_length(Py_ssize_t length, int version)
+{
+    return version == 0 ? HEADER_LENGTH : 1 + varint_length((uint64_t)length);
+}
+
+/* first encoding pass: add the encoded length of obj to *size */
+static int size_value(PyObject *obj, int version, int depth, Py_ssize_t *size)
+{
+    Py_ssize_t length;
+
+    if (PyUnicode_CheckExact(obj)) {
+        if (PyUnicode_AsUTF8AndSize(obj, &length) == NULL)
+            return -1;
+        if (check_block_length(length) < 0)
+            return -1;
+        if (version == 1 && length <= SHORT_STR_MAX)
+            *size += 1 + length;
+        else
+            *size += prefix_length(length, version) + length;
+        return 0;
+    }
+
+    if (PyLong_CheckExact(obj)) {
+        if (version == 1) {
+            int overflow;
+            long long value = PyLong_AsLongLongAndOverflow(obj, &overflow);
+            if (!overflow && value >= 0 && value <= SMALL_INT_MAX) {
+                *size += 1;
+                return 0;
+            }
+        }
+        length = int_length(obj);
+        if (length < 0)
+            return -1;
+        *size += prefix_length(length, version) + length;
+        return 0;
+    }
+
+    if (PyBool_Check(obj)) {
+        *size += prefix_length(1, version) + 1;
+        return 0;
+    }
+
+    if (PyBytes_CheckExact(obj) || PyByteArray_CheckExact(obj)) {
+        length = PyBytes_CheckExact(obj) ? PyBytes_GET_SIZE(obj) : PyByteArray_GET_SIZE(obj);
+        if (check_block_length(length) < 0)
+            return -1;
+        *size += prefix_length(length, version) + length;
+        return 0;
+    }
+
+    if (PyList_CheckExact(obj) || PyTuple_CheckExact(obj)) {
+        Py_ssize_t i;
+        length = PyList_CheckExact(obj) ? PyList_GET_SIZE(obj) : PyTuple_GET_SIZE(obj);
+        if (check_block_length(length) < 0)
+            return -1;
+        *size += prefix_length(length, version);
+        if (length > 0 && depth >= max_depth) {
+            PyErr_SetNone(MaxDepthException);
+            return -1;
+        }
+        for (i = 0; i < length; i++) {
+            PyObject *item = PyList_CheckExact(obj) ? PyList_GET_ITEM(obj, i) : PyTuple_GET_ITEM(obj, i);
+            if (size_value(item, version, depth + 1, size) < 0)
+                return -1;
+        }
+        return 0;
+    }
+
+    if (PyDict_CheckExact(obj)) {
+        Py_ssize_t pos = 0;
+        PyObject *key, *value;
+        length = PyDict_GET_SIZE(obj);
+        if (check_block_length(length) < 0)
+            return -1;
+        *size += prefix_length(length, version);
+        if (length > 0 && depth >= max_depth) {
+            PyErr_SetNone(MaxDepthException);
+            return -1;
+        }
+        while (PyDict_Next(obj, &pos, &key, &value)) {
+            if (size_value(key, version, depth + 1, size) < 0)
+                return -1;
+            if (size_value(value, version, depth + 1, size) < 0)
+                return -1;
+        }
+        return 0;
+    }
+
+    PyErr_SetNone(UnknownTypeException);
+    return -1;
+}
+
+static unsigned char *write_prefix(unsigned char *p, int data_type, Py_ssize_t length, int version)
+{
+    uint64_t value = (uint64_t)length;
+    *p++ = (unsigned char)data_type;
+    if (version == 0) {
+        p[0] = (unsigned char)(value >> 24);
+        p[1] = (unsigned char)(value >> 16);
+        p[2] = (unsigned char)(value >> 8);
+        p[3] = (unsigned char)value;
+        return p + 4;
+    }
+    while (value >= 0x80) {
+        *p++ = (unsigned char)((value & 0x7F) | 0x80);
+        value >>= 7;
+    }
+    *p++ = (unsigned char)value;
+    return p;
+}
+
+/* second encoding pass: write obj at p, return the position following the written data
+   all checks were already done by size_value */
+static unsigned char *write_value(PyObject *obj, int version, unsigned char *p)
+{
+    Py_ssize_t length;
+
+    if (PyUnicode_CheckExact(obj)) {
+        const char *data = PyUnicode_AsUTF8AndSize(obj, &length);
+        if (data == NULL)
+            return NULL;
+        if (version == 1 && length <= SHORT_STR_MAX)
+            *p++ = (unsigned char)(SHORT_STR_TAG + length);
+        else
+            p = write_prefix(p, DATA_STR_TYPE, length, version);
+        memcpy(p, data, length);
+        return p + length;
+    }
+
+    if (PyLong_CheckExact(obj)) {
+        if (version == 1) {
+            int overflow;
+            long long value = PyLong_AsLongLongAndOverflow(obj, &overflow);
+            if (!overflow && value >= 0 && value <= SMALL_INT_MAX) {
+                *p++ = (unsigned char)(SMALL_INT_TAG + value);
+                return p;
+            }
+        }
+        length = int_length(obj);
+        if (length < 0)
+            return NULL;
+        p = write_prefix(p, DATA_INT_TYPE, length, version);
+#if PY_VERSION_HEX >= 0x030D0000
+        if (_PyLong_AsByteArray((PyLongObject *)obj, p, length, 0, 1, 1) < 0)
+            return NULL;
+#else
+        if (_PyLong_AsByteArray((PyLongObject *)obj, p, length, 0, 1) < 0)
+            return NULL;
+#endif
+        return p + length;
+    }
+
+    if (PyBool_Check(obj)) {
+        p = write_prefix(p, DATA_BOOL_TYPE, 1, version);
+        *p++ = obj == Py_True ? '1' : '0';
+        return p;
+    }
+
+    if (PyBytes_CheckExact(obj)) {
+        length = PyBytes_GET_SIZE(obj);
+        p = write_prefix(p, DATA_BYTES_TYPE, length, version);
+        memcpy(p, PyBytes_AS_STRING(obj), length);
+        return p + length;
+    }
+
+    if (PyByteArray_CheckExact(obj)) {
+        length = PyByteArray_GET_SIZE(obj);
+        p = write_prefix(p, DATA_BYTEARRAY_TYPE, length, version);
+        memcpy(p, PyByteArray_AS_STRING(obj), length);
+        return p + length;
+    }
+
+    if (PyList_CheckExact(obj) || PyTuple_CheckExact(obj)) {
+        Py_ssize_t i;
+        int is_list = PyList_CheckExact(obj);
+        length = is_list ? PyList_GET_SIZE(obj) : PyTuple_GET_SIZE(obj);
+        p = write_prefix(p, is_list ? DATA_LIST_TYPE : DATA_TUPLE_TYPE, length, version);
+        for (i = 0; i < length; i++) {
+            p = write_value(is_list ? PyList_GET_ITEM(obj, i) : PyTuple_GET_ITEM(obj, i), version, p);
+            if (p == NULL)
+                return NULL;
+        }
+        return p;
+    }
+
+    if (PyDict_CheckExact(obj)) {
+        Py_ssize_t pos = 0;
+        PyObject *key, *value;
+        p = write_prefix(p, DATA_DICT_TYPE, PyDict_GET_SIZE(obj), version);
+        while (PyDict_Next(obj, &pos, &key, &value)) {
+            p = write_value(key, version, p);
+            if (p == NULL)
+                return NULL;
+            p = write_value(value, version, p);
+            if (p == NULL)
+                return NULL;
+        }
+        return p;
+    }
+
+    PyErr_SetNone(UnknownTypeException);
+    return NULL;
+}
+
+static PyObject *accel_to_bytes(PyObject *self, PyObject *args)
+{
+    PyObject *obj, *version_obj = Py_None, *result;
+    Py_ssize_t size = LENGTH_SIZE + VERSION_LENGTH;
+    unsigned char *p;
+    int version;
+
+    if (!PyArg_ParseTuple(args, "O|O", &obj, &version_obj))
+        return NULL;
+
+    if (version_obj == Py_None) {
+        version = default_version;
+    } else {
+        long value = PyLong_AsLong(version_obj);
+        if (value == -1 && PyErr_Occurred())
+            return NULL;
+        if (value != 0 && value != 1) {
+            PyErr_SetNone(WrongVersionException);
+            return NULL;
+        }
+        version = (int)value;
+    }
+
+    if (size_value(obj, version, 0, &size) < 0)
+        return NULL;
+    if (check_block_length(size) < 0)
+        return NULL;
+
+    result = PyByteArray_FromStringAndSize(NULL, size);
+    if (result == NULL)
+        return NULL;
+
+    p = (unsigned char *)PyByteArray_AS_STRING(result);
+    p[0] = (unsigned char)(size >> 24);
+    p[1] = (unsigned char)(size >> 16);
+    p[2] = (unsigned char)(size >> 8);
+    p[3] = (unsigned char)size;
+    p[4] = (unsigned char)version;
+
+    if (write_value(obj, version, p + LENGTH_SIZE + VERSION_LENGTH) == NULL) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    return result;
+}
+
+/* ======================== decoding ======================== */
+
+typedef struct {
+    const unsigned char *data;
+    Py_ssize_t end;
+    Py_ssize_t idx;
+    int version;
+} Reader;
+
+static PyObject *read_value(Reader *r, int depth);
+
+/* read the elements of a container of the given type and length */
+static PyObject *read_container(Reader *r, int data_type, uint64_t length, int depth)
+{
+    PyObject *result;
+    uint64_t i;
+
+    if (data_type == DATA_DICT_TYPE) {
+        result = PyDict_New();
+        if (result == NULL || length == 0)
+            return result;
+        if (depth >= max_depth) {
+            Py_DECREF(result);
+            PyErr_SetNone(MaxDepthException);
+            return NULL;
+        }
+        for (i = 0; i < length; i++) {
+            PyObject *key, *value;
+            int status;
+            key = read_value(r, depth + 1);
+            if (key == NULL) {
+                Py_DECREF(result);
+                return NULL;
+            }
+            value = read_value(r, depth + 1);
+            if (value == NULL) {
+                Py_DECREF(key);
+                Py_DECREF(result);
+                return NULL;
+            }
+            status = PyDict_SetItem(result, key, value);
+            Py_DECREF(key);
+            Py_DECREF(value);
+            if (status < 0) {
+                Py_DECREF(result);
+                return NULL;
+            }
+        }
+        return result;
+    }
+
+    if (length > 0 && depth >= max_depth) {
+        PyErr_SetNone(MaxDepthException);
+        return NULL;
+    }
+
+    /* each element takes at least one byte: preallocate only when the length is possible */
+    if (length <= (uint64_t)(r->end - r->idx)) {
+        result = PyList_New((Py_ssize_t)length);
+        if (result == NULL)
+            return NULL;
+        for (i = 0; i < length; i++) {
+            PyObject *item = read_value(r, depth + 1);
+            if (item == NULL) {
+                Py_DECREF(result);
+                return NULL;
+            }
+            PyList_SET_ITEM(result, (Py_ssize_t)i, item);
+        }
+    } else {
+        result = PyList_New(0);
+        if (result == NULL)
+            return NULL;
+        for (i = 0; i < length; i++) {
+            PyObject *item = read_value(r, depth + 1);
+            int status;
+            if (item == NULL) {
+                Py_DECREF(result);
+                return NULL;
+            }
+            status = PyList_Append(result, item);
+            Py_DECREF(item);
+            if (status < 0) {
+                Py_DECREF(result);
+                return NULL;
+            }
+        }
+    }
+
+    if (data_type == DATA_TUPLE_TYPE) {
+        PyObject *tuple = PyList_AsTuple(result);
+        Py_DECREF(result);
+        return tuple;
+    }
+    return result;
+}
+
+/* read a basic type value of the given length at the current position */
+static PyObject *read_basic(Reader *r, int data_type, uint64_t length)
+{
+    const char *data;
+    PyObject *result;
+
+    if ((uint64_t)(r->end - r->idx) < length) {
+        PyErr_SetNone(BufferTooShortException);
+        return NULL;
+    }
+    data = (const char *)r->data + r->idx;
+
+    switch (data_type) {
+    case DATA_STR_TYPE:
+        result = PyUnicode_DecodeUTF8(data, (Py_ssize_t)length, NULL);
+        break;
+    case DATA_INT_TYPE:
+        result = _PyLong_FromByteArray((const unsigned char *)data, (size_t)length, 0, 1);
+        break;
+    case DATA_BOOL_TYPE:
+        if (length != 1) {
+            PyErr_SetNone(BooleanConversionException);
+            return NULL;
+        }
+        result = PyBool_FromLong(data[0] == '1');
+        break;
+    case DATA_BYTES_TYPE:
+        result = PyBytes_FromStringAndSize(data, (Py_ssize_t)length);
+        break;
+    case DATA_BYTEARRAY_TYPE:
+        result = PyByteArray_FromStringAndSize(data, (Py_ssize_t)length);
+        break;
+    default:
+        PyErr_SetNone(UnknownTypeException);
+        return NULL;
+    }
+
+    if (result != NULL)
+        r->idx += (Py_ssize_t)length;
+    return result;
+}
+
+/* same checks and same order of checks as Serialize.read_view */
+static PyObject *read_value_v0(Reader *r, int depth)
+{
+    int data_type;
+    uint64_t length;
+    const unsigned char *p;
+
+    if (r->end - r->idx < HEADER_LENGTH) {
+        PyErr_SetNone(BufferTooShortException);
+        return NULL;
+    }
+    p = r->data + r->idx;
+    data_type = p[0];
+    length = ((uint64_t)p[1] << 24) | ((uint64_t)p[2] << 16) | ((uint64_t)p[3] << 8) | (uint64_t)p[4];
+    r->idx += HEADER_LENGTH;
+
+    if (data_type == DATA_LIST_TYPE || data_type == DATA_TUPLE_TYPE || data_type == DATA_DICT_TYPE)
+        return read_container(r, data_type, length, depth);
+    return read_basic(r, data_type, length);
+}
+
+/* same checks and same order of checks as Serialize.read_length_v1 */
+static int read_length_v1(Reader *r, uint64_t *length)
+{
+    int shift = 0;
+
+    *length = 0;
+    while (1) {
+        int byte;
+        if (r->end <= r->idx) {
+            PyErr_SetNone(BufferTooShortException);
+            return -1;
+        }
+        byte = r->data[r->idx++];
+        *length |= (uint64_t)(byte & 0x7F) << shift;
+        if (byte < 0x80)
+            break;
+        shift += 7;
+        if (shift >= 7 * VARINT_MAX_SIZE) {
+            PyErr_SetNone(LengthEncodingException);
+            return -1;
+        }
+    }
+    if (*length > MAX_BLOCK_LENGTH) {
+        PyErr_SetNone(LengthEncodingException);
+        return -1;
+    }
+    return 0;
+}
+
+/* same checks and same order of checks as Serialize.read_view_v1 */
+static PyObject *read_value_v1(Reader *r, int depth)
+{
+    int data_type;
+    uint64_t length;
+
+    if (r->end <= r->idx) {
+        PyErr_SetNone(BufferTooShortException);
+        return NULL;
+    }
+    data_type = r->data[r->idx++];
+
+    if (data_type >= SHORT_STR_TAG)
+        return read_basic(r, DATA_STR_TYPE, (uint64_t)(data_type - SHORT_STR_TAG));
+    if (data_type >= SMALL_INT_TAG)
+        return PyLong_FromLong(data_type - SMALL_INT_TAG);
+    if (data_type > DATA_BYTEARRAY_TYPE) {
+        PyErr_SetNone(UnknownTypeException);
+        return NULL;
+    }
+
+    if (read_length_v1(r, &length) < 0)
+        return NULL;
+
+    if (data_type == DATA_LIST_TYPE || data_type == DATA_TUPLE_TYPE || data_type == DATA_DICT_TYPE)
+        return read_container(r, data_type, length, depth);
+    return read_basic(r, data_type, length);
+}
+
+static PyObject *read_value(Reader *r, int depth)
+{
+    return r->version == 0 ? read_value_v0(r, depth) : read_value_v1(r, depth);
+}
+
+/* read the total length and the version, same checks and same order of checks as Serialize.read_prefix */
+static int read_prefix(Reader *r)
+{
+    uint64_t total_length;
+
+    if (r->end < LENGTH_SIZE) {
+        PyErr_SetNone(BufferTooShortException);
+        return -1;
+    }
+    total_length = ((uint64_t)r->data[0] << 24) | ((uint64_t)r->data[1] << 16) | ((uint64_t)r->data[2] << 8) | (uint64_t)r->data[3];
+    if ((uint64_t)r->end < total_length) {
+        PyErr_SetNone(BufferTooShortException);
+        return -1;
+    }
+    if (r->end < LENGTH_SIZE + VERSION_LENGTH) {
+        PyErr_SetNone(BufferTooShortException);
+        return -1;
+    }
+    r->version = r->data[LENGTH_SIZE];
+    if (r->version != 0 && r->version != 1) {
+        PyErr_SetNone(WrongVersionException);
+        return -1;
+    }
+    r->idx = LENGTH_SIZE + VERSION_LENGTH;
+    return 0;
+}
+
+static PyObject *accel_from_bytes(PyObject *self, PyObject *arg)
+{
+    Py_buffer view;
+    Reader r;
+    PyObject *result = NULL;
+
+    if (PyObject_GetBuffer(arg, &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+
+    r.data = (const unsigned char *)view.buf;
+    r.end = view.len;
+
+    if (read_prefix(&r) < 0)
+        goto done;
+
+    result = read_value(&r, 0);
+    if (result != NULL && r.idx < r.end) {
+        Py_CLEAR(result);
+        PyErr_SetNone(BufferTooLongException);
+    }
+
+done:
+    PyBuffer_Release(&view);
+    return result;
+}
+
+/* same checks and same order of checks as Serialize.from_bytes_head_python */
+/* called for each received message: arguments are read without PyArg_ParseTuple (METH_FASTCALL) */
+static PyObject *accel_from_bytes_head(PyObject *self, PyObject *const *args, Py_ssize_t nargs)
+{
+    Py_buffer view;
+    Reader r;
+    Py_ssize_t nb_values, i;
+    uint64_t length;
+    PyObject *values = NULL;
+    PyObject *result = NULL;
+
+    if (nargs != 2) {
+        PyErr_SetString(PyExc_TypeError, "from_bytes_head() takes exactly 2 arguments");
+        return NULL;
+    }
+    nb_values = PyLong_AsSsize_t(args[1]);
+    if (nb_values == -1 && PyErr_Occurred())
+        return NULL;
+    if (PyObject_GetBuffer(args[0], &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+
+    r.data = (const unsigned char *)view.buf;
+    r.end = view.len;
+
+    if (read_prefix(&r) < 0)
+        goto done;
+
+    /* type and length of the list */
+    if (r.version == 0) {
+        const unsigned char *p;
+        if (r.end - r.idx < HEADER_LENGTH) {
+            PyErr_SetNone(BufferTooShortException);
+            goto done;
+        }
+        p = r.data + r.idx;
+        if (p[0] != DATA_LIST_TYPE) {
+            PyErr_SetString(PyExc_TypeError, "serialized value is not a list");
+            goto done;
+        }
+        length = ((uint64_t)p[1] << 24) | ((uint64_t)p[2] << 16) | ((uint64_t)p[3] << 8) | (uint64_t)p[4];
+        r.idx += HEADER_LENGTH;
+    } else {
+        if (r.end <= r.idx) {
+            PyErr_SetNone(BufferTooShortException);
+            goto done;
+        }
+        if (r.data[r.idx] != DATA_LIST_TYPE) {
+            PyErr_SetString(PyExc_TypeError, "serialized value is not a list");
+            goto done;
+        }
+        r.idx++;
+        if (read_length_v1(&r, &length) < 0)
+            goto done;
+    }
+
+    if (nb_values < 0 || length < (uint64_t)nb_values) {
+        PyErr_SetString(PyExc_TypeError, "serialized list is too short");
+        goto done;
+    }
+
+    values = PyTuple_New(nb_values);
+    if (values == NULL)
+        goto done;
+    for (i = 0; i < nb_values; i++) {
+        PyObject *item = read_value(&r, 0);
+        if (item == NULL) {
+            Py_CLEAR(values);
+            goto done;
+        }
+        PyTuple_SET_ITEM(values, i, item);
+    }
+    result = PyTuple_New(4);
+    if (result == NULL) {
+        Py_DECREF(values);
+        goto done;
+    }
+    PyTuple_SET_ITEM(result, 0, values);
+    PyTuple_SET_ITEM(result, 1, PyLong_FromUnsignedLongLong(length));
+    PyTuple_SET_ITEM(result, 2, PyLong_FromLong(r.version));
+    PyTuple_SET_ITEM(result, 3, PyLong_FromSsize_t(r.idx));
+    if (PyTuple_GET_ITEM(result, 1) == NULL || PyTuple_GET_ITEM(result, 2) == NULL || PyTuple_GET_ITEM(result, 3) == NULL)
+        Py_CLEAR(result);
+
+done:
+    PyBuffer_Release(&view);
+    return result;
+}
+
+/* same checks and same order of checks as Serialize.from_bytes_tail_python */
+static PyObject *accel_from_bytes_tail(PyObject *self, PyObject *const *args, Py_ssize_t nargs)
+{
+    Py_buffer view;
+    Reader r;
+    long version;
+    Py_ssize_t start_idx = 0;
+    PyObject *result = NULL;
+
+    if (nargs != 2 && nargs != 3) {
+        PyErr_SetString(PyExc_TypeError, "from_bytes_tail() takes 2 or 3 arguments");
+        return NULL;
+    }
+    version = PyLong_AsLong(args[1]);
+    if (version == -1 && PyErr_Occurred())
+        return NULL;
+    if (nargs == 3) {
+        start_idx = PyLong_AsSsize_t(args[2]);
+        if (start_idx == -1 && PyErr_Occurred())
+            return NULL;
+    }
+    if (PyObject_GetBuffer(args[0], &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+
+    r.data = (const unsigned char *)view.buf;
+    r.end = view.len;
+    r.idx = start_idx;
+    r.version = (int)version;
+
+    if (start_idx < 0 || start_idx > view.len) {
+        PyErr_SetString(PyExc_ValueError, "start index out of the buffer");
+        goto done;
+    }
+    if (version != 0 && version != 1) {
+        PyErr_SetNone(WrongVersionException);
+        goto done;
+    }
+
+    result = read_value(&r, 0);
+    if (result != NULL && r.idx < r.end) {
+        Py_CLEAR(result);
+        PyErr_SetNone(BufferTooLongException);
+    }
+
+done:
+    PyBuffer_Release(&view);
+    return result;
+}
+
+/* ======================== module ======================== */
+
+static PyObject *accel_init(PyObject *self, PyObject *args)
+{
+    if (!PyArg_ParseTuple(args, "OOOOOOOii", &BufferTooShortException, &BufferTooLongException,
+                          &UnknownTypeException, &BooleanConversionException, &WrongVersionException,
+                          &LengthEncodingException, &MaxDepthException, &max_depth, &default_version))
+        return NULL;
+
+    Py_INCREF(BufferTooShortException);
+    Py_INCREF(BufferTooLongException);
+    Py_INCREF(UnknownTypeException);
+    Py_INCREF(BooleanConversionException);
+    Py_INCREF(WrongVersionException);
+    Py_INCREF(LengthEncodingException);
+    Py_INCREF(MaxDepthException);
+    initialized = 1;
+    Py_RETURN_NONE;
+}
+
+static PyObject *accel_to_bytes_checked(PyObject *self, PyObject *args)
+{
+    if (!initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "_serialize_accel.init() was not called");
+        return NULL;
+    }
+    return accel_to_bytes(self, args);
+}
+
+static PyObject *accel_from_bytes_checked(PyObject *self, PyObject *arg)
+{
+    if (!initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "_serialize_accel.init() was not called");
+        return NULL;
+    }
+    return accel_from_bytes(self, arg);
+}
+
+static PyObject *accel_from_bytes_head_checked(PyObject *self, PyObject *const *args, Py_ssize_t nargs)
+{
+    if (!initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "_serialize_accel.init() was not called");
+        return NULL;
+    }
+    return accel_from_bytes_head(self, args, nargs);
+}
+
+static PyObject *accel_from_bytes_tail_checked(PyObject *self, PyObject *const *args, Py_ssize_t nargs)
+{
+    if (!initialized) {
+        PyErr_SetString(PyExc_RuntimeError, "_serialize_accel.init() was not called");
+        return NULL;
+    }
+    return accel_from_bytes_tail(self, args, nargs);
+}
+
+static PyMethodDef accel_methods[] = {
+    {"init", accel_init, METH_VARARGS, "Set the exception classes, the maximum depth and the default version."},
+    {"to_bytes", accel_to_bytes_checked, METH_VARARGS, "Same as Serialize.to_bytes_unguarded."},
+    {"from_bytes", accel_from_bytes_checked, METH_O, "Same as Serialize.from_bytes_unguarded."},
+    {"from_bytes_head", (PyCFunction)(void (*)(void))accel_from_bytes_head_checked, METH_FASTCALL,
+     "Same as Serialize.from_bytes_head_unguarded."},
+    {"from_bytes_tail", (PyCFunction)(void (*)(void))accel_from_bytes_tail_checked, METH_FASTCALL,
+     "Same as Serialize.from_bytes_tail_unguarded."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef accel_module = {
+    PyModuleDef_HEAD_INIT, "_serialize_accel", NULL, -1, accel_methods
+};
+
+PyMODINIT_FUNC PyInit__serialize_accel(void)
+{
+    return PyModule_Create(&accel_module);
+}
@@ -0,0 +1,11 @@
+'''
+    Settings of the server data, shared by the server and by the scripts run on its data while it is stopped
+    (migrate_wiki_revisions.py, rebuild_wiki_index.py)
+'''
+
+from storage_backends import FilesBackend, SQLiteBackend
+
+# directory of the saved files, and storage backend: FilesBackend (one file per path) or SQLiteBackend
+# (one SQLite database, see migrate_storage_sqlite.py to copy the files of a FilesBackend directory)
+save_path = "pykanet_data/"
+storage_backend_class = FilesBackend
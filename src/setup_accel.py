@@ -0,0 +1,13 @@
+'''
+    Build of the optional compiled accelerator of Serialize (serialize_accel.c)
+    The compiled module is found automatically by serialization_utils.py when it exists
+    If it is not built, the python implementation is used
+    
+    Build from the src directory:
+      python setup_accel.py build_ext --inplace
+'''
+
+from setuptools import setup, Extension
+
+setup(name="pykanet_serialize_accel",
+      ext_modules=[Extension("_serialize_accel", ["serialize_accel.c"])])
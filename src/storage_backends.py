@@ -0,0 +1,325 @@
+'''
+    Storage backends of FileManager
+    A backend stores files identified by their filename (path in the root directory, as computed by FileManager)
+
+    All backends have the same methods:
+      read(filename): complete content, None if the file does not exist
+      read_view(filename, mmap_min_size): complete content as a bytes-like object, without copy for large files if possible
+      read_range(filename, start, end): bytes start to end-1 of the file
+      write(filename, data), write_atomic(filename, data): replace the content of the file (created if needed)
+      append(filename, data): add data at the end of the file (created if needed)
+      truncate(filename, length), remove(filename)
+      exists(filename), size(filename): size in bytes, None if the file does not exist
+      list_files(): filenames of all the files
+      batch(): context manager grouping the writes done inside it (one transaction for SQLiteBackend)
+      close()
+    Errors are raised as exceptions, FileManager handles them
+'''
+
+import contextlib
+import mmap
+import os
+import sqlite3
+import threading
+
+class FilesBackend():
+    '''
+        One file of the host file system per filename
+    '''
+    
+    # files of older versions may be stored directly in the root directory (see FileManager.migrate_to_sharded_layout)
+    HAS_FLAT_LAYOUT = True
+    
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        
+        # sub-directories already created or checked
+        self.created_dirs = set()
+    
+    # create the directory of a file before writing it, if needed
+    def make_parent_dir(self, filename):
+        dir_name = os.path.dirname(filename)
+        if dir_name not in self.created_dirs:
+            os.makedirs(dir_name, exist_ok=True)
+            self.created_dirs.add(dir_name)
+    
+    def read(self, filename):
+        try:
+            with open(filename, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+    
+    # a file of at least mmap_min_size bytes is not read into memory: a read-only memoryview of a memory mapping
+    # of the file is returned, so that it can be decoded without copy (the file is unmapped when the memoryview
+    # and all its slices are not used anymore)
+    # the file must not be truncated while the memoryview is used (an access to removed pages would crash the process)
+    def read_view(self, filename, mmap_min_size=0):
+        try:
+            with open(filename, "rb") as file:
+                size = os.fstat(file.fileno()).st_size
+                # empty files cannot be mapped
+                if size < mmap_min_size or size == 0:
+                    return file.read()
+                return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            return None
+    
+    def read_range(self, filename, start, end):
+        with open(filename, "rb") as file:
+            file.seek(start)
+            return file.read(end - start)
+    
+    def write(self, filename, data):
+        self.make_parent_dir(filename)
+        with open(filename, "wb") as file:
+            file.write(data)
+    
+    # the new content is written to a temporary file which then replaces the file
+    # after a crash, the file has either its old content or its new content
+    def write_atomic(self, filename, data):
+        self.make_parent_dir(filename)
+        temp_filename = filename + ".tmp"
+        with open(temp_filename, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, filename)
+    
+    def append(self, filename, data):
+        self.make_parent_dir(filename)
+        with open(filename, "ab") as file:
+            file.write(data)
+    
+    def truncate(self, filename, length):
+        with open(filename, "r+b") as file:
+            file.truncate(length)
+    
+    def remove(self, filename):
+        if os.path.isfile(filename):
+            os.remove(filename)
+    
+    def exists(self, filename):
+        return os.path.isfile(filename)
+    
+    def size(self, filename):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return None
+    
+    def list_files(self):
+        dir_names = [self.root_dir]
+        while dir_names:
+            with os.scandir(dir_names.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        dir_names.append(entry.path)
+                    else:
+                        yield entry.path
+    
+    # each write is done immediately
+    @contextlib.contextmanager
+    def batch(self):
+        yield
+    
+    def close(self):
+        pass
+
+class SQLiteBackend():
+    '''
+        All files in one SQLite database (root_dir + DATABASE_NAME), in WAL mode
+        A file is a sequence of chunks (rows), each chunk is the data of one write or of one append,
+        so that an append does not rewrite the previous content of the file
+        Writes outside of batch() are done in their own transaction, writes inside batch() in one transaction
+        Methods can be called from several threads, database accesses are done one at a time
+    '''
+    
+    HAS_FLAT_LAYOUT = False
+    
+    DATABASE_NAME = "storage.sqlite"
+    
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.connection = sqlite3.connect(root_dir + SQLiteBackend.DATABASE_NAME, isolation_level=None,
+                                          check_same_thread=False)
+        # in WAL mode, commits do not wait for the disk (synchronous=NORMAL), only checkpoints do
+        # after a crash, the last transactions may be lost but the database stays consistent
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS chunks (name TEXT NOT NULL, offset INTEGER NOT NULL, "
+                                "data BLOB NOT NULL, UNIQUE (name, offset))")
+        
+        self.lock = threading.RLock()
+        self.batch_depth = 0
+    
+    # filenames are stored relatively to the root directory, so that the database can be moved
+    def _name(self, filename):
+        if filename.startswith(self.root_dir):
+            return filename[len(self.root_dir):]
+        return filename
+    
+    def _execute(self, sql, parameters):
+        return self.connection.execute(sql, parameters)
+    
+    # the transaction is committed when the outermost batch ends, and rolled back if an exception was raised in it
+    @contextlib.contextmanager
+    def batch(self):
+        with self.lock:
+            if self.batch_depth == 0:
+                self._execute("BEGIN", ())
+            self.batch_depth += 1
+            try:
+                yield
+            except BaseException:
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    self._execute("ROLLBACK", ())
+                raise
+            self.batch_depth -= 1
+            if self.batch_depth == 0:
+                self._execute("COMMIT", ())
+    
+    def read(self, filename):
+        with self.lock:
+            rows = self._execute("SELECT data FROM chunks WHERE name = ? ORDER BY offset", (self._name(filename),)).fetchall()
+        if not rows:
+            return None
+        if len(rows) == 1:
+            return rows[0][0]
+        return b''.join(row[0] for row in rows)
+    
+    # the chunks are always read from the database
+    def read_view(self, filename, mmap_min_size=0):
+        return self.read(filename)
+    
+    # only the chunks containing the range are read
+    def read_range(self, filename, start, end):
+        name = self._name(filename)
+        with self.lock:
+            rows = self._execute("SELECT offset, data FROM chunks WHERE name = ? AND offset < ? AND offset >= "
+                                 "ifnull((SELECT max(offset) FROM chunks WHERE name = ? AND offset <= ?), 0) ORDER BY offset",
+                                 (name, end, name, start)).fetchall()
+        if not rows:
+            return b''
+        first_offset = rows[0][0]
+        return b''.join(row[1] for row in rows)[start - first_offset:end - first_offset]
+    
+    def write(self, filename, data):
+        name = self._name(filename)
+        with self.batch():
+            self._execute("DELETE FROM chunks WHERE name = ?", (name,))
+            self._execute("INSERT INTO chunks VALUES (?, 0, ?)", (name, data))
+    
+    # writes are done in a transaction, so they are always atomic
+    def write_atomic(self, filename, data):
+        self.write(filename, data)
+    
+    def append(self, filename, data):
+        name = self._name(filename)
+        with self.batch():
+            size = self._size(name)
+            if size is not None and len(data) == 0:
+                return
+            # an empty chunk at the end of the file (empty file) is replaced
+            self._execute("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)", (name, size or 0, data))
+    
+    def truncate(self, filename, length):
+        name = self._name(filename)
+        with self.batch():
+            self._execute("DELETE FROM chunks WHERE name = ? AND offset >= ?", (name, length))
+            row = self._execute("SELECT offset, length(data) FROM chunks WHERE name = ? ORDER BY offset DESC LIMIT 1",
+                                (name,)).fetchone()
+            if row is None:
+                self._execute("INSERT INTO chunks VALUES (?, 0, ?)", (name, b''))
+            elif row[0] + row[1] > length:
+                self._execute("UPDATE chunks SET data = substr(data, 1, ?) WHERE name = ? AND offset = ?",
+                              (length - row[0], name, row[0]))
+    
+    def remove(self, filename):
+        with self.batch():
+            self._execute("DELETE FROM chunks WHERE name = ?", (self._name(filename),))
+    
+    def exists(self, filename):
+        with self.lock:
+            return self._execute("SELECT 1 FROM chunks WHERE name = ? LIMIT 1", (self._name(filename),)).fetchone() is not None
+    
+    def _size(self, name):
+        row = self._execute("SELECT offset + length(data) FROM chunks WHERE name = ? ORDER BY offset DESC LIMIT 1",
+                            (name,)).fetchone()
+        return None if row is None else row[0]
+    
+    def size(self, filename):
+        with self.lock:
+            return self._size(self._name(filename))
+    
+    def list_files(self):
+        with self.lock:
+            rows = self._execute("SELECT DISTINCT name FROM chunks", ()).fetchall()
+        return [self.root_dir + row[0] for row in rows]
+    
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+# perform unit tests if the module was not imported
+if __name__ == '__main__':
+    import tempfile
+    
+    for backend_class in [FilesBackend, SQLiteBackend]:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            backend = backend_class(temp_dir + "/")
+            filename = temp_dir + "/ab/cd/file"
+            
+            if backend.read(filename) is not None or backend.exists(filename) or backend.size(filename) is not None:
+                print("FAIL. File not existing found", backend_class.__name__)
+            
+            backend.write(filename, b'')
+            if backend.read(filename) != b'' or not backend.exists(filename) or backend.size(filename) != 0:
+                print("FAIL. Empty file not correct", backend_class.__name__)
+            
+            with backend.batch():
+                for i in range(10):
+                    backend.append(filename, bytes([i]) * 10)
+            if backend.read(filename) != b''.join(bytes([i]) * 10 for i in range(10)) or backend.size(filename) != 100:
+                print("FAIL. Appended data not correct", backend_class.__name__)
+            if backend.read_range(filename, 15, 32) != b'\x01' * 5 + b'\x02' * 10 + b'\x03' * 2:
+                print("FAIL. Range not read correctly", backend_class.__name__)
+            for mmap_min_size in [0, 100, 1000]:
+                if bytes(backend.read_view(filename, mmap_min_size)) != backend.read(filename):
+                    print("FAIL. Content view not correct", backend_class.__name__, mmap_min_size)
+            if backend.read_view(temp_dir + "/missing", 0) is not None:
+                print("FAIL. View of a file not existing", backend_class.__name__)
+            
+            backend.truncate(filename, 25)
+            backend.append(filename, b'end')
+            if backend.read(filename) != b'\x00' * 10 + b'\x01' * 10 + b'\x02' * 5 + b'end':
+                print("FAIL. Truncated file not correct", backend_class.__name__)
+            
+            backend.write_atomic(filename, b'new content')
+            if backend.read(filename) != b'new content':
+                print("FAIL. File not replaced", backend_class.__name__)
+            
+            backend.write(temp_dir + "/ab/other_file", b'other')
+            if sorted(backend.list_files()) != [filename, temp_dir + "/ab/other_file"]:
+                print("FAIL. Wrong list of files", backend_class.__name__)
+            
+            backend.remove(filename)
+            if backend.exists(filename):
+                print("FAIL. File not removed", backend_class.__name__)
+            
+            # an exception in a batch cancels all its writes with SQLite
+            try:
+                with backend.batch():
+                    backend.write(filename, b'batch content')
+                    with backend.batch():
+                        backend.append(temp_dir + "/ab/other_file", b' appended')
+                    raise ValueError
+            except ValueError:
+                pass
+            if backend_class is SQLiteBackend and (backend.exists(filename) or backend.read(temp_dir + "/ab/other_file") != b'other'):
+                print("FAIL. Batch not rolled back", backend_class.__name__)
+            backend.write(filename, b'after rollback')
+            if backend.read(filename) != b'after rollback':
+                print("FAIL. Write after a rollback not done", backend_class.__name__)
+            backend.close()